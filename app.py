@@ -1,9 +1,13 @@
 import streamlit as st
 import time
 import base64
+import json
 from pathlib import Path
 from main_controller import PDFProcessor
-from config import MAX_FILE_SIZE, SUPPORTED_FORMATS
+from config import ADMIN_USERS, MAX_FILE_SIZE, SUPPORTED_FORMATS, METRICS_PORT
+from utils import metrics
+from utils.progress import CancellationToken
+from utils.qa_export import results_to_csv, results_to_json
 
 # Initialize session state for login
 if 'logged_in' not in st.session_state:
@@ -347,6 +351,7 @@ def login_form():
         if st.button("Login", type="primary"):
             if email == DEFAULT_EMAIL and password == DEFAULT_PASSWORD:
                 st.session_state.logged_in = True
+                st.session_state.user = email
                 st.success("Login successful! 🎉")
                 time.sleep(1)
                 st.rerun()
@@ -355,7 +360,141 @@ def login_form():
         
         st.markdown("</div>", unsafe_allow_html=True)
 
+@st.cache_resource
+def start_metrics_endpoint():
+    """Start the Prometheus endpoint once per server process"""
+    if METRICS_PORT:
+        return metrics.start_metrics_server(METRICS_PORT)
+    return None
+
+def is_admin() -> bool:
+    """Whether the logged-in user is listed in ADMIN_USERS"""
+    return st.session_state.get("user", "").strip().lower() in ADMIN_USERS
+
+def admin_panel():
+    """Per-stage timings of recent requests and the raw metrics export"""
+    with st.expander("📈 Pipeline Metrics (Admin)"):
+        traces = metrics.registry.recent_traces()
+        if traces:
+            rows = []
+            for trace in traces[:20]:
+                row = {
+                    "kind": trace["kind"],
+                    "request": trace["request_id"],
+                    "status": trace["status"],
+                    "total_s": round(trace["seconds"], 3),
+                }
+                for span in trace["spans"]:
+                    row[f"{span['name']}_s"] = round(row.get(f"{span['name']}_s", 0) + span["seconds"], 3)
+                    for attribute in metrics.COUNTED_ATTRIBUTES:
+                        if attribute in span["attrs"]:
+                            row[f"{span['name']}_{attribute}"] = span["attrs"][attribute]
+                rows.append(row)
+            st.dataframe(rows, use_container_width=True)
+            st.download_button(
+                "📥 Latest trace (JSON)",
+                json.dumps(traces[0], indent=2),
+                file_name=f"trace-{traces[0]['request_id']}.json",
+                mime="application/json"
+            )
+        else:
+            st.write("No requests recorded yet.")
+        
+        from utils.admission import controller_metrics
+        from utils.request_scheduler import scheduler_metrics
+        admission_metrics = controller_metrics()
+        if admission_metrics is not None:
+            st.markdown("**Admission control**")
+            st.json(admission_metrics)
+            from main_controller import ANSWER_FLIGHTS, INGEST_FLIGHTS
+            st.markdown("**Coalesced requests**")
+            st.json({"ingest": INGEST_FLIGHTS.metrics(), "answer": ANSWER_FLIGHTS.metrics()})
+        api_metrics = scheduler_metrics()
+        if api_metrics is not None:
+            st.markdown("**API scheduler**")
+            st.json(api_metrics)
+        
+        from utils import profiling
+        profile_all = st.checkbox(
+            "🔬 Profile requests",
+            value=profiling.is_enabled(),
+            help="cProfile every upload and question of all sessions; stats and flame graphs go to outputs/profiles"
+        )
+        if profile_all != profiling.is_enabled():
+            profiling.set_enabled(profile_all)
+        profiles = profiling.recent_profiles(limit=5)
+        if profiles:
+            selected_profile = st.selectbox("Recent profiles", profiles, format_func=lambda path: path.stem)
+            col_a, col_b = st.columns(2)
+            with col_a:
+                st.download_button(
+                    "📥 Flame graph (SVG)",
+                    selected_profile.read_bytes(),
+                    file_name=selected_profile.name,
+                    mime="image/svg+xml"
+                )
+            with col_b:
+                stats_path = selected_profile.with_suffix(".txt")
+                if stats_path.exists():
+                    st.download_button(
+                        "📥 Stats (text)",
+                        stats_path.read_bytes(),
+                        file_name=stats_path.name,
+                        mime="text/plain"
+                    )
+        
+        prometheus_text = metrics.registry.render_prometheus()
+        st.code(prometheus_text, language="text")
+        st.download_button(
+            "📥 Prometheus metrics",
+            prometheus_text,
+            file_name="metrics.prom",
+            mime="text/plain"
+        )
+
+def show_queue_position(status, token=None):
+    """on_queued callback: show the request's place in the admission queue on its status box"""
+    def report(position):
+        try:
+            status.update(label=f"⏳ Queued, position {position}. Waiting for capacity...", state="running")
+        except BaseException:
+            # Streamlit stops this script run when the session ends or reruns; leave the queue with it
+            if token is not None:
+                token.cancel("Session ended")
+            raise
+    return report
+
+STAGE_LABELS = {
+    "parse": "📄 Reading pages",
+    "route": "🧭 Planning OCR",
+    "ocr": "👁️ OCR pages",
+    "collect": "🧩 Collecting text",
+    "embed": "🔢 Embedding chunks",
+    "store": "💾 Storing vectors",
+    "done": "✅ Done",
+}
+
+def show_progress(bar, token):
+    """on_progress callback: render ingestion progress, and cancel the work once the session is gone"""
+    def report(event):
+        text = STAGE_LABELS.get(event["stage"], event["stage"])
+        if event["total"] > 1:
+            text += f" {event['done']}/{event['total']}"
+        if event["eta_seconds"] is not None and event["stage"] != "done":
+            text += f" · about {event['eta_seconds']:.0f}s left"
+        try:
+            bar.progress(event["fraction"], text=text)
+        except Exception:
+            pass  # A rendering problem shouldn't fail the ingestion
+        except BaseException:
+            # Streamlit stops this script run when the session ends or reruns; stop the ingestion with it
+            token.cancel("Session ended")
+            raise
+    return report
+
 def main():
+    start_metrics_endpoint()
+    
     # Add logout button to sidebar if logged in
     if st.session_state.logged_in:
         with st.sidebar:
@@ -408,6 +547,9 @@ def main():
                 </div>
             </div>
         """.format(MAX_FILE_SIZE//1024//1024), unsafe_allow_html=True)
+        
+        if is_admin():
+            admin_panel()
 
     # File upload section with enhanced styling
     st.markdown("<br>", unsafe_allow_html=True)
@@ -455,12 +597,18 @@ def main():
                 </div>
             """, unsafe_allow_html=True)
 
-        # Initialize processor
-        processor = PDFProcessor()
+        # Initialize processor; requests are admitted fairly per user
+        processor = PDFProcessor(user=st.session_state.get("user"))
 
         with st.status("🔄 Processing document...", expanded=True) as status:
-            st.write("🚀 Initializing document processing...")
-            success, error_msg = processor.process_pdf(uploaded_file)
+            progress_bar = st.progress(0.0, text="🚀 Initializing document processing...")
+            token = CancellationToken()
+            success, error_msg = processor.process_pdf(
+                uploaded_file,
+                on_queued=show_queue_position(status, token),
+                on_progress=show_progress(progress_bar, token),
+                cancel_token=token
+            )
             
             if success:
                 status.update(label="✅ Document processed successfully!", state="complete", expanded=False)
@@ -493,10 +641,18 @@ def main():
                 </div>
             """, unsafe_allow_html=True)
             
+            summary_length = st.radio(
+                "Summary length",
+                options=["long", "short"],
+                format_func=lambda value: {"long": "📖 Detailed", "short": "⚡ Short"}[value],
+                horizontal=True,
+                key="summary_length"
+            )
+            
             if st.button("🎯 Generate Smart Summary", key="generate_summary"):
                 with st.status("🧠 Analyzing document...", expanded=True) as status:
                     st.write("✨ Creating intelligent summary...")
-                    summary = processor.generate_summary()
+                    summary = processor.generate_summary(summary_length, on_queued=show_queue_position(status))
                     status.update(label="🎉 Summary generated!", state="complete", expanded=False)
                     
                     st.markdown("""
@@ -506,16 +662,22 @@ def main():
                     """, unsafe_allow_html=True)
                     st.markdown(summary)
                     
-                    # Enhanced download button
-                    col_a, col_b, col_c = st.columns([1, 2, 1])
-                    with col_b:
-                        st.download_button(
-                            "📥 Download Summary",
-                            summary,
-                            file_name=f"{uploaded_file.name}_summary.pdf",
-                            mime="pdf",
-                            help="Save summary as text file"
-                        )
+                    # Enhanced download buttons, served from the summary cache
+                    col_a, col_b = st.columns(2)
+                    for column, fmt, mime, label in (
+                        (col_a, "md", "text/markdown", "📥 Download Markdown"),
+                        (col_b, "txt", "text/plain", "📥 Download Text"),
+                    ):
+                        artifact = processor.summary_artifact(summary_length, fmt)
+                        with column:
+                            st.download_button(
+                                label,
+                                artifact.read_bytes() if artifact else summary,
+                                file_name=f"{Path(uploaded_file.name).stem}_summary_{summary_length}.{fmt}",
+                                mime=mime,
+                                key=f"download_summary_{fmt}",
+                                help="Save summary as a file"
+                            )
         
         with col2:
             st.markdown("""
@@ -538,7 +700,7 @@ def main():
             if question:
                 with st.status("🤔 Searching for answers...", expanded=True) as status:
                     st.write("🔍 Analyzing document context...")
-                    answer = processor.answer_question(question)
+                    answer = processor.answer_question(question, on_queued=show_queue_position(status))
                     status.update(label="💡 Answer found!", state="complete", expanded=False)
                     
                     # Question bubble
@@ -557,6 +719,96 @@ def main():
                         </div>
                     """, unsafe_allow_html=True)
 
+        # Checklist Q&A: a fixed list of questions answered in one batch
+        st.markdown("<br>", unsafe_allow_html=True)
+        st.markdown("""
+            <div class="feature-card">
+                <div class="feature-icon">📋</div>
+                <h3>Checklist Q&A</h3>
+                <p style='color: #666; line-height: 1.6; margin-bottom: 2rem;'>
+                    Run a whole checklist against this document at once. Enter one question per line.
+                </p>
+            </div>
+        """, unsafe_allow_html=True)
+        
+        checklist = st.text_area(
+            "Checklist questions",
+            placeholder="Who are the parties to the agreement?\nWhat is the termination notice period?",
+            label_visibility="collapsed",
+            height=200
+        )
+        
+        if st.button("✅ Run Checklist", key="run_checklist"):
+            questions = [line.strip() for line in checklist.splitlines() if line.strip()]
+            if not questions:
+                st.markdown('<div class="error-message">📝 Enter at least one question.</div>', unsafe_allow_html=True)
+            else:
+                with st.status(f"🔍 Answering {len(questions)} questions...", expanded=True) as status:
+                    results = processor.answer_questions(questions, on_queued=show_queue_position(status))
+                    status.update(label="💡 Checklist complete!", state="complete", expanded=False)
+                
+                st.dataframe(results, use_container_width=True)
+                col_a, col_b = st.columns(2)
+                with col_a:
+                    st.download_button(
+                        "📥 Download CSV",
+                        results_to_csv(results),
+                        file_name=f"{uploaded_file.name}_checklist.csv",
+                        mime="text/csv"
+                    )
+                with col_b:
+                    st.download_button(
+                        "📥 Download JSON",
+                        results_to_json(results),
+                        file_name=f"{uploaded_file.name}_checklist.json",
+                        mime="application/json"
+                    )
+
+        # Multi-document Q&A across previously processed documents
+        documents = processor.list_documents()
+        if len(documents) > 1:
+            st.markdown("<br>", unsafe_allow_html=True)
+            st.markdown("""
+                <div class="feature-card">
+                    <div class="feature-icon">🗂️</div>
+                    <h3>Multi-document Q&A</h3>
+                    <p style='color: #666; line-height: 1.6; margin-bottom: 2rem;'>
+                        Ask one question across several processed documents and compare the evidence from each.
+                    </p>
+                </div>
+            """, unsafe_allow_html=True)
+            
+            names = {doc["doc_id"]: doc["name"] for doc in documents}
+            selected = st.multiselect(
+                "Documents",
+                options=list(names),
+                default=list(names)[:2],
+                format_func=lambda doc_id: names[doc_id]
+            )
+            multi_question = st.text_input(
+                "🔍 Question for the selected documents",
+                key="multi_document_question"
+            )
+            
+            if multi_question and selected:
+                with st.status(f"🔍 Searching {len(selected)} documents...", expanded=True) as status:
+                    result = processor.query_documents(multi_question, selected, on_queued=show_queue_position(status))
+                    status.update(label="💡 Answer found!", state="complete", expanded=False)
+                
+                st.markdown(f"""
+                    <div class="answer-bubble">
+                        <h4 style='margin-bottom: 1rem; color: #667eea;'>💡 AI Answer:</h4>
+                        {result["answer"]}
+                    </div>
+                """, unsafe_allow_html=True)
+                for doc_id in selected:
+                    with st.expander(f"📄 Evidence from {names[doc_id]}"):
+                        if doc_id in result["errors"]:
+                            st.error(result["errors"][doc_id])
+                        for hit in result["by_document"].get(doc_id, []):
+                            st.markdown(f"**Chunk {hit['position'] + 1}** (distance {hit['distance']:.3f})")
+                            st.write(hit["chunk"])
+
     else:
         # Welcome message when no file is uploaded
         st.markdown("<br><br>", unsafe_allow_html=True)
@@ -0,0 +1,311 @@
+"""
+End-to-end benchmark for ingestion and Q&A
+
+Runs synthetic documents through each pipeline stage against the local
+OpenAI stand-in server and writes machine-readable results that can be
+compared between commits.
+
+    python -m benchmarks.run_benchmark --pages 10 --output results.json
+    python -m benchmarks.run_benchmark compare base.json results.json
+"""
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.synthetic_pdf import DOCUMENT_KINDS, VOCABULARY, generate_pdf
+
+# Result format version; bump when fields change meaning
+RESULTS_VERSION = 1
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values``"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def _stage(seconds: float, units: int, unit: str, **extra) -> Dict:
+    result = {
+        "seconds": round(seconds, 6),
+        "units": units,
+        "unit": unit,
+        "throughput": round(units / seconds, 3) if seconds > 0 else None,
+    }
+    result.update(extra)
+    return result
+
+
+def warm_up(processor) -> Dict:
+    """Load every agent up front so one-off import and model costs stay out of stage timings"""
+    timings = {}
+    for name in ("pdf_parser", "router", "collector", "embedding_agent", "vector_store", "rag_agent", "ocr_agent"):
+        start = time.perf_counter()
+        try:
+            getattr(processor, name)
+            timings[name] = round(time.perf_counter() - start, 6)
+        except Exception as e:
+            timings[name] = {"error": str(e)}
+    return timings
+
+
+def benchmark_stages(processor, content: bytes, kind: str, pages: int, queries: int, rng: random.Random) -> Dict:
+    """Time each ingestion stage for one document in isolation"""
+    result = {"kind": kind, "pages": pages, "bytes": len(content), "stages": {}}
+    stages = result["stages"]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = str(Path(work_dir) / f"{kind}.pdf")
+        Path(pdf_path).write_bytes(content)
+
+        start = time.perf_counter()
+        pages_info, error_msg = processor.pdf_parser.process(pdf_path)
+        stages["extraction"] = _stage(time.perf_counter() - start, pages, "pages")
+        if error_msg:
+            stages["extraction"]["error"] = error_msg
+
+        start = time.perf_counter()
+        ocr_plan = processor.router.plan_ocr(pdf_path)
+        stages["routing"] = _stage(
+            time.perf_counter() - start, pages, "pages",
+            needs_ocr=bool(ocr_plan["ocr_pages"]), ocr_pages=len(ocr_plan["ocr_pages"]), ocr_regions=ocr_plan["regions"]
+        )
+
+        ocr_pages = {}
+        if ocr_plan["ocr_pages"]:
+            try:
+                ocr_agent = processor.ocr_agent
+            except Exception as e:
+                stages["ocr"] = {"skipped": f"OCR unavailable: {e}"}
+            else:
+                start = time.perf_counter()
+                try:
+                    ocr_stats = {}
+                    ocr_pages = ocr_agent.process_plan(pdf_path, ocr_plan, stats=ocr_stats)
+                    seconds = time.perf_counter() - start
+                    stages["ocr"] = _stage(
+                        seconds, len(ocr_plan["ocr_pages"]), "pages",
+                        regions=ocr_stats["regions"],
+                        megapixels=round(ocr_stats["megapixels"], 3),
+                        ocr_megapixels=round(ocr_stats["ocr_megapixels"], 3),
+                        preprocess_seconds=round(ocr_stats["preprocess_seconds"], 6),
+                        seconds_per_megapixel=round(seconds / ocr_stats["megapixels"], 6) if ocr_stats["megapixels"] else None,
+                    )
+                except Exception as e:
+                    stages["ocr"] = {"error": str(e)}
+
+        start = time.perf_counter()
+        combined_text = processor.collector.merge({"pdf_path": pdf_path, "pages": pages_info, "ocr_pages": ocr_pages, "ocr_plan": ocr_plan})
+        chunks = processor.embedding_agent._chunk_text(combined_text) if combined_text.strip() else []
+        stages["chunking"] = _stage(time.perf_counter() - start, len(chunks), "chunks", text_bytes=len(combined_text.encode("utf-8")))
+
+    if chunks:
+        backend = processor.embedding_agent.backend
+        start = time.perf_counter()
+        vectors = backend.embed_documents(chunks)
+        stages["embedding"] = _stage(time.perf_counter() - start, len(chunks), "chunks")
+
+        store = processor.vector_store
+        start = time.perf_counter()
+        store.store(vectors, chunks, [combined_text] * len(chunks), model_id=backend.model_id)
+        stages["storing"] = _stage(time.perf_counter() - start, len(chunks), "chunks")
+
+        query_vectors = backend.embed_queries([" ".join(rng.choices(VOCABULARY, k=6)) for _ in range(queries)])
+        start = time.perf_counter()
+        for query_vector in query_vectors:
+            store.search(query_vector, k=5)
+        stages["search"] = _stage(time.perf_counter() - start, len(query_vectors), "queries")
+        store.clear()
+
+    return result
+
+
+def benchmark_ingestion(processor, content: bytes, result: Dict):
+    """Ingest one document end to end through PDFProcessor.process_pdf"""
+    start = time.perf_counter()
+    success, error_msg = processor.process_pdf(content)
+    result["ingest_seconds"] = round(time.perf_counter() - start, 6)
+    result["ingest_success"] = success
+    if not success:
+        result["ingest_error"] = error_msg
+
+
+def benchmark_queries(processor, count: int, rng: random.Random) -> Dict:
+    """Measure RAGAgent.answer latency through PDFProcessor.answer_question"""
+    latencies = []
+    failures = 0
+    for _ in range(count):
+        question = f"What does the document say about {' and '.join(rng.sample(VOCABULARY, 2))}?"
+        start = time.perf_counter()
+        answer = processor.answer_question(question)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        # Stand-in completions are tagged; anything else is an error message
+        if not answer.startswith("[stub"):
+            failures += 1
+    return {
+        "count": len(latencies),
+        "failures": failures,
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p90_ms": round(percentile(latencies, 90), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(max(latencies), 3) if latencies else 0.0,
+    }
+
+
+def run(args) -> Dict:
+    from utils.stub_openai_server import StubSettings, start_server
+
+    server = start_server(settings=StubSettings(
+        latency_ms=args.stub_latency_ms,
+        tokens_per_second=args.stub_tokens_per_second,
+        embedding_dimension=args.embedding_dim,
+    ))
+    work_dir = tempfile.mkdtemp(prefix="pdf-bench-")
+    # Configuration is read at import time, so set it before importing the app
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{server.server_port}/v1",
+        "EMBEDDING_BACKEND": args.embedding_backend,
+        "LLM_BACKEND": "openai",
+        "VECTOR_STORE_DIR": str(Path(work_dir) / "vector_store"),
+        "OUTPUTS_DIR": str(Path(work_dir) / "outputs"),
+        "OCR_PRESET": args.ocr_preset,
+    })
+    from main_controller import PDFProcessor
+
+    rng = random.Random(args.seed)
+    results = {
+        "version": RESULTS_VERSION,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "pages": args.pages,
+            "kinds": args.kinds,
+            "queries": args.queries,
+            "embedding_backend": args.embedding_backend,
+            "embedding_dim": args.embedding_dim,
+            "stub_latency_ms": args.stub_latency_ms,
+            "stub_tokens_per_second": args.stub_tokens_per_second,
+            "seed": args.seed,
+            "dpi": args.dpi,
+            "ocr_preset": args.ocr_preset,
+        },
+        "documents": [],
+    }
+    try:
+        processor = PDFProcessor()
+        results["warm_up_seconds"] = warm_up(processor)
+        documents = {kind: generate_pdf(kind, args.pages, seed=args.seed, dpi=args.dpi) for kind in args.kinds}
+        for kind, content in documents.items():
+            results["documents"].append(benchmark_stages(processor, content, kind, args.pages, args.queries, rng))
+        # Ingest every document into one store, then answer questions against it
+        processor.clear_vector_store()
+        for result, content in zip(results["documents"], documents.values()):
+            benchmark_ingestion(processor, content, result)
+        results["queries"] = benchmark_queries(processor, args.queries, rng)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> List[str]:
+    """
+    Compare two result files and list regressions beyond ``threshold``
+
+    Stage throughputs regress when they drop, latencies when they rise, both
+    relative to the base run.
+    """
+    regressions = []
+    base_docs = {doc["kind"]: doc for doc in base.get("documents", [])}
+    for doc in new.get("documents", []):
+        base_doc = base_docs.get(doc["kind"])
+        if not base_doc:
+            continue
+        for stage, stats in doc["stages"].items():
+            old = base_doc["stages"].get(stage, {}).get("throughput")
+            current = stats.get("throughput")
+            if old and current is not None and current < old * (1 - threshold):
+                regressions.append(
+                    f"{doc['kind']}/{stage}: throughput {current:.1f} < {old:.1f} {stats['unit']}/s"
+                )
+        old_ingest, new_ingest = base_doc.get("ingest_seconds"), doc.get("ingest_seconds")
+        if old_ingest and new_ingest and new_ingest > old_ingest * (1 + threshold):
+            regressions.append(f"{doc['kind']}/ingest: {new_ingest:.3f}s > {old_ingest:.3f}s")
+    for key in ("p50_ms", "p90_ms", "p99_ms"):
+        old = base.get("queries", {}).get(key)
+        current = new.get("queries", {}).get(key)
+        if old and current is not None and current > old * (1 + threshold):
+            regressions.append(f"queries/{key}: {current:.1f} > {old:.1f}")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    import argparse
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        parser = argparse.ArgumentParser(prog="run_benchmark compare", description="Compare two benchmark results")
+        parser.add_argument("base")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative slowdown (default 10%%)")
+        args = parser.parse_args(argv[1:])
+        base = json.loads(Path(args.base).read_text())
+        new = json.loads(Path(args.new).read_text())
+        regressions = compare(base, new, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if not regressions:
+            print(f"No regressions beyond {args.threshold:.0%} ({base.get('commit')} -> {new.get('commit')})")
+        return 1 if regressions else 0
+
+    parser = argparse.ArgumentParser(description="Benchmark PDF ingestion and Q&A")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--kinds", nargs="+", choices=DOCUMENT_KINDS, default=list(DOCUMENT_KINDS))
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--dpi", type=int, default=150, help="Resolution of scanned pages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ocr-preset", choices=("quality", "balanced", "fast"), default="balanced")
+    parser.add_argument("--embedding-backend", default="openai", help="'openai' uses the stand-in server")
+    parser.add_argument("--embedding-dim", type=int, default=3072)
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+    parser.add_argument("--stub-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload)
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
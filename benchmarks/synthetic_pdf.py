@@ -0,0 +1,105 @@
+"""
+Synthetic PDF generator for benchmarks
+
+Produces deterministic born-digital (text layer), scanned (image only) and
+mixed documents of any page count.
+
+    python -m benchmarks.synthetic_pdf --kind mixed --pages 20 --output sample.pdf
+"""
+import random
+from typing import List
+
+import fitz  # PyMuPDF
+
+DOCUMENT_KINDS = ("born_digital", "scanned", "mixed")
+
+VOCABULARY = (
+    "agreement audit balance compliance contract customer data delivery document "
+    "employee evidence finance incident invoice liability management obligation "
+    "payment performance policy privacy process procurement quality record report "
+    "requirement review risk schedule security service standard supplier system "
+    "termination training vendor warranty workflow"
+).split()
+
+
+def make_paragraphs(rng: random.Random, count: int) -> List[str]:
+    """Generate pseudo-random paragraphs of sentences drawn from VOCABULARY"""
+    paragraphs = []
+    for _ in range(count):
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = rng.choices(VOCABULARY, k=rng.randint(8, 16))
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def _page_text(rng: random.Random, page_num: int) -> str:
+    heading = f"Section {page_num}: {rng.choice(VOCABULARY).title()} {rng.choice(VOCABULARY).title()}"
+    return heading + "\n\n" + "\n\n".join(make_paragraphs(rng, 4))
+
+
+def _add_text_page(doc, text: str):
+    page = doc.new_page()
+    page.insert_textbox(page.rect + (54, 54, -54, -54), text, fontsize=10, fontname="helv")
+    return page
+
+
+def _add_scanned_page(doc, text: str, dpi: int):
+    """Render a text page to a bitmap and insert it as an image-only page"""
+    scratch = fitz.open()
+    _add_text_page(scratch, text)
+    pixmap = scratch[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    scratch.close()
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=pixmap.tobytes("png"))
+    return page
+
+
+def generate_pdf(kind: str = "born_digital", pages: int = 10, seed: int = 0, dpi: int = 150) -> bytes:
+    """
+    Generate a synthetic PDF
+
+    Args:
+        kind: "born_digital", "scanned" or "mixed" (alternating pages)
+        pages: Number of pages
+        seed: Random seed; the same arguments always produce the same content
+        dpi: Resolution of scanned pages
+
+    Returns:
+        PDF file content as bytes
+    """
+    if kind not in DOCUMENT_KINDS:
+        raise ValueError(f"Unknown document kind: {kind}")
+    rng = random.Random(f"{kind}-{pages}-{seed}")
+    doc = fitz.open()
+    for page_num in range(1, pages + 1):
+        text = _page_text(rng, page_num)
+        scanned = kind == "scanned" or (kind == "mixed" and page_num % 2 == 0)
+        if scanned:
+            _add_scanned_page(doc, text, dpi)
+        else:
+            _add_text_page(doc, text)
+    content = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return content
+
+
+def main(argv: List[str] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark PDF")
+    parser.add_argument("--kind", choices=DOCUMENT_KINDS, default="born_digital")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    with open(args.output, "wb") as f:
+        f.write(generate_pdf(args.kind, args.pages, args.seed, args.dpi))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -7,8 +7,8 @@ load_dotenv()
 
 # Base paths
 BASE_DIR = Path(__file__).parent
-VECTOR_STORE_DIR = BASE_DIR / "vector_store"
-OUTPUTS_DIR = BASE_DIR / "outputs"
+VECTOR_STORE_DIR = Path(os.getenv("VECTOR_STORE_DIR", BASE_DIR / "vector_store"))
+OUTPUTS_DIR = Path(os.getenv("OUTPUTS_DIR", BASE_DIR / "outputs"))
 
 # Create directories if they don't exist
 VECTOR_STORE_DIR.mkdir(parents=True, exist_ok=True)
@@ -16,12 +16,107 @@ OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
 
 # API Keys and configurations
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in your .env file")
+
+
+def get_openai_api_key() -> str:
+    """Return the OpenAI API key, raising if it is not configured.
+
+    Validation happens on first use rather than at import time so that
+    importing the package stays cheap for CLI tools and tests.
+    """
+    api_key = os.getenv("OPENAI_API_KEY") or OPENAI_API_KEY
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in your .env file")
+    return api_key
+
+# Optional OpenAI-compatible endpoint, e.g. the local stand-in server
+# (python -m utils.stub_openai_server) at http://127.0.0.1:8008/v1
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# OpenAI rate limits shared by all API calls (see utils/request_scheduler.py)
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "300000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+
+# Admission control for whole requests (see utils/admission.py): at most
+# ADMISSION_MAX_ACTIVE ingestions and generations run at once, and
+# ingestions never take the last ADMISSION_RESERVED_INTERACTIVE slots, so
+# Q&A stays responsive during upload bursts. Waiting requests are served
+# round-robin per user; beyond ADMISSION_MAX_QUEUE waiting per kind new
+# requests are turned away.
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "6"))
+ADMISSION_MAX_INGESTIONS = int(os.getenv("ADMISSION_MAX_INGESTIONS", "2"))
+ADMISSION_MAX_GENERATIONS = int(os.getenv("ADMISSION_MAX_GENERATIONS", "4"))
+ADMISSION_RESERVED_INTERACTIVE = int(os.getenv("ADMISSION_RESERVED_INTERACTIVE", "2"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "600"))  # Seconds a request may wait for a slot
+
+# Ingestion runs as a graph of agent nodes (see langgraph_agents/graph_executor.py):
+# independent nodes run on up to PIPELINE_WORKERS threads, and each node's
+# output is checkpointed under PIPELINE_CHECKPOINT_DIR so a retried upload
+# resumes after its last completed node
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+PIPELINE_CHECKPOINTS = os.getenv("PIPELINE_CHECKPOINTS", "true").lower() in ("1", "true", "yes")
+PIPELINE_CHECKPOINT_DIR = OUTPUTS_DIR / "checkpoints"
+PIPELINE_CHECKPOINT_TTL = float(os.getenv("PIPELINE_CHECKPOINT_TTL", "86400"))  # Seconds before an abandoned job's checkpoints are removed
+
+# Instrumentation: JSON traces per request in OUTPUTS_DIR/traces, and an
+# optional Prometheus /metrics endpoint (0 disables it)
+TRACES_ENABLED = os.getenv("TRACES_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACES_MAX_FILES = int(os.getenv("TRACES_MAX_FILES", "1000"))  # Oldest trace files are deleted beyond this
+# Logins (emails) that see the sidebar's Pipeline Metrics (Admin) panel; its
+# profiling switch applies to every session. Empty hides the panel.
+ADMIN_USERS = [user.strip().lower() for user in os.getenv("ADMIN_USERS", "").split(",") if user.strip()]
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# cProfile every ingestion and question (also switchable per request and from
+# the admin panel); stats and flame graphs go to PROFILES_DIR (see utils/profiling.py)
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() in ("1", "true", "yes")
+PROFILES_DIR = OUTPUTS_DIR / "profiles"
+
+# Summaries are persisted per (document hash, summarizer settings, model) with
+# their download artifacts, and dropped when the document is re-indexed
+SUMMARY_CACHE_ENABLED = os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SUMMARY_CACHE_DIR = OUTPUTS_DIR / "summaries"
+# Portable processed-document bundles (see utils/document_bundle.py)
+BUNDLES_DIR = OUTPUTS_DIR / "bundles"
 
 # Vector store settings
+# Each write publishes an immutable generation directory under
+# VECTOR_GENERATIONS_DIR and repoints CURRENT at it; readers reload when it
+# changes. Writers serialize on VECTOR_STORE_LOCK_PATH. Generation numbers
+# only grow, also across clears (the last one is kept in
+# VECTOR_STORE_LAST_GENERATION_PATH), so a reader never mistakes a new store
+# for the one it loaded.
+VECTOR_GENERATIONS_DIR = VECTOR_STORE_DIR / "generations"
+VECTOR_STORE_CURRENT_PATH = VECTOR_STORE_DIR / "CURRENT"
+VECTOR_STORE_LAST_GENERATION_PATH = VECTOR_STORE_DIR / "LAST_GENERATION"
+VECTOR_STORE_LOCK_PATH = VECTOR_STORE_DIR / ".write.lock"
+VECTOR_STORE_KEEP_GENERATIONS = int(os.getenv("VECTOR_STORE_KEEP_GENERATIONS", "2"))
+VECTOR_STORE_LOCK_TIMEOUT = float(os.getenv("VECTOR_STORE_LOCK_TIMEOUT", "120"))  # Seconds a writer waits
+# Flat layout of stores written before generations; still loaded until the next write
 FAISS_INDEX_PATH = VECTOR_STORE_DIR / "index.faiss"
 VECTOR_METADATA_PATH = VECTOR_STORE_DIR / "metadata.pkl"
+VECTOR_CHUNKS_PATH = VECTOR_STORE_DIR / "chunks"  # chunks.bin + chunks.idx (utils/chunk_store.py)
+# Map the index and chunks read-only so replicas share the page cache
+VECTOR_STORE_MMAP = os.getenv("VECTOR_STORE_MMAP", "false").lower() in ("1", "true", "yes")
+
+# Per-document shard indexes for multi-document queries
+SHARD_STORE_DIR = VECTOR_STORE_DIR / "shards"
+SHARD_CACHE_SIZE = int(os.getenv("SHARD_CACHE_SIZE", "8"))  # Shards kept resident in memory
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", "4"))
+
+# Hierarchical summaries built in the background after ingestion and searched
+# together with the leaf chunks (see langgraph_agents/summary_tree_agent.py)
+SUMMARY_TREE_ENABLED = os.getenv("SUMMARY_TREE_ENABLED", "true").lower() in ("1", "true", "yes")
+SUMMARY_TREE_DIR = VECTOR_STORE_DIR / "summary_tree"
+SUMMARY_TREE_FANOUT = int(os.getenv("SUMMARY_TREE_FANOUT", "8"))  # Chunks per section, sections per parent
+SUMMARY_TREE_NODE_TOKENS = 256  # Response budget of one node summary
+
+# Scatter-gather search over partition worker processes (comma-separated
+# base URLs; see langgraph_agents/distributed_search.py). Empty searches
+# the local store.
+DISTRIBUTED_SEARCH_ENDPOINTS = [url.strip() for url in os.getenv("DISTRIBUTED_SEARCH_ENDPOINTS", "").split(",") if url.strip()]
+DISTRIBUTED_SEARCH_TIMEOUT = float(os.getenv("DISTRIBUTED_SEARCH_TIMEOUT", "2.0"))  # Seconds per partition
 
 # Model configurations
 EMBEDDING_MODEL = "text-embedding-3-large"  # OpenAI's latest embedding model
@@ -29,13 +124,53 @@ EMBEDDING_DIMENSION = 3072  # Dimension for text-embedding-3-large
 LLM_MODEL = "gpt-4-turbo-preview"  # Main LLM model
 VISION_MODEL = "gpt-4-vision-preview"  # Vision model for image analysis
 
-# Chunking parameters
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+# LLM backend: "openai" (API or OPENAI_BASE_URL) or "simulated" (deterministic, in-process)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+SIMULATED_LLM_LATENCY_MS = float(os.getenv("SIMULATED_LLM_LATENCY_MS", "0"))
+SIMULATED_LLM_TOKENS_PER_SECOND = float(os.getenv("SIMULATED_LLM_TOKENS_PER_SECOND", "0"))
+SIMULATED_LLM_CONCURRENCY = int(os.getenv("SIMULATED_LLM_CONCURRENCY", "0"))
+
+# Embedding backend: "openai" (remote API) or "local" (sentence-transformers on CPU)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))  # 0 = torch default
+LOCAL_EMBEDDING_ACCELERATION = os.getenv("LOCAL_EMBEDDING_ACCELERATION", "none")  # none | int8 | onnx
+
+# Chunking parameters, in estimated tokens. Chunks don't overlap: retrieval
+# adds the chunks around each hit instead (RAG_NEIGHBOR_RADIUS), so the text
+# at a chunk boundary isn't embedded and stored twice
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "0"))  # Tokens of trailing sentences repeated at the start of the next chunk
+
+# Near-duplicate chunk detection (utils/minhash.py): chunks whose estimated
+# Jaccard similarity to a stored chunk reaches DEDUP_THRESHOLD reuse its
+# vector instead of being embedded and stored again
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+MINHASH_PERMUTATIONS = 128
+MINHASH_BANDS = 16  # 8 rows per band
+
+# Retrieval: chunks fetched per question, and the token budget they are
+# de-duplicated and packed into (see utils/context_packer.py)
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+RAG_NEIGHBOR_RADIUS = int(os.getenv("RAG_NEIGHBOR_RADIUS", "2"))  # Chunks on each side of a hit added to the context while the budget allows
+RAG_BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "8"))  # Parallel generations per question batch
 
 # UI Configurations
 MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB
 SUPPORTED_FORMATS = [".pdf"]
 
 # OCR Configurations
-OCR_LANGUAGES = ['en']  # List of languages for EasyOCR
+OCR_LANGUAGES = [lang.strip() for lang in os.getenv("OCR_LANGUAGES", "en").split(",") if lang.strip()]  # Languages EasyOCR may use; each page gets the subset its script needs
+OCR_DEFAULT_LANGUAGES = OCR_LANGUAGES[:1]  # For pages and documents with no text to detect a script from
+OCR_MAX_READERS = int(os.getenv("OCR_MAX_READERS", "2"))  # EasyOCR readers (one per language set) kept loaded
+OCR_ESCALATE_CONFIDENCE = float(os.getenv("OCR_ESCALATE_CONFIDENCE", "0.3"))  # Below this mean confidence, pages guessed from defaults retry other scripts
+# Per-page OCR routing (see RouterAgent.plan_ocr)
+OCR_MIN_TEXT_DENSITY = float(os.getenv("OCR_MIN_TEXT_DENSITY", "1.0"))  # Text-layer chars per square inch for a page to count as text
+OCR_MIN_GLYPH_QUALITY = float(os.getenv("OCR_MIN_GLYPH_QUALITY", "0.7"))  # Below this share of real glyphs the text layer is re-read by OCR
+OCR_MIN_IMAGE_AREA = float(os.getenv("OCR_MIN_IMAGE_AREA", "0.05"))  # Smaller images (share of page area) are skipped as logos/icons
+OCR_MIN_IMAGE_SIDE = 24  # Points; thinner images are rules and borders
+OCR_FIGURES_ON_TEXT_PAGES = os.getenv("OCR_FIGURES_ON_TEXT_PAGES", "false").lower() in ("1", "true", "yes")
+OCR_PRESET = os.getenv("OCR_PRESET", "balanced")  # quality (300 dpi) | balanced (200 dpi) | fast (150 dpi, no deskew); see utils/ocr_preprocess.py
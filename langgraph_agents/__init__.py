@@ -1,20 +1,27 @@
 # This file makes the langgraph_agents directory a Python package
-from .pdf_parser_agent import PDFParserAgent
-from .ocr_agent import OCRAgent
-from .collector_agent import CollectorAgent
-from .embedding_agent import EmbeddingAgent
-from .vector_store_agent import VectorStoreAgent
-from .rag_agent import RAGAgent
-from .summarizer_agent import SummarizerAgent
-from .router_agent import RouterAgent
+import importlib
 
-__all__ = [
-    'PDFParserAgent',
-    'OCRAgent',
-    'CollectorAgent',
-    'EmbeddingAgent',
-    'VectorStoreAgent',
-    'RAGAgent',
-    'SummarizerAgent',
-    'RouterAgent'
-]
+# Agents are imported lazily on first attribute access. Each agent module
+# pulls in a heavy dependency (faiss, easyocr/torch, fitz, openai), so
+# importing the package must not load them all up front.
+_EXPORTS = {
+    'PDFParserAgent': '.pdf_parser_agent',
+    'OCRAgent': '.ocr_agent',
+    'CollectorAgent': '.collector_agent',
+    'EmbeddingAgent': '.embedding_agent',
+    'VectorStoreAgent': '.vector_store_agent',
+    'RAGAgent': '.rag_agent',
+    'SummarizerAgent': '.summarizer_agent',
+    'RouterAgent': '.router_agent',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
@@ -9,7 +9,13 @@ class CollectorAgent:
     def merge(self, state: Dict) -> str:
         """
         Merge text from PDF parsing and OCR
-        Returns combined text
+        
+        Args:
+            state: "pages" from the parser, plus "ocr_pages" and "ocr_plan"
+                for per-page OCR or a whole-document "ocr_text"
+        
+        Returns combined text; the character range of each page in it is
+        stored in ``state["page_map"]`` as {"page_num", "start", "end"} dicts
         """
         try:
             texts = []
@@ -19,28 +25,56 @@ class CollectorAgent:
             if not pages:
                 logger.warning("No pages found in state")
             
+            # Per-page OCR text from OCRAgent.process_plan goes after the page's
+            # own text, or replaces it where the plan found the text layer garbled
+            ocr_pages = state.get("ocr_pages") or {}
+            replaced = {
+                page["page_num"] for page in (state.get("ocr_plan") or {}).get("pages", [])
+                if page.get("replace_text") and page["page_num"] in ocr_pages
+            }
+            
+            # Page number of each collected text (None for whole-document OCR text)
+            sources = []
+            
             # Process each page
             for page in pages:
                 if not isinstance(page, dict):
                     logger.warning(f"Invalid page format: {type(page)}")
                     continue
                     
+                page_num = page.get("page_num")
                 text = page.get("text", "").strip()
-                if text and not text.startswith("["):  # Skip error messages
+                if text and not text.startswith("[") and page_num not in replaced:  # Skip error messages
                     texts.append(text)
+                    sources.append(page_num)
+                ocr_page_text = ocr_pages.get(page_num, "").strip()
+                if ocr_page_text:
+                    texts.append(ocr_page_text)
+                    sources.append(page_num)
             
             # Add OCR text if available
             ocr_text = state.get("ocr_text", "").strip()
             if ocr_text:
                 texts.append(ocr_text)
+                sources.append(None)
             
             # Validate and combine texts
             if not texts:
                 logger.warning("No text content collected")
                 return ""
                 
-            # Combine all texts with proper spacing
-            return "\n\n".join(text for text in texts if text.strip())
+            # Combine all texts with proper spacing, recording where each page's text lands
+            page_map = []
+            offset = 0
+            for text, page_num in zip(texts, sources):
+                if page_num is not None:
+                    if page_map and page_map[-1]["page_num"] == page_num:
+                        page_map[-1]["end"] = offset + len(text)
+                    else:
+                        page_map.append({"page_num": page_num, "start": offset, "end": offset + len(text)})
+                offset += len(text) + 2
+            state["page_map"] = page_map
+            return "\n\n".join(texts)
             
         except Exception as e:
             logger.error(f"Error merging text: {str(e)}")
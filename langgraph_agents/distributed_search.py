@@ -0,0 +1,347 @@
+"""
+Scatter-gather vector search across partition worker processes
+
+A store too large for one process is split into partitions, each served by
+its own worker over HTTP. ``DistributedVectorStore`` broadcasts the query
+vector to every partition with a per-partition timeout and merges their
+top-k. Its ``search`` takes the same arguments as ``VectorStoreAgent.search``,
+but each result holds only the chunk and its global position: no ``text``,
+since sending the whole document with every hit would dominate the
+response. This is all ``RAGAgent.answer_from_store`` reads.
+
+    # Split the current store into 4 partitions and serve them locally
+    python -m langgraph_agents.distributed_search partition --parts 4 --output partitions/
+    python -m langgraph_agents.distributed_search launch --partitions partitions/ --base-port 9100
+
+    # Then point the app at them
+    DISTRIBUTED_SEARCH_ENDPOINTS=http://127.0.0.1:9100,http://127.0.0.1:9101,...
+"""
+import base64
+import heapq
+import json
+import logging
+import pickle
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+
+from config import DISTRIBUTED_SEARCH_ENDPOINTS, DISTRIBUTED_SEARCH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+def encode_vector(vector: np.ndarray) -> str:
+    """Encode a float32 vector for transport"""
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_vector(payload: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(payload), dtype=np.float32)
+
+
+def partition_store(index_path: Path, metadata_path: Path, chunks_path: Path, output_dir: Path, parts: int) -> List[Path]:
+    """
+    Split a VectorStoreAgent store into ``parts`` contiguous partitions
+
+    Each partition directory holds ``index.faiss`` and ``metadata.pkl``; the
+    metadata records the partition's ``offset`` so results keep their
+    global chunk position.
+
+    Returns:
+        The partition directories
+    """
+    import faiss
+    from langgraph_agents.vector_store_agent import load_metadata
+
+    index = faiss.read_index(str(index_path))
+    metadata = load_metadata(metadata_path, chunks_path)
+    total = index.ntotal
+    if total == 0:
+        raise ValueError("Store is empty")
+    parts = max(1, min(parts, total))
+    vectors = index.reconstruct_n(0, total)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    bounds = np.linspace(0, total, parts + 1, dtype=int)
+    directories = []
+    for part, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        part_dir = output_dir / f"part-{part:03d}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        part_index = faiss.IndexFlatL2(index.d)
+        part_index.add(vectors[start:end])
+        faiss.write_index(part_index, str(part_dir / "index.faiss"))
+        with open(part_dir / "metadata.pkl", "wb") as f:
+            pickle.dump({
+                "chunks": metadata["chunks"][start:end],
+                "embedding_model": metadata.get("embedding_model"),
+                "offset": int(start),
+            }, f)
+        directories.append(part_dir)
+        logger.info(f"Wrote partition {part_dir} with {end - start} vectors")
+    return directories
+
+
+class PartitionServer:
+    """Serves searches over one partition directory"""
+
+    def __init__(self, partition_dir: Path):
+        import faiss
+
+        self.partition_dir = Path(partition_dir)
+        self.index = faiss.read_index(str(self.partition_dir / "index.faiss"))
+        with open(self.partition_dir / "metadata.pkl", "rb") as f:
+            self.metadata = pickle.load(f)
+        self.offset = int(self.metadata.get("offset", 0))
+
+    def health(self) -> Dict:
+        return {
+            "partition": self.partition_dir.name,
+            "ntotal": int(self.index.ntotal),
+            "dimension": int(self.index.d),
+            "offset": self.offset,
+            "embedding_model": self.metadata.get("embedding_model"),
+        }
+
+    def search(self, query_vector: np.ndarray, k: int) -> Dict:
+        query_vector = query_vector.reshape(1, -1)
+        distances, indices = self.index.search(query_vector, min(k, self.index.ntotal))
+        chunks = self.metadata["chunks"]
+        hits = [
+            {
+                "distance": float(distance),
+                "position": self.offset + int(idx),
+                "chunk": chunks[idx],
+            }
+            for distance, idx in zip(distances[0], indices[0])
+            if 0 <= idx < len(chunks)
+        ]
+        return {"partition": self.partition_dir.name, "hits": hits}
+
+    def make_handler(self):
+        server = self
+
+        class PartitionHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/health":
+                    self._send(200, server.health())
+                else:
+                    self._send(404, {"error": "Not found"})
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/search":
+                    self._send(404, {"error": "Not found"})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    vector = decode_vector(request["vector"])
+                    if vector.shape[0] != server.index.d:
+                        raise ValueError(f"Expected dimension {server.index.d}, got {vector.shape[0]}")
+                    self._send(200, server.search(vector, int(request.get("k", 5))))
+                except Exception as e:
+                    self._send(400, {"error": str(e)})
+
+        return PartitionHandler
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        httpd = ThreadingHTTPServer((host, port), self.make_handler())
+        httpd.daemon_threads = True
+        return httpd
+
+
+class DistributedVectorStore:
+    """
+    Coordinator that scatters a query to partition workers and gathers top-k
+
+    Partitions that fail or exceed ``timeout`` are left out of the merge and
+    reported under ``errors``; the search only fails if every partition does.
+    """
+
+    def __init__(self, endpoints: List[str] = DISTRIBUTED_SEARCH_ENDPOINTS, timeout: float = DISTRIBUTED_SEARCH_TIMEOUT):
+        if not endpoints:
+            raise ValueError("No partition endpoints configured")
+        self.endpoints = [endpoint.rstrip("/") for endpoint in endpoints]
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=len(self.endpoints), thread_name_prefix="scatter")
+        self._embedding_model: Optional[str] = None
+
+    def _request(self, endpoint: str, path: str, body: Optional[Dict] = None) -> Dict:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            endpoint + path,
+            data=data,
+            headers={"Content-Type": "application/json"},
+            method="POST" if data is not None else "GET",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def health(self) -> Dict[str, Dict]:
+        """Health of every partition, keyed by endpoint"""
+        futures = {endpoint: self._executor.submit(self._request, endpoint, "/health") for endpoint in self.endpoints}
+        status = {}
+        for endpoint, future in futures.items():
+            try:
+                status[endpoint] = future.result(timeout=self.timeout)
+            except Exception as e:
+                status[endpoint] = {"error": str(e)}
+        return status
+
+    @property
+    def embedding_model(self) -> Optional[str]:
+        """Embedding model id reported by the partitions"""
+        if self._embedding_model is None:
+            models = {h.get("embedding_model") for h in self.health().values() if "error" not in h}
+            if len(models) > 1:
+                raise ValueError(f"Partitions were built with different embedding models: {sorted(map(str, models))}")
+            self._embedding_model = models.pop() if models else None
+        return self._embedding_model
+
+    def search(self, query_vector: np.ndarray, k: int = 5) -> dict:
+        """
+        Search all partitions for similar vectors
+
+        Args:
+            query_vector: Query embedding vector
+            k: Number of results to return
+
+        Returns:
+            dict with results and metadata:
+                - success: bool indicating if search was successful
+                - distances: list of distances for each result
+                - results: list of dicts containing only:
+                    - chunk: the text chunk
+                    - position: global chunk position in the store
+                  (unlike VectorStoreAgent.search, no "text")
+                - errors: per-endpoint error messages for partitions that failed
+                - error: error message if success is False
+        """
+        try:
+            body = {"vector": encode_vector(np.asarray(query_vector).reshape(-1)), "k": k}
+            futures = {
+                endpoint: self._executor.submit(self._request, endpoint, "/search", body)
+                for endpoint in self.endpoints
+            }
+            deadline = time.monotonic() + self.timeout
+            per_partition, errors = [], {}
+            for endpoint, future in futures.items():
+                try:
+                    response = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                    per_partition.append([
+                        (hit["distance"], hit["position"], hit["chunk"])
+                        for hit in response["hits"]
+                    ])
+                except Exception as e:
+                    logger.warning(f"Partition {endpoint} failed: {e}")
+                    errors[endpoint] = str(e) or type(e).__name__
+
+            if not per_partition:
+                raise ValueError("All partitions failed: " + "; ".join(f"{e}: {m}" for e, m in errors.items()))
+
+            # Partitions return hits sorted by distance
+            merged = list(heapq.merge(*per_partition))[:k]
+            return {
+                "success": True,
+                "distances": [hit[0] for hit in merged],
+                "results": [
+                    {"chunk": chunk, "position": position}
+                    for _, position, chunk in merged
+                ],
+                "errors": errors
+            }
+        except Exception as e:
+            logger.error(f"Error in distributed search: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "distances": [],
+                "results": [],
+                "errors": {}
+            }
+
+
+def launch_local(partitions_dir: Path, base_port: int, host: str = "127.0.0.1") -> List[subprocess.Popen]:
+    """Start one worker process per partition directory (for local testing)"""
+    processes = []
+    for i, part_dir in enumerate(sorted(p for p in Path(partitions_dir).iterdir() if (p / "index.faiss").exists())):
+        processes.append(subprocess.Popen([
+            sys.executable, "-m", "langgraph_agents.distributed_search", "serve",
+            "--partition", str(part_dir), "--host", host, "--port", str(base_port + i),
+        ]))
+    return processes
+
+
+def main(argv: List[str] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distributed vector search")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    part = commands.add_parser("partition", help="Split the vector store into partitions")
+    part.add_argument("--parts", type=int, required=True)
+    part.add_argument("--output", required=True)
+    part.add_argument("--generation", type=int, help="Store generation to split (default: current)")
+
+    serve = commands.add_parser("serve", help="Serve one partition")
+    serve.add_argument("--partition", required=True)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, required=True)
+
+    launch = commands.add_parser("launch", help="Serve every partition in a directory as local processes")
+    launch.add_argument("--partitions", required=True)
+    launch.add_argument("--host", default="127.0.0.1")
+    launch.add_argument("--base-port", type=int, default=9100)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "partition":
+        from langgraph_agents.vector_store_agent import read_generation, store_paths
+
+        generation = args.generation if args.generation is not None else read_generation()
+        for directory in partition_store(*store_paths(generation), Path(args.output), args.parts):
+            print(directory)
+        return 0
+
+    if args.command == "serve":
+        httpd = PartitionServer(Path(args.partition)).serve(args.host, args.port)
+        logger.info(f"Serving partition {args.partition} on http://{args.host}:{httpd.server_port}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+        return 0
+
+    processes = launch_local(Path(args.partitions), args.base_port, args.host)
+    endpoints = ",".join(f"http://{args.host}:{args.base_port + i}" for i in range(len(processes)))
+    print(f"DISTRIBUTED_SEARCH_ENDPOINTS={endpoints}")
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
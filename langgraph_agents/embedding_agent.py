@@ -1,23 +1,37 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 import numpy as np
 import logging
-from openai import OpenAI
-from config import CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL, OPENAI_API_KEY
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+from langgraph_agents.embedding_backend import EmbeddingBackend, get_embedding_backend
+from utils import metrics
+from utils.progress import ProgressTracker
+from utils.request_scheduler import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingAgent:
-    def __init__(self):
-        """Initialize OpenAI client"""
+    def __init__(self, backend: EmbeddingBackend = None):
+        """Initialize the embedding backend (see config.EMBEDDING_BACKEND)"""
         try:
-            self.client = OpenAI(api_key=OPENAI_API_KEY)
-            logger.info(f"Initialized OpenAI client for embeddings: {EMBEDDING_MODEL}")
+            self.backend = backend or get_embedding_backend()
+            logger.info(f"Using embedding backend: {self.backend.model_id}")
         except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {str(e)}")
+            logger.error(f"Failed to initialize embedding backend: {str(e)}")
             raise
+
+    @property
+    def model_id(self) -> str:
+        """Identifier of the embedding space the vectors belong to"""
+        return self.backend.model_id
     
     def _chunk_text(self, text: str) -> List[str]:
-        """Split text into chunks with overlap, optimized for OpenAI's token limits"""
+        """
+        Split text into chunks of whole sentences, optimized for OpenAI's token limits
+        
+        Chunks hold up to CHUNK_SIZE estimated tokens and repeat CHUNK_OVERLAP
+        tokens of the previous chunk's trailing sentences (none by default:
+        retrieval adds neighbouring chunks instead, see RAGAgent).
+        """
         chunks = []
         sentences = text.replace('\n', ' ').split('.')
         current_chunk = []
@@ -31,10 +45,14 @@ class EmbeddingAgent:
             if current_size + sentence_size > CHUNK_SIZE:
                 if current_chunk:  # Save current chunk
                     chunks.append(' '.join(current_chunk))
-                    # Keep last part for overlap
-                    overlap_size = len(current_chunk) // 3  # ~33% overlap
-                    current_chunk = current_chunk[-overlap_size:] if overlap_size > 0 else []
-                    current_size = sum(len(s) // 4 for s in current_chunk)
+                    # Carry trailing sentences over, up to CHUNK_OVERLAP tokens
+                    overlap, overlap_size = [], 0
+                    for previous in reversed(current_chunk if CHUNK_OVERLAP > 0 else []):
+                        if overlap_size + len(previous) // 4 > CHUNK_OVERLAP:
+                            break
+                        overlap.insert(0, previous)
+                        overlap_size += len(previous) // 4
+                    current_chunk, current_size = overlap, overlap_size
             
             current_chunk.append(sentence)
             current_size += sentence_size
@@ -45,9 +63,25 @@ class EmbeddingAgent:
         
         return chunks
     
-    def create(self, text: str) -> Dict:
+    def chunk(self, text: str) -> List[str]:
+        """Non-empty chunks of a text, recorded as a "chunk" span"""
+        with metrics.span("chunk", bytes=len(text.encode("utf-8"))) as span:
+            chunks = [chunk for chunk in self._chunk_text(text) if chunk.strip()]
+            span.set(chunks=len(chunks))
+        return chunks
+    
+    def create(self, text: str, deduplicator=None, progress: Optional[ProgressTracker] = None) -> Dict:
         """
         Create embeddings for text chunks
+        
+        Args:
+            text: Document text
+            deduplicator: Optional store with ``find_duplicates`` and
+                ``vector_at`` (VectorStoreAgent); chunks it reports as
+                near-duplicates reuse an existing vector instead of being embedded
+            progress: Optional tracker, advanced per embedding batch; raises
+                Cancelled between batches once its token is cancelled
+        
         Returns dictionary with vectors and metadata
         """
         try:
@@ -55,44 +89,76 @@ class EmbeddingAgent:
                 raise ValueError("Empty text provided")
             
             # Split text into chunks
-            chunks = self._chunk_text(text)
+            chunks = self.chunk(text)
             if not chunks:
                 raise ValueError("No chunks created from text")
             
-            # Generate embeddings for each chunk
-            embeddings = []
-            successful_chunks = []
-            
-            for chunk in chunks:
-                if not chunk.strip():
-                    continue
-                    
-                try:
-                    # Generate embedding using OpenAI
-                    response = self.client.embeddings.create(
-                        model=EMBEDDING_MODEL,
-                        input=chunk
-                    )
-                    embedding = np.array(response.data[0].embedding)
-                    embeddings.append(embedding)
-                    successful_chunks.append(chunk)
-                except Exception as e:
-                    logger.error(f"Error generating embedding: {str(e)}")
-                    continue
-            
-            if not embeddings:
-                raise ValueError("Failed to generate any valid embeddings")
-            
             # Convert to numpy array and validate
-            vectors = np.array(embeddings)
-            if vectors.shape[0] == 0:
-                raise ValueError("Empty vectors array")
-            if vectors.shape[0] != len(successful_chunks):
+            vectors = np.array(self.embed_chunks(chunks, deduplicator, progress), dtype=np.float32)
+            if vectors.shape[0] != len(chunks):
                 raise ValueError("Mismatch between vectors and chunks count")
             
             # Return embeddings, chunks and text directly as a tuple for vector store
-            return vectors, successful_chunks, [text] * len(successful_chunks)  # Each chunk maps back to the original text
+            return vectors, chunks, [text] * len(chunks)  # Each chunk maps back to the original text
             
         except Exception as e:
             logger.error(f"Error in embedding creation: {str(e)}")
             raise
+    
+    def embed_chunks(self, chunks: List[str], deduplicator=None, progress: Optional[ProgressTracker] = None) -> List[np.ndarray]:
+        """
+        Embed chunks in batches, reusing vectors of near-duplicates
+        
+        Args:
+            chunks: Chunks to embed
+            deduplicator: As for create()
+            progress: As for create(); each call adds its chunks to the "embed" stage
+        
+        Returns:
+            One vector per chunk
+        
+        Raises:
+            The backend's error for a batch that still fails after the
+            request scheduler's retries; no chunk is silently dropped
+        """
+        duplicate_of = [None] * len(chunks)
+        if deduplicator is not None and chunks:
+            with metrics.span("dedupe", chunks=len(chunks)) as span:
+                duplicate_of = deduplicator.find_duplicates(chunks)
+                span.set(duplicates=sum(d is not None for d in duplicate_of))
+        pending = [i for i, duplicate in enumerate(duplicate_of) if duplicate is None]
+        
+        # Generate embeddings in batches
+        vectors_by_chunk = {}
+        batch_size = getattr(self.backend, "batch_size", len(pending)) or len(pending) or 1
+        if progress is not None:
+            progress.start("embed", total=len(pending), chunks=len(chunks))
+        
+        with metrics.span("embed", model=self.backend.model_id) as span:
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                try:
+                    vectors = self.backend.embed_documents([chunks[i] for i in batch])
+                except Exception as e:
+                    logger.error(f"Error generating embeddings for {len(batch)} chunks: {str(e)}")
+                    raise
+                vectors_by_chunk.update(zip(batch, vectors))
+                if progress is not None:
+                    progress.advance(len(batch), stage="embed", chunks_embedded=len(batch))
+            span.set(
+                chunks=len(vectors_by_chunk),
+                tokens=sum(estimate_tokens(chunks[i]) for i in vectors_by_chunk)
+            )
+        
+        # Duplicates take the vector of the chunk they repeat
+        result = []
+        for i in range(len(chunks)):
+            duplicate = duplicate_of[i]
+            if duplicate is None:
+                vector = vectors_by_chunk[i]
+            elif duplicate[0] == "store":
+                vector = deduplicator.vector_at(duplicate[1])
+            else:
+                vector = vectors_by_chunk[duplicate[1]]
+            result.append(vector)
+        return result
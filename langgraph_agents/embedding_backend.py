@@ -0,0 +1,170 @@
+from typing import Dict, List, Optional
+import logging
+import threading
+import numpy as np
+
+from config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MODEL,
+    OPENAI_BASE_URL,
+    LOCAL_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_THREADS,
+    LOCAL_EMBEDDING_ACCELERATION,
+    get_openai_api_key,
+)
+from utils.request_scheduler import get_scheduler, estimate_tokens, BULK, INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+# Model id recorded for stores written before model ids were tracked
+LEGACY_EMBEDDING_MODEL_ID = f"openai:{EMBEDDING_MODEL}"
+
+
+class EmbeddingBackend:
+    """
+    Interface for embedding backends used by EmbeddingAgent and RAGAgent
+
+    ``model_id`` identifies the embedding space. The vector store records it
+    and refuses to mix vectors from different ids in one index.
+    """
+
+    model_id: str = ""
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Embed document chunks, returning a float32 array of shape (n, dim)"""
+        raise NotImplementedError
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Embed user queries, returning a float32 array of shape (n, dim)"""
+        return self.embed_documents(texts)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed a single query, returning a float32 vector of shape (dim,)"""
+        return self.embed_queries([text])[0]
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Remote embeddings through the OpenAI API (or OPENAI_BASE_URL), batched and rate limited"""
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        base_url: Optional[str] = OPENAI_BASE_URL,
+    ):
+        from openai import OpenAI
+
+        self.model = model
+        self.batch_size = batch_size
+        self.model_id = f"openai:{model}"
+        # Retries are handled by the shared request scheduler
+        self.client = OpenAI(api_key=get_openai_api_key(), base_url=base_url, max_retries=0)
+        self.scheduler = get_scheduler()
+        logger.info(f"Initialized OpenAI embedding backend: {model}")
+
+    def _embed(self, texts: List[str], priority: int) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            response = self.scheduler.call(
+                self.client.embeddings.create,
+                model=self.model,
+                input=batch,
+                priority=priority,
+                tokens=sum(estimate_tokens(text) for text in batch)
+            )
+            # The API returns one item per input, tagged with its position
+            for item in sorted(response.data, key=lambda item: item.index):
+                vectors.append(item.embedding)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self._embed(texts, BULK)
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        return self._embed(texts, INTERACTIVE)
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    Local CPU embeddings with sentence-transformers
+
+    Args:
+        model_name: Hugging Face model name
+        batch_size: Chunks per forward pass
+        num_threads: Torch intra-op threads (0 leaves the torch default)
+        acceleration: "none", "int8" (dynamic quantization of Linear layers)
+            or "onnx" (ONNX Runtime backend, needs sentence-transformers>=3.2)
+    """
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        num_threads: int = LOCAL_EMBEDDING_THREADS,
+        acceleration: str = LOCAL_EMBEDDING_ACCELERATION,
+    ):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if acceleration not in ("none", "int8", "onnx"):
+            raise ValueError(f"Unknown embedding acceleration: {acceleration}")
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        if acceleration == "onnx":
+            self.model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        else:
+            self.model = SentenceTransformer(model_name, device="cpu")
+        if acceleration == "int8":
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+        self.batch_size = batch_size
+        # Quantization shifts the embedding space slightly, so keep it apart
+        suffix = "+int8" if acceleration == "int8" else ""
+        self.model_id = f"sentence-transformers:{model_name}{suffix}"
+        logger.info(
+            f"Initialized local embedding backend: {model_name} "
+            f"(acceleration={acceleration}, threads={torch.get_num_threads()})"
+        )
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+
+EMBEDDING_BACKENDS = {
+    "openai": OpenAIEmbeddingBackend,
+    "local": SentenceTransformerBackend,
+}
+
+_backends: Dict[str, EmbeddingBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_embedding_backend(name: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Return the shared embedding backend instance for ``name``
+
+    Backends are cached per process so the local model is loaded once and
+    shared by ingestion and query embedding.
+    """
+    name = name or EMBEDDING_BACKEND
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    backend = _backends.get(name)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                backend = EMBEDDING_BACKENDS[name]()
+                _backends[name] = backend
+    return backend
@@ -0,0 +1,233 @@
+"""
+Dependency-graph execution of pipeline stages with per-node checkpoints
+
+A ``Graph`` is a set of named nodes, each a function of its dependencies'
+outputs. ``run`` starts every node whose dependencies are done on a thread
+pool, so independent branches (embedding the text pages while OCR reads the
+scanned ones) overlap. Each node's output can be checkpointed to disk; a
+later run with the same ``CheckpointStore`` loads those outputs instead of
+running the nodes again, so a retried ingestion resumes after the last
+completed node.
+
+    graph = Graph("ingest")
+    graph.add_node("parse", parse)
+    graph.add_node("route", route)
+    graph.add_node("ocr", ocr, deps=("route",))
+    graph.add_node("collect", collect, deps=("parse", "route", "ocr"))
+    outputs = graph.run(checkpoints=CheckpointStore(directory))
+
+Node functions are called with their dependencies' outputs as keyword
+arguments (``collect(parse=..., route=..., ocr=...)``). Nodes run in a copy
+of the caller's context, so the spans they open join the caller's trace.
+"""
+import contextvars
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from utils import metrics, profiling
+
+logger = logging.getLogger(__name__)
+
+# How often the calling thread wakes up for ``on_wait`` while nodes run
+POLL_SECONDS = 0.1
+
+
+class GraphError(Exception):
+    """A node failed; ``node`` names it and ``error`` is the original exception"""
+
+    def __init__(self, node: str, error: Exception):
+        super().__init__(f"{node}: {error}")
+        self.node = node
+        self.error = error
+
+
+class Node:
+    def __init__(self, name: str, fn: Callable, deps: Iterable[str], checkpoint: bool):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.checkpoint = checkpoint
+
+
+class CheckpointStore:
+    """Pickled node outputs of one job, one file per node"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _path(self, node: str) -> Path:
+        return self.directory / f"{node}.pkl"
+
+    def has(self, node: str) -> bool:
+        return self._path(node).exists()
+
+    def load(self, node: str) -> Any:
+        with open(self._path(node), "rb") as f:
+            return pickle.load(f)
+
+    def save(self, node: str, value: Any):
+        """Write a node's output atomically, so a crash never leaves a partial checkpoint"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(node)
+        fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def clear(self):
+        """Drop the job's checkpoints once its result is stored"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def prune(root: Path, max_age: float) -> int:
+        """Remove checkpoint directories of jobs not retried within ``max_age`` seconds"""
+        root = Path(root)
+        if not root.exists():
+            return 0
+        cutoff = time.time() - max_age
+        removed = 0
+        for directory in root.iterdir():
+            try:
+                if directory.is_dir() and directory.stat().st_mtime < cutoff:
+                    shutil.rmtree(directory, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+class Graph:
+    """A DAG of pipeline nodes run in dependency order, independent nodes in parallel"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.nodes: Dict[str, Node] = {}
+
+    def add_node(self, name: str, fn: Callable, deps: Iterable[str] = (), checkpoint: bool = True):
+        """
+        Add a node
+
+        Args:
+            name: Node name; also the keyword its output is passed under
+            fn: Called with the outputs of ``deps`` as keyword arguments
+            deps: Names of nodes that must finish first (already added)
+            checkpoint: Save the output to the run's CheckpointStore
+        """
+        if name in self.nodes:
+            raise ValueError(f"Duplicate node: {name}")
+        missing = [dep for dep in deps if dep not in self.nodes]
+        if missing:
+            raise ValueError(f"Node {name} depends on unknown nodes: {', '.join(missing)}")
+        self.nodes[name] = Node(name, fn, deps, checkpoint)
+
+    def _to_run(self, checkpoints: Optional[CheckpointStore]) -> Set[str]:
+        """Nodes without a usable checkpoint, plus what they need that wasn't checkpointed"""
+        pending = {
+            name for name, node in self.nodes.items()
+            if not (node.checkpoint and checkpoints is not None and checkpoints.has(name))
+        }
+        # Walk back from the nodes to run: a dependency is loaded from its
+        # checkpoint if it has one, else it runs too
+        stack = list(pending)
+        while stack:
+            for dep in self.nodes[stack.pop()].deps:
+                if dep not in pending and not (self.nodes[dep].checkpoint and checkpoints.has(dep)):
+                    pending.add(dep)
+                    stack.append(dep)
+        return pending
+
+    def _needed(self, pending: Set[str]) -> Set[str]:
+        """Checkpointed outputs the nodes to run depend on"""
+        return {dep for name in pending for dep in self.nodes[name].deps if dep not in pending}
+
+    def run(self, checkpoints: Optional[CheckpointStore] = None, max_workers: int = 4,
+            on_wait: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+        """
+        Run the graph, resuming from ``checkpoints`` where nodes already finished
+
+        After the first failure no further nodes are started; nodes already
+        running finish (and are checkpointed) so a retry doesn't redo them.
+
+        Args:
+            checkpoints: Where node outputs are saved and resumed from
+            max_workers: Nodes run at once
+            on_wait: Called in the calling thread at least every
+                POLL_SECONDS while nodes run, e.g. ProgressTracker.flush to
+                deliver the workers' progress there; an exception it raises
+                stops the run
+
+        Returns:
+            Dict of node name to output, for every node that ran and every
+            checkpoint the run loaded
+
+        Raises:
+            GraphError: a node raised an Exception
+            BaseException: non-Exception errors (e.g. Cancelled) are re-raised as they are
+        """
+        pending = self._to_run(checkpoints)
+        outputs: Dict[str, Any] = {}
+        resumed = sorted(set(self.nodes) - pending)
+        for name in sorted(self._needed(pending)):
+            outputs[name] = checkpoints.load(name)
+        if resumed:
+            logger.info(f"Resuming {self.name} graph; skipping completed nodes: {', '.join(resumed)}")
+        trace = metrics.current_trace()
+        if trace is not None:
+            trace.attrs["resumed_nodes"] = resumed
+
+        done = set(self.nodes) - pending
+        running = {}
+        failure: Optional[BaseException] = None
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix=f"{self.name}-graph") as pool:
+            while True:
+                if failure is None:
+                    for name in self._ready(pending, done, running.values()):
+                        future = pool.submit(contextvars.copy_context().run, self._run_node, name, outputs, checkpoints)
+                        running[future] = name
+                if not running:
+                    break
+                finished, _ = wait(running, timeout=POLL_SECONDS if on_wait else None, return_when=FIRST_COMPLETED)
+                if on_wait is not None:
+                    on_wait()
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        outputs[name] = future.result()
+                        done.add(name)
+                    except BaseException as e:
+                        if failure is None:
+                            failure = e if not isinstance(e, Exception) else GraphError(name, e)
+        if failure is not None:
+            raise failure
+        return outputs
+
+    def _ready(self, pending: Set[str], done: Set[str], running: Iterable[str]) -> List[str]:
+        running = set(running)
+        return [
+            name for name in self.nodes
+            if name in pending and name not in done and name not in running
+            and all(dep in done for dep in self.nodes[name].deps)
+        ]
+
+    def _run_node(self, name: str, outputs: Dict[str, Any], checkpoints: Optional[CheckpointStore]) -> Any:
+        node = self.nodes[name]
+        with profiling.profile_thread():
+            output = node.fn(**{dep: outputs[dep] for dep in node.deps})
+        if node.checkpoint and checkpoints is not None:
+            try:
+                checkpoints.save(name, output)
+            except Exception as e:
+                # The run still succeeds; a retry just redoes this node
+                logger.warning(f"Failed to checkpoint node {name}: {e}")
+        return output
@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional
+import logging
+import threading
+import time
+
+from config import (
+    LLM_BACKEND,
+    LLM_MODEL,
+    OPENAI_BASE_URL,
+    SIMULATED_LLM_LATENCY_MS,
+    SIMULATED_LLM_TOKENS_PER_SECOND,
+    SIMULATED_LLM_CONCURRENCY,
+    get_openai_api_key,
+)
+from utils.request_scheduler import get_scheduler, estimate_tokens, INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend:
+    """Interface for chat-completion backends used by RAGAgent and SummarizerAgent"""
+
+    model_id: str = ""
+
+    def complete(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.3,
+        max_tokens: int = 1024,
+        priority: int = INTERACTIVE,
+    ) -> Optional[str]:
+        """
+        Generate a completion for ``messages``
+
+        Returns:
+            The generated text, or None if the model returned no choices
+        """
+        raise NotImplementedError
+
+
+class OpenAIChatBackend(LLMBackend):
+    """Chat completions through the OpenAI API (or a compatible server via OPENAI_BASE_URL)"""
+
+    def __init__(self, model: str = LLM_MODEL, base_url: Optional[str] = OPENAI_BASE_URL):
+        from openai import OpenAI
+
+        self.model = model
+        self.model_id = f"openai:{model}"
+        # Retries are handled by the shared request scheduler
+        self.client = OpenAI(api_key=get_openai_api_key(), base_url=base_url, max_retries=0)
+        self.scheduler = get_scheduler()
+        logger.info(f"Initialized OpenAI chat backend: {model}")
+
+    def complete(self, messages, temperature=0.3, max_tokens=1024, priority=INTERACTIVE):
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        response = self.scheduler.call(
+            self.client.chat.completions.create,
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            priority=priority,
+            tokens=prompt_tokens + max_tokens
+        )
+        if not response or not response.choices:
+            return None
+        return response.choices[0].message.content
+
+
+class SimulatedLLMBackend(LLMBackend):
+    """
+    Deterministic in-process stand-in for offline benchmarks
+
+    Args:
+        latency_ms: Fixed time to first token
+        tokens_per_second: Generation speed (0 = instant)
+        concurrency: Maximum completions in progress at once, modelling
+            provider-side throughput limits (0 = unlimited)
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = SIMULATED_LLM_LATENCY_MS,
+        tokens_per_second: float = SIMULATED_LLM_TOKENS_PER_SECOND,
+        concurrency: int = SIMULATED_LLM_CONCURRENCY,
+    ):
+        self.latency = latency_ms / 1000.0
+        self.tokens_per_second = tokens_per_second
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self.model_id = "simulated"
+
+    def complete(self, messages, temperature=0.3, max_tokens=1024, priority=INTERACTIVE):
+        from utils.stub_openai_server import fake_completion
+
+        if self.slots:
+            self.slots.acquire()
+        try:
+            text = fake_completion(messages, max_tokens)
+            delay = self.latency
+            if self.tokens_per_second > 0:
+                delay += len(text.split()) / self.tokens_per_second
+            if delay:
+                time.sleep(delay)
+            return text
+        finally:
+            if self.slots:
+                self.slots.release()
+
+
+LLM_BACKENDS = {
+    "openai": OpenAIChatBackend,
+    "simulated": SimulatedLLMBackend,
+}
+
+_backends: Dict[str, LLMBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_llm_backend(name: Optional[str] = None) -> LLMBackend:
+    """Return the shared LLM backend instance for ``name`` (default: config.LLM_BACKEND)"""
+    name = name or LLM_BACKEND
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {name}")
+    backend = _backends.get(name)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                backend = LLM_BACKENDS[name]()
+                _backends[name] = backend
+    return backend
@@ -2,20 +2,108 @@ import os
 # Set OpenMP environment variable before importing other libraries
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 
-from typing import List, Dict
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
 import numpy as np
+import threading
 import time
 import logging
 import easyocr
-from config import OCR_LANGUAGES
+import fitz  # PyMuPDF
+from config import OCR_DEFAULT_LANGUAGES, OCR_ESCALATE_CONFIDENCE, OCR_LANGUAGES, OCR_MAX_READERS, OCR_PRESET
+from utils import metrics
+from utils.ocr_preprocess import PRESETS, preprocess
+from utils.progress import ProgressTracker
+from utils.script_detect import LANGUAGE_SCRIPTS
 
 logger = logging.getLogger(__name__)
 
+def _cleanup_temp_files():
+    """Attempt to clean up temporary files"""
+    temp_paths = [
+        os.path.expanduser("~/.EasyOCR/model/temp.zip"),
+        os.path.expanduser("~/.EasyOCR/model/temp")
+    ]
+    for path in temp_paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                logger.info(f"Cleaned up temporary file: {path}")
+        except Exception as e:
+            logger.warning(f"Failed to clean up {path}: {str(e)}")
+
+
+class ReaderPool:
+    """
+    EasyOCR readers keyed by language set, loaded on first use
+    
+    At most ``max_readers`` stay loaded; the least recently used one is
+    dropped when another language set is needed, so a multilingual corpus
+    only pays for the models its pages actually use.
+    """
+    
+    def __init__(self, max_readers: int = OCR_MAX_READERS):
+        self.max_readers = max(1, max_readers)
+        self._readers: "OrderedDict[Tuple[str, ...], easyocr.Reader]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[Tuple[str, ...], threading.Lock] = {}
+    
+    def loaded(self) -> List[Tuple[str, ...]]:
+        """Language sets currently loaded, least recently used first"""
+        with self._lock:
+            return list(self._readers)
+    
+    def get(self, languages: List[str]) -> "easyocr.Reader":
+        key = tuple(sorted(set(languages)))
+        with self._lock:
+            reader = self._readers.get(key)
+            if reader is not None:
+                self._readers.move_to_end(key)
+                return reader
+            loading = self._loading.setdefault(key, threading.Lock())
+        
+        # One load per language set; other sets load (or are served) meanwhile
+        with loading:
+            with self._lock:
+                reader = self._readers.get(key)
+            if reader is None:
+                with metrics.span("ocr_reader_load", languages=",".join(key)):
+                    reader = self._load(list(key))
+            with self._lock:
+                self._readers[key] = reader
+                self._readers.move_to_end(key)
+                while len(self._readers) > self.max_readers:
+                    evicted, _ = self._readers.popitem(last=False)
+                    logger.info(f"Evicted EasyOCR reader for {','.join(evicted)}")
+                self._loading.pop(key, None)
+            return reader
+    
+    def _load(self, languages: List[str]) -> "easyocr.Reader":
+        max_retries = 3
+        retry_delay = 2  # seconds
+        
+        for attempt in range(max_retries):
+            try:
+                # Initialize EasyOCR reader
+                reader = easyocr.Reader(languages)
+                logger.info(f"Loaded EasyOCR reader for {','.join(languages)}")
+                return reader
+            except Exception as e:
+                if "process cannot access the file" in str(e) and attempt < max_retries - 1:
+                    logger.warning(f"Attempt {attempt + 1}: EasyOCR initialization failed. Retrying in {retry_delay} seconds...")
+                    # Try to clean up temp files
+                    _cleanup_temp_files()
+                    time.sleep(retry_delay)
+                else:
+                    logger.error(f"Failed to initialize EasyOCR after {max_retries} attempts: {str(e)}")
+                    raise
+
+
 class OCRAgent:
     """Agent for performing OCR on images using EasyOCR"""
     
     _instance = None
-    _reader = None
+    _pool = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -23,40 +111,15 @@ class OCRAgent:
         return cls._instance
     
     def __init__(self):
-        if OCRAgent._reader is None:
-            max_retries = 3
-            retry_delay = 2  # seconds
-            
-            for attempt in range(max_retries):
-                try:
-                    # Initialize EasyOCR reader
-                    OCRAgent._reader = easyocr.Reader(OCR_LANGUAGES)
-                    break
-                except Exception as e:
-                    if "process cannot access the file" in str(e) and attempt < max_retries - 1:
-                        logger.warning(f"Attempt {attempt + 1}: EasyOCR initialization failed. Retrying in {retry_delay} seconds...")
-                        # Try to clean up temp files
-                        self._cleanup_temp_files()
-                        time.sleep(retry_delay)
-                    else:
-                        logger.error(f"Failed to initialize EasyOCR after {max_retries} attempts: {str(e)}")
-                        raise
-        
-        self.reader = OCRAgent._reader
+        # Readers are shared by every agent instance and loaded per language set on demand
+        if OCRAgent._pool is None:
+            OCRAgent._pool = ReaderPool()
+        self.pool = OCRAgent._pool
     
-    def _cleanup_temp_files(self):
-        """Attempt to clean up temporary files"""
-        temp_paths = [
-            os.path.expanduser("~/.EasyOCR/model/temp.zip"),
-            os.path.expanduser("~/.EasyOCR/model/temp")
-        ]
-        for path in temp_paths:
-            try:
-                if os.path.exists(path):
-                    os.remove(path)
-                    logger.info(f"Cleaned up temporary file: {path}")
-            except Exception as e:
-                logger.warning(f"Failed to clean up {path}: {str(e)}")
+    @property
+    def reader(self):
+        """Reader for OCR_DEFAULT_LANGUAGES"""
+        return self.pool.get(OCR_DEFAULT_LANGUAGES)
     
     def process(self, pages: List[Dict]) -> str:
         """
@@ -71,7 +134,7 @@ class OCRAgent:
                 continue
                 
             # Process images on the page
-            for img_info in page["images"]:
+            for img_info in page.get("images", []):
                 try:
                     # Extract image data
                     image = img_info["image"]
@@ -106,3 +169,119 @@ class OCRAgent:
                     continue
         
         return "\n".join(ocr_texts)
+
+    def process_plan(self, pdf_path: str, plan: Dict, preset: str = OCR_PRESET, stats: Optional[Dict] = None,
+                     progress: Optional[ProgressTracker] = None) -> Dict[int, str]:
+        """
+        OCR only the regions a RouterAgent.plan_ocr plan selected
+        
+        Each region is converted to grayscale, downscaled to the preset's
+        target DPI, deskewed and cropped to its content before OCR (see
+        utils/ocr_preprocess.py). Regions that are not a single embedded
+        image (whole pages with a garbled text layer) are rendered directly
+        at the target DPI.
+        
+        Args:
+            pdf_path: Path to the PDF the plan was made for
+            plan: Output of RouterAgent.plan_ocr
+            preset: "quality", "balanced" or "fast"
+            stats: Optional dict filled with "regions", "megapixels" (as
+                embedded), "ocr_megapixels" (after preprocessing),
+                "preprocess_seconds", "languages" (language sets used),
+                "escalations" and "readers_loaded"
+            progress: Optional tracker, advanced per page; raises Cancelled
+                between pages once its token is cancelled
+        
+        Returns:
+            Dict mapping page number to its OCR text
+        """
+        if stats is None:
+            stats = {}
+        stats.update(regions=0, megapixels=0.0, ocr_megapixels=0.0, preprocess_seconds=0.0, languages=[], escalations=0)
+        ocr_pages = {}
+        if progress is not None:
+            progress.start("ocr", total=len(plan["ocr_pages"]))
+        doc = fitz.open(pdf_path)
+        try:
+            for page_plan in plan["pages"]:
+                if page_plan["action"] != "ocr":
+                    continue
+                page_num = page_plan["page_num"]
+                page = doc[page_num - 1]
+                texts = []
+                for region in page_plan["regions"]:
+                    try:
+                        start = time.perf_counter()
+                        image, dpi = self._region_image(doc, page, region, PRESETS[preset]["target_dpi"])
+                        image, info = preprocess(image, dpi, preset)
+                        stats["preprocess_seconds"] += time.perf_counter() - start
+                        stats["regions"] += 1
+                        stats["megapixels"] += info["megapixels_in"]
+                        stats["ocr_megapixels"] += info["megapixels_out"]
+                        texts.extend(self._read(image, page_plan, stats))
+                    except Exception as e:
+                        logger.error(f"OCR error on page {page_num} region {region['bbox']}: {str(e)}")
+                        continue
+                if texts:
+                    ocr_pages[page_num] = "\n".join(texts)
+                else:
+                    logger.warning(f"No text found by OCR on page {page_num}")
+                if progress is not None:
+                    progress.advance(stage="ocr", ocr_pages_done=1)
+        finally:
+            doc.close()
+        stats["readers_loaded"] = [",".join(languages) for languages in self.pool.loaded()]
+        return ocr_pages
+    
+    def _read(self, image: np.ndarray, page_plan: Dict, stats: Dict) -> List[str]:
+        """Text lines of a preprocessed region, escalating to other scripts on low confidence"""
+        languages = page_plan.get("languages") or OCR_DEFAULT_LANGUAGES
+        texts, confidence = self._readtext(image, languages, stats)
+        if page_plan.get("language_source", "default") != "default" or confidence >= OCR_ESCALATE_CONFIDENCE:
+            return texts
+        for candidate in self._escalation_languages(languages):
+            stats["escalations"] += 1
+            candidate_texts, candidate_confidence = self._readtext(image, candidate, stats)
+            logger.info(f"OCR page {page_plan['page_num']}: {','.join(languages)} confidence {confidence:.2f}, "
+                        f"{','.join(candidate)} {candidate_confidence:.2f}")
+            if candidate_confidence > confidence:
+                texts, confidence = candidate_texts, candidate_confidence
+            if confidence >= OCR_ESCALATE_CONFIDENCE:
+                break
+        return texts
+    
+    def _readtext(self, image: np.ndarray, languages: List[str], stats: Dict) -> Tuple[List[str], float]:
+        """Text lines and their mean confidence (0 when nothing was found)"""
+        key = ",".join(sorted(languages))
+        if key not in stats["languages"]:
+            stats["languages"].append(key)
+        results = self.pool.get(languages).readtext(image)
+        confidence = float(np.mean([result[2] for result in results])) if results else 0.0
+        return [result[1] for result in results], confidence
+    
+    @staticmethod
+    def _escalation_languages(tried: List[str]) -> List[List[str]]:
+        """One language set per configured script not covered by ``tried``"""
+        tried_scripts = {LANGUAGE_SCRIPTS.get(lang) for lang in tried}
+        sets, scripts = [], set()
+        for lang in OCR_LANGUAGES:
+            script = LANGUAGE_SCRIPTS.get(lang)
+            if script in tried_scripts or script in scripts:
+                continue
+            scripts.add(script)
+            sets.append(sorted({lang, "en"} if "en" in OCR_LANGUAGES else {lang}))
+        return sets
+    
+    def _region_image(self, doc, page, region: Dict, render_dpi: int) -> Tuple[np.ndarray, float]:
+        """Pixels of a plan region as an (h, w, c) uint8 array, and their DPI on the page"""
+        if region.get("xref"):
+            pixmap = fitz.Pixmap(doc, region["xref"])
+            if pixmap.alpha or pixmap.n > 3:
+                # Drop alpha and convert CMYK and other colour spaces
+                pixmap = fitz.Pixmap(fitz.csRGB, pixmap) if pixmap.n - pixmap.alpha > 1 else fitz.Pixmap(fitz.csGRAY, pixmap)
+            x0, y0, x1, y1 = region["bbox"]
+            dpi = pixmap.width / max((x1 - x0) / 72.0, 1e-6)
+        else:
+            pixmap = page.get_pixmap(clip=fitz.Rect(region["bbox"]), dpi=render_dpi, colorspace=fitz.csGRAY)
+            dpi = render_dpi
+        return np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n), dpi
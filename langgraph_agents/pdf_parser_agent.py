@@ -60,9 +60,10 @@ class PDFParserAgent:
 
             doc.close()
             
-            # Check if we have any actual text content
+            # Pages without a text layer (scans) are left to OCR; the collector
+            # reports documents that yield no text at all
             if not any(page["text"] for page in pages_info if not page["text"].startswith("[")):
-                return [], "No readable text content found in the PDF"
+                logger.info("No text layer found in the PDF")
                 
             return pages_info, None
             
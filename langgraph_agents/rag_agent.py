@@ -1,72 +1,232 @@
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable, List, Optional, Tuple
+import contextvars
 import numpy as np
 import logging
-from config import OPENAI_API_KEY, LLM_MODEL, EMBEDDING_MODEL
-
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+from config import RAG_TOP_K, RAG_CONTEXT_TOKEN_BUDGET, RAG_BATCH_CONCURRENCY, RAG_NEIGHBOR_RADIUS
+from langgraph_agents.embedding_backend import (
+    EmbeddingBackend,
+    get_embedding_backend,
+    LEGACY_EMBEDDING_MODEL_ID,
+)
+from langgraph_agents.llm_backend import LLMBackend, get_llm_backend
+from utils import metrics
+from utils.chunk_store import NEXT, PREV
+from utils.context_packer import expand_neighbors, pack_context
+from utils.request_scheduler import INTERACTIVE, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 class RAGAgent:
     """Agent for retrieval-augmented generation using Gemini"""
     
-    def __init__(self):
-        """Initialize OpenAI client"""
+    def __init__(self, embedding_backend: EmbeddingBackend = None, llm_backend: LLMBackend = None):
+        """Initialize the query embedding and LLM backends"""
         try:
-            self.client = OpenAI(api_key=OPENAI_API_KEY)
-            logger.info(f"Initialized OpenAI client with model: {EMBEDDING_MODEL}")
+            self.embedding_backend = embedding_backend or get_embedding_backend()
+            self.llm_backend = llm_backend or get_llm_backend()
+            logger.info(
+                f"Initialized RAG agent with embeddings: {self.embedding_backend.model_id}, "
+                f"LLM: {self.llm_backend.model_id}"
+            )
         except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {str(e)}")
+            logger.error(f"Failed to initialize RAG backends: {str(e)}")
             raise
 
-    def _get_relevant_chunks(self, query: str, index, metadata, k=5):  # Increased default chunks
-        """Get most relevant chunks for a query"""
+    def _validate_store(self, index, metadata):
+        """Check that the store can be searched with the current embedding backend"""
+        if not index or index.ntotal == 0:
+            raise ValueError("Empty vector index")
+        if not metadata or "chunks" not in metadata or not metadata["chunks"]:
+            raise ValueError("No chunks found in metadata")
+            
+        # Queries must be embedded in the same space as the stored chunks
+        store_model_id = metadata.get("embedding_model", LEGACY_EMBEDDING_MODEL_ID)
+        if store_model_id != self.embedding_backend.model_id:
+            raise ValueError(
+                f"Vector store was built with {store_model_id}, "
+                f"but the current embedding backend is {self.embedding_backend.model_id}"
+            )
+
+    def _search_scored(self, query_embeddings: np.ndarray, index, metadata, k: int) -> List[List[Tuple[float, int, str]]]:
+        """Search the index with a (n, dim) matrix of queries in one call, keeping distances"""
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)  # FAISS expects float32
+        D, I = index.search(
+            query_embeddings,
+            min(k, len(metadata["chunks"]))  # Don't request more chunks than we have
+        )
+        
+        # Get corresponding text chunks with their position in the store
+        results = []
+        for row_d, row_i in zip(D, I):
+            chunks = []
+            for distance, idx in zip(row_d, row_i):
+                if 0 <= idx < len(metadata["chunks"]):  # Bounds check
+                    chunks.append((float(distance), int(idx), metadata["chunks"][idx]))
+            results.append(chunks)
+        return results
+
+    def _search(self, query_embeddings: np.ndarray, index, metadata, k: int) -> List[List[Tuple[int, str]]]:
+        """Search the index with a (n, dim) matrix of queries in one call"""
+        return [
+            [(position, chunk) for _, position, chunk in hits]
+            for hits in self._search_scored(query_embeddings, index, metadata, k)
+        ]
+
+    def _retrieve(self, query_embeddings: np.ndarray, index, metadata, k: int, summary_tree=None) -> List[Tuple[List, List]]:
+        """
+        Rank leaf chunks and summary-tree nodes together
+        
+        Both are embedded in the same space, so the k nearest of either kind
+        are kept: broad questions land on a few section or document
+        summaries, specific ones on chunks.
+        
+        Returns:
+            Per query, (hits, summaries): (position, chunk) pairs and summary
+            node texts, each best first
+        """
+        leaf_hits = self._search_scored(query_embeddings, index, metadata, k)
+        if summary_tree is None:
+            return [([(position, chunk) for _, position, chunk in hits], []) for hits in leaf_hits]
+        node_hits = summary_tree.search(query_embeddings, k, model_id=self.embedding_backend.model_id)
+        results = []
+        for hits, nodes in zip(leaf_hits, node_hits):
+            ranked = sorted(
+                [(distance, 0, (position, chunk)) for distance, position, chunk in hits]
+                + [(distance, 1, node["text"]) for distance, node in nodes],
+                key=lambda item: (item[0], item[1])
+            )[:k]
+            results.append((
+                [item for _, kind, item in ranked if kind == 0],
+                [item for _, kind, item in ranked if kind == 1],
+            ))
+        return results
+
+    def _get_relevant_context(self, query: str, index, metadata, k=RAG_TOP_K, summary_tree=None):
+        """Get the most relevant (position, chunk) pairs and summary node texts for a query, best first"""
         try:
             # Validate inputs
             if not query.strip():
                 raise ValueError("Empty query")
-            if not index or index.ntotal == 0:
-                raise ValueError("Empty vector index")
-            if not metadata or "chunks" not in metadata or not metadata["chunks"]:
-                raise ValueError("No chunks found in metadata")
-                
-            # Generate query embedding using OpenAI
-            response = self.client.embeddings.create(
-                model=EMBEDDING_MODEL,
-                input=query
-            )
+            self._validate_store(index, metadata)
             
-            query_embedding = np.array(response.data[0].embedding)
+            query_embedding = self.embedding_backend.embed_query(query)
             
             if query_embedding is None:
                 raise ValueError("Failed to generate query embedding")
             
-            # Search index
-            query_embedding = np.array([query_embedding])  # Reshape for FAISS
-            D, I = index.search(
-                query_embedding,
-                min(k, len(metadata["chunks"]))  # Don't request more chunks than we have
-            )
-            
-            # Get corresponding text chunks
-            chunks = []
-            for idx in I[0]:
-                if 0 <= idx < len(metadata["chunks"]):  # Bounds check
-                    chunks.append(metadata["chunks"][idx])
+            # Search index (and the summary tree)
+            chunks, summaries = self._retrieve(np.array([query_embedding]), index, metadata, k, summary_tree)[0]
             
-            if not chunks:
+            if not chunks and not summaries:
                 raise ValueError("No relevant chunks found")
                 
-            return chunks
+            return chunks, summaries
             
         except Exception as e:
             logger.error(f"Error retrieving chunks: {str(e)}")
             raise
+
+    @staticmethod
+    def _store_neighbors(metadata) -> Optional[Callable]:
+        """Neighbour lookup over the store's chunk links, or None for stores without links"""
+        links = metadata.get("links")
+        if links is None:
+            return None
+        chunks = metadata["chunks"]
+
+        def neighbors(position):
+            if not 0 <= position < len(links):
+                return None, None
+            return tuple(
+                (int(links[position][column]), chunks[int(links[position][column])])
+                if links[position][column] >= 0 else None
+                for column in (PREV, NEXT)
+            )
+        return neighbors
+
+    def _get_relevant_chunks(self, query: str, index, metadata, k=RAG_TOP_K):
+        """Get most relevant chunks for a query as (position, chunk) pairs, best first"""
+        return self._get_relevant_context(query, index, metadata, k)[0]
     
-    def answer(self, question: str, index, metadata):
+    def _generate(self, question: str, hits: List[Tuple[int, str]], summaries: List[str] = None,
+                  neighbors: Optional[Callable] = None) -> str:
+        """
+        Pack retrieved chunks (and summary nodes) into a prompt and generate the answer
+        
+        Args:
+            neighbors: Optional lookup of a position's (previous, next)
+                chunks (see expand_neighbors); the hits are widened with the
+                text around them while the context budget allows
+        """
+        # Summaries go first and take at most half the budget; then widen the
+        # hits with their neighbours, merge overlapping chunks and fit them to the rest
+        with metrics.span("pack") as span:
+            overview, overview_tokens = [], 0
+            for summary in summaries or []:
+                cost = estimate_tokens(summary)
+                if overview_tokens + cost > RAG_CONTEXT_TOKEN_BUDGET // 2:
+                    break
+                overview.append(summary)
+                overview_tokens += cost
+            budget = RAG_CONTEXT_TOKEN_BUDGET - overview_tokens
+            retrieved = len(hits)
+            if hits and neighbors is not None:
+                hits = expand_neighbors(hits, budget, neighbors, RAG_NEIGHBOR_RADIUS)
+            context, stats = pack_context(hits, budget) if hits else ("", {})
+            if overview:
+                context = "Document overview:\n" + "\n\n".join(overview) + ("\n\nExcerpts:\n" + context if context else "")
+            span.set(**stats, summary_nodes=len(overview), neighbor_chunks=len(hits) - retrieved)
+        
+        if not context:
+            return "No relevant information found in the document to answer this question."
+        
+        # Construct prompt
+        prompt = f"""Based on the following context from the document, provide a detailed and well-structured answer.
+        For overview/process questions, organize the response with clear sections and bullet points.
+        
+        Context from document:
+        {context}
+        
+        Question: {question}
+        
+        Instructions:
+        1. Use only the provided context to answer
+        2. For workflow/process questions, break down steps clearly
+        3. Use bullet points and sections where appropriate
+        4. If information is not in the context, say so
+        
+        Please provide a detailed response:"""
+        
+        # Generate answer with the configured LLM backend
+        try:
+            with metrics.span("generate", model=self.llm_backend.model_id) as span:
+                answer = self.llm_backend.complete(
+                    [
+                        {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    max_tokens=1024,
+                    priority=INTERACTIVE
+                )
+                span.set(tokens=estimate_tokens(prompt) + estimate_tokens(answer or ""))
+            
+            if answer is None:
+                return "Failed to generate an answer. The model returned an empty response."
+                
+            return answer
+            
+        except Exception as model_error:
+            return f"Model error: {str(model_error)}"
+
+    def answer(self, question: str, index, metadata, summary_tree=None):
         """
         Answer a question using RAG
+        
+        Args:
+            summary_tree: Optional SummaryTreeAgent searched together with the chunks
+        
         Returns generated answer
         """
         if not question.strip():
@@ -75,49 +235,111 @@ class RAGAgent:
         try:
             # Get relevant chunks
             try:
-                context = self._get_relevant_chunks(question, index, metadata)
+                with metrics.span("retrieve") as span:
+                    hits, summaries = self._get_relevant_context(question, index, metadata, summary_tree=summary_tree)
+                    span.set(chunks=len(hits), summary_nodes=len(summaries))
             except Exception as e:
                 return f"Failed to retrieve relevant context: {str(e)}"
             
-            if not context:
-                return "No relevant information found in the document to answer this question."
-            
-            # Construct prompt
-            prompt = f"""Based on the following context from the document, provide a detailed and well-structured answer.
-            For overview/process questions, organize the response with clear sections and bullet points.
-            
-            Context from document:
-            {' '.join(context)}
-            
-            Question: {question}
-            
-            Instructions:
-            1. Use only the provided context to answer
-            2. For workflow/process questions, break down steps clearly
-            3. Use bullet points and sections where appropriate
-            4. If information is not in the context, say so
-            
-            Please provide a detailed response:"""
-            
-            # Generate answer using OpenAI
-            try:
-                response = self.client.chat.completions.create(
-                    model=LLM_MODEL,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=1024
-                )
-                
-                if not response or not response.choices:
-                    return "Failed to generate an answer. The model returned an empty response."
-                    
-                return response.choices[0].message.content
-                
-            except Exception as model_error:
-                return f"Model error: {str(model_error)}"
+            return self._generate(question, hits, summaries, self._store_neighbors(metadata))
             
         except Exception as e:
             return f"Error generating answer: {str(e)}"
+
+    def answer_from_store(self, question: str, store, k: int = RAG_TOP_K) -> str:
+        """
+        Answer a question against any store exposing ``search(query_vector, k)``
+        and ``embedding_model``, e.g. a DistributedVectorStore
+        """
+        if not question.strip():
+            return "No question provided."
+
+        try:
+            with metrics.span("retrieve") as span:
+                store_model_id = store.embedding_model
+                if store_model_id and store_model_id != self.embedding_backend.model_id:
+                    return (
+                        f"Failed to retrieve relevant context: store was built with {store_model_id}, "
+                        f"but the current embedding backend is {self.embedding_backend.model_id}"
+                    )
+                result = store.search(self.embedding_backend.embed_query(question), k=k)
+                if not result["success"]:
+                    return f"Failed to retrieve relevant context: {result['error']}"
+                hits = [(hit["position"], hit["chunk"]) for hit in result["results"]]
+                span.set(chunks=len(hits), failed_partitions=len(result.get("errors", {})))
+
+            return self._generate(question, hits)
+
+        except Exception as e:
+            return f"Error generating answer: {str(e)}"
+
+    def answer_from_hits(self, question: str, hits: List[Tuple[Hashable, str]], neighbors: Optional[Callable] = None) -> str:
+        """
+        Answer a question from chunks the caller already retrieved
+
+        Args:
+            hits: (key, chunk) pairs, nearest first; the key is whatever
+                ``neighbors`` looks up, e.g. (doc_id, position) for shards
+            neighbors: Optional lookup of a key's (previous, next) chunks
+                (see expand_neighbors)
+        """
+        if not question.strip():
+            return "No question provided."
+
+        try:
+            return self._generate(question, hits, neighbors=neighbors)
+        except Exception as e:
+            return f"Error generating answer: {str(e)}"
+
+    def answer_batch(self, questions: List[str], index, metadata, max_workers: int = RAG_BATCH_CONCURRENCY, summary_tree=None) -> List[str]:
+        """
+        Answer several questions against the same store
+        
+        All questions are embedded in one request and searched with a single
+        matrix query; generations then run concurrently, at most
+        ``max_workers`` at a time. A checklist therefore takes about as long
+        as its slowest question.
+        
+        Returns:
+            Answers in the same order as ``questions``
+        """
+        answers = ["No question provided."] * len(questions)
+        pending = [i for i, question in enumerate(questions) if question and question.strip()]
+        if not pending:
+            return answers
+        
+        try:
+            with metrics.span("retrieve", queries=len(pending)) as span:
+                self._validate_store(index, metadata)
+                query_embeddings = self.embedding_backend.embed_queries([questions[i] for i in pending])
+                all_hits = self._retrieve(query_embeddings, index, metadata, RAG_TOP_K, summary_tree)
+                span.set(
+                    chunks=sum(len(hits) for hits, _ in all_hits),
+                    summary_nodes=sum(len(summaries) for _, summaries in all_hits)
+                )
+        except Exception as e:
+            logger.error(f"Error retrieving chunks for batch: {str(e)}")
+            for i in pending:
+                answers[i] = f"Failed to retrieve relevant context: {str(e)}"
+            return answers
+        
+        neighbors = self._store_neighbors(metadata)
+        
+        def run(i, hits, summaries):
+            if not hits and not summaries:
+                return "No relevant information found in the document to answer this question."
+            try:
+                return self._generate(questions[i], hits, summaries, neighbors)
+            except Exception as e:
+                return f"Error generating answer: {str(e)}"
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            # Copy the context so generate spans land in the caller's trace
+            futures = {
+                executor.submit(contextvars.copy_context().run, run, i, hits, summaries): i
+                for i, (hits, summaries) in zip(pending, all_hits)
+            }
+            for future in futures:
+                answers[futures[future]] = future.result()
+        
+        return answers
@@ -1,25 +1,174 @@
 from pathlib import Path
+from typing import Dict, List, Optional
+import unicodedata
 import fitz  # PyMuPDF
+from config import (
+    OCR_LANGUAGES,
+    OCR_DEFAULT_LANGUAGES,
+    OCR_MIN_TEXT_DENSITY,
+    OCR_MIN_GLYPH_QUALITY,
+    OCR_MIN_IMAGE_AREA,
+    OCR_MIN_IMAGE_SIDE,
+    OCR_FIGURES_ON_TEXT_PAGES,
+)
+from utils.script_detect import choose_languages
+
+# Points per inch in PDF user space
+POINTS_PER_INCH = 72.0
+
+# PDF /Lang primary tags that don't match the EasyOCR code
+PDF_LANGUAGE_CODES = {"zh-cn": "ch_sim", "zh-sg": "ch_sim", "zh-tw": "ch_tra", "zh-hk": "ch_tra", "zh": "ch_sim"}
+
+
+def glyph_quality(text: str) -> float:
+    """
+    Fraction of non-space characters that look like real glyphs
+
+    Text layers from fonts without a usable encoding come out as
+    replacement characters, private-use code points or control characters;
+    those pages read better through OCR than through their text layer.
+    """
+    visible = [ch for ch in text if not ch.isspace()]
+    if not visible:
+        return 1.0
+    good = sum(
+        1 for ch in visible
+        if ch != "�" and unicodedata.category(ch)[0] in ("L", "N", "P", "S")
+        and unicodedata.category(ch) != "Co"
+    )
+    return good / len(visible)
+
 
 class RouterAgent:
-    """Agent that decides whether OCR is needed for a PDF"""
-    
+    """Agent that decides which pages and image regions of a PDF need OCR"""
+
+    def plan_ocr(self, pdf_path: str) -> Dict:
+        """
+        Build a per-page OCR plan
+
+        Each page gets its text character density (per square inch), image
+        area coverage and glyph quality, and one action:
+
+        - "text": the text layer is enough
+        - "ocr": OCR the listed ``regions``; with ``replace_text`` the text
+          layer is unusable and is dropped in favour of the OCR output
+        - "skip": nothing to read (blank page)
+
+        Images too small or too thin to hold text (logos, icons, rules) are
+        listed under ``skipped_regions`` and never OCR'd. Pages to OCR also
+        get ``languages``: the smallest set of OCR_LANGUAGES their script
+        needs, from the page's own text, else the document's text or its
+        /Lang entry, else OCR_DEFAULT_LANGUAGES (``language_source`` is
+        "page", "document" or "default").
+
+        Returns:
+            dict with "pages" (one entry per page, as above), "ocr_pages"
+            (page numbers to OCR) and "regions" (total regions to OCR)
+        """
+        doc = fitz.open(pdf_path)
+        try:
+            texts = [page.get_text().strip() for page in doc]
+            doc_languages = choose_languages("\n".join(texts), OCR_LANGUAGES) or self._catalog_languages(doc)
+            pages = [self._plan_page(page, text, doc_languages) for page, text in zip(doc, texts)]
+        finally:
+            doc.close()
+        ocr_pages = [page["page_num"] for page in pages if page["action"] == "ocr"]
+        return {
+            "pages": pages,
+            "ocr_pages": ocr_pages,
+            "regions": sum(len(page["regions"]) for page in pages),
+        }
+
+    def _catalog_languages(self, doc) -> Optional[List[str]]:
+        """OCR languages from the document's /Lang entry, if it names a configured one"""
+        try:
+            kind, value = doc.xref_get_key(doc.pdf_catalog(), "Lang")
+        except Exception:
+            return None
+        if kind != "string" or not value:
+            return None
+        tag = value.strip().lower().replace("_", "-")
+        lang = PDF_LANGUAGE_CODES.get(tag) or PDF_LANGUAGE_CODES.get(tag.split("-")[0]) or tag.split("-")[0]
+        if lang not in OCR_LANGUAGES:
+            return None
+        languages = {lang}
+        if "en" in OCR_LANGUAGES:
+            languages.add("en")
+        return sorted(languages)
+
+    def _plan_page(self, page, text: str, doc_languages: Optional[List[str]]) -> Dict:
+        page_rect = page.rect
+        page_area = max(page_rect.width * page_rect.height, 1.0)
+        text_chars = len(text)
+        text_density = text_chars / (page_area / POINTS_PER_INCH ** 2)
+        quality = glyph_quality(text)
+
+        regions: List[Dict] = []
+        skipped: List[Dict] = []
+        covered = 0.0
+        for info in page.get_image_info(xrefs=True):
+            bbox = fitz.Rect(info["bbox"]) & page_rect
+            if bbox.is_empty:
+                continue
+            area_fraction = (bbox.width * bbox.height) / page_area
+            region = {
+                "bbox": [round(v, 2) for v in bbox],
+                "xref": info.get("xref") or None,
+                "area_fraction": round(area_fraction, 4),
+            }
+            if min(bbox.width, bbox.height) < OCR_MIN_IMAGE_SIDE:
+                skipped.append(dict(region, reason="decorative"))
+            elif area_fraction < OCR_MIN_IMAGE_AREA:
+                skipped.append(dict(region, reason="small"))
+            else:
+                regions.append(region)
+                covered += area_fraction
+
+        has_text = text_density >= OCR_MIN_TEXT_DENSITY
+        replace_text = False
+        if text_chars and quality < OCR_MIN_GLYPH_QUALITY:
+            # Garbled text layer: read the whole page instead
+            action, reason, replace_text = "ocr", "low glyph quality", True
+            regions = [{"bbox": [round(v, 2) for v in page_rect], "xref": None, "area_fraction": 1.0}]
+        elif regions and not has_text:
+            action, reason = "ocr", "images without a text layer"
+        elif regions and OCR_FIGURES_ON_TEXT_PAGES:
+            action, reason = "ocr", "figures on a text page"
+        elif has_text or text_chars:
+            action, reason = "text", "text layer"
+            skipped.extend(dict(region, reason="text page") for region in regions)
+            regions = []
+        else:
+            action, reason = "skip", "blank page"
+
+        languages, language_source = None, None
+        if action == "ocr":
+            # A garbled text layer says nothing reliable about the script
+            languages = None if replace_text else choose_languages(text, OCR_LANGUAGES)
+            language_source = "page"
+            if languages is None:
+                languages, language_source = doc_languages, "document"
+            if languages is None:
+                languages, language_source = OCR_DEFAULT_LANGUAGES, "default"
+
+        return {
+            "page_num": page.number + 1,
+            "text_chars": text_chars,
+            "text_density": round(text_density, 3),
+            "image_coverage": round(min(covered, 1.0), 4),
+            "glyph_quality": round(quality, 4),
+            "action": action,
+            "reason": reason,
+            "replace_text": replace_text,
+            "languages": languages,
+            "language_source": language_source,
+            "regions": regions,
+            "skipped_regions": skipped,
+        }
+
     def check_needs_ocr(self, pdf_path: str) -> bool:
         """
         Check if a PDF needs OCR by analyzing its content
         Returns True if OCR is needed, False otherwise
         """
-        doc = fitz.open(pdf_path)
-        needs_ocr = False
-
-        for page in doc:
-            # Get text from the page
-            text = page.get_text()
-            
-            # If a page has no text but has images, it likely needs OCR
-            if not text.strip() and len(page.get_images()) > 0:
-                needs_ocr = True
-                break
-
-        doc.close()
-        return needs_ocr
+        return bool(self.plan_ocr(pdf_path)["ocr_pages"])
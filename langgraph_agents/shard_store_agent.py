@@ -0,0 +1,320 @@
+import faiss
+import heapq
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from config import SHARD_STORE_DIR, SHARD_CACHE_SIZE, SHARD_SEARCH_WORKERS, VECTOR_STORE_LOCK_TIMEOUT
+from utils.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+def _collapse(hits, k: int) -> List[tuple]:
+    """First ``k`` hits, keeping only the best hit of each near-duplicate cluster"""
+    kept, seen = [], set()
+    for hit in hits:
+        cluster = hit[-1]
+        if cluster is not None:
+            if cluster in seen:
+                continue
+            seen.add(cluster)
+        kept.append(hit)
+        if len(kept) == k:
+            break
+    return kept
+
+
+class ShardedVectorStoreAgent:
+    """
+    Agent for a per-document FAISS layout
+
+    Each document gets its own shard directory holding ``index.faiss``,
+    ``metadata.pkl`` and a small ``manifest.json``. Shards are loaded on
+    first query and kept in an LRU of at most ``cache_size`` resident
+    shards, so memory and query cost scale with the documents selected
+    rather than the whole corpus.
+    """
+
+    def __init__(self, root: Path = SHARD_STORE_DIR, cache_size: int = SHARD_CACHE_SIZE, max_workers: int = SHARD_SEARCH_WORKERS):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cache_size = max(1, cache_size)
+        self._resident: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # FAISS releases the GIL during search, so shards are searched in threads
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="shard-search")
+
+    def _shard_dir(self, doc_id: str) -> Path:
+        return self.root / doc_id
+
+    def _write_lock(self) -> FileLock:
+        """Serializes shard swaps across processes"""
+        return FileLock(self.root.parent / f".{self.root.name}.lock", timeout=VECTOR_STORE_LOCK_TIMEOUT)
+
+    def add_document(self, doc_id: str, embeddings: np.ndarray, chunks: List[str], model_id: str, name: Optional[str] = None,
+                     clusters: Optional[List[Optional[int]]] = None, text: Optional[str] = None,
+                     offsets: Optional[List[Tuple[int, int]]] = None, page_map: Optional[List[Dict]] = None) -> bool:
+        """
+        Write (or replace) the shard for one document
+
+        Args:
+            doc_id: Stable document id (content hash)
+            embeddings: (n, dim) vectors, one per chunk
+            chunks: Chunk texts in document order
+            model_id: Embedding model id of the vectors
+            name: Display name, e.g. the uploaded file name
+            clusters: Per-chunk near-duplicate cluster ids (see
+                VectorStoreAgent.cluster_ids); chunks sharing an id are
+                collapsed to one search result
+            text: Full document text the chunks were cut from
+            offsets: Per-chunk (start, end) character offsets in ``text``
+            page_map: {"page_num", "start", "end"} character range of each page in ``text``
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            if len(vectors) != len(chunks):
+                raise ValueError("Length mismatch between embeddings and chunks")
+
+            index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+            known = [cluster for cluster in clusters or [] if cluster is not None]
+            duplicates = len(known) - len(set(known))
+            manifest = {
+                "doc_id": doc_id,
+                "name": name or doc_id,
+                "chunks": len(chunks),
+                "dimension": int(vectors.shape[1]),
+                "embedding_model": model_id,
+                "created": time.time(),
+            }
+
+            # Write into a private scratch directory, then swap it in
+            shard_dir = self._shard_dir(doc_id)
+            tmp_dir = Path(tempfile.mkdtemp(prefix=f".{doc_id}.", dir=self.root))
+            faiss.write_index(index, str(tmp_dir / "index.faiss"))
+            with open(tmp_dir / "metadata.pkl", "wb") as f:
+                pickle.dump({
+                    "chunks": list(chunks), "embedding_model": model_id, "clusters": clusters, "duplicates": duplicates,
+                    "text": text, "offsets": offsets, "page_map": page_map,
+                }, f)
+                f.flush()
+                os.fsync(f.fileno())
+            (tmp_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+            with self._write_lock(), self._lock:
+                self._resident.pop(doc_id, None)
+                shutil.rmtree(shard_dir, ignore_errors=True)
+                os.replace(tmp_dir, shard_dir)
+
+            logger.info(f"Stored shard {doc_id} with {len(chunks)} chunks")
+            return True
+        except Exception as e:
+            logger.error(f"Error storing shard {doc_id}: {e}")
+            return False
+
+    def remove_document(self, doc_id: str) -> bool:
+        """Delete a document's shard"""
+        try:
+            with self._write_lock(), self._lock:
+                self._resident.pop(doc_id, None)
+                shutil.rmtree(self._shard_dir(doc_id), ignore_errors=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error removing shard {doc_id}: {e}")
+            return False
+
+    def clear(self) -> bool:
+        """Delete every shard"""
+        try:
+            with self._write_lock(), self._lock:
+                self._resident.clear()
+                shutil.rmtree(self.root, ignore_errors=True)
+                self.root.mkdir(parents=True, exist_ok=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error clearing shards: {e}")
+            return False
+
+    def get_document(self, doc_id: str) -> Optional[Dict]:
+        """
+        Everything stored for one document
+
+        Returns:
+            The shard's metadata ("chunks", "embedding_model", "text",
+            "offsets", "page_map", ...) plus its "manifest" and "vectors"
+            as an (n, dim) array, or None if the document isn't stored
+        """
+        shard_dir = self._shard_dir(doc_id)
+        if not (shard_dir / "metadata.pkl").exists():
+            return None
+        index, metadata = self._load_shard(doc_id)
+        document = dict(metadata)
+        document["manifest"] = json.loads((shard_dir / "manifest.json").read_text())
+        document["vectors"] = index.reconstruct_n(0, index.ntotal)
+        return document
+
+    def list_documents(self) -> List[Dict]:
+        """Manifests of all stored documents, newest first"""
+        documents = []
+        for manifest_path in self.root.glob("*/manifest.json"):
+            if manifest_path.parent.name.startswith("."):
+                continue  # Shard still being written
+            try:
+                documents.append(json.loads(manifest_path.read_text()))
+            except Exception as e:
+                logger.warning(f"Skipping unreadable shard manifest {manifest_path}: {e}")
+        return sorted(documents, key=lambda doc: doc.get("created", 0), reverse=True)
+
+    def _load_shard(self, doc_id: str):
+        """Return (index, metadata) for a shard, loading it and evicting the LRU shard if needed"""
+        with self._lock:
+            shard = self._resident.get(doc_id)
+            if shard is not None:
+                self._resident.move_to_end(doc_id)
+                return shard
+
+        shard_dir = self._shard_dir(doc_id)
+        if not (shard_dir / "index.faiss").exists():
+            raise ValueError(f"Unknown document: {doc_id}")
+        index = faiss.read_index(str(shard_dir / "index.faiss"))
+        with open(shard_dir / "metadata.pkl", "rb") as f:
+            metadata = pickle.load(f)
+
+        with self._lock:
+            self._resident[doc_id] = (index, metadata)
+            self._resident.move_to_end(doc_id)
+            while len(self._resident) > self.cache_size:
+                evicted, _ = self._resident.popitem(last=False)
+                logger.debug(f"Evicted shard {evicted}")
+            return index, metadata
+
+    def has_chunks(self, doc_id: str, chunks: List[str], model_id: str) -> bool:
+        """Whether the document's shard already holds exactly these chunks, embedded with ``model_id``"""
+        if not (self._shard_dir(doc_id) / "metadata.pkl").exists():
+            return False
+        try:
+            _, metadata = self._load_shard(doc_id)
+        except Exception as e:
+            logger.warning(f"Error reading shard {doc_id}: {e}")
+            return False
+        return metadata.get("embedding_model") == model_id and list(metadata["chunks"]) == list(chunks)
+
+    def neighbors(self, key: Tuple[str, int]):
+        """
+        Chunks before and after a chunk of a document
+
+        Args:
+            key: (doc_id, position) as in search results
+
+        Returns:
+            (previous, next) as ((doc_id, position), chunk) pairs, None at
+            the start or end of the document
+        """
+        doc_id, position = key
+        _, metadata = self._load_shard(doc_id)
+        chunks = metadata["chunks"]
+        before = ((doc_id, position - 1), chunks[position - 1]) if position > 0 else None
+        after = ((doc_id, position + 1), chunks[position + 1]) if position + 1 < len(chunks) else None
+        return before, after
+
+    def resident_documents(self) -> List[str]:
+        """Ids of the shards currently held in memory, least recently used first"""
+        with self._lock:
+            return list(self._resident)
+
+    def _search_shard(self, doc_id: str, query_vector: np.ndarray, k: int, model_id: Optional[str]) -> List[tuple]:
+        index, metadata = self._load_shard(doc_id)
+        if model_id and metadata.get("embedding_model") != model_id:
+            raise ValueError(f"Shard {doc_id} was built with {metadata.get('embedding_model')}, not {model_id}")
+        clusters = metadata.get("clusters") or [None] * len(metadata["chunks"])
+        # Over-fetch by the number of in-document duplicates, which are collapsed
+        distances, indices = index.search(query_vector, min(k + metadata.get("duplicates", 0), index.ntotal))
+        hits = [
+            (float(distance), doc_id, int(idx), metadata["chunks"][idx], clusters[idx])
+            for distance, idx in zip(distances[0], indices[0])
+            if 0 <= idx < len(metadata["chunks"])
+        ]
+        return _collapse(hits, k)
+
+    def search(self, query_vector: np.ndarray, doc_ids: List[str], k: int = 5, model_id: Optional[str] = None) -> dict:
+        """
+        Search the selected document shards in parallel and merge their top-k
+
+        Args:
+            query_vector: Query embedding vector
+            doc_ids: Documents to search
+            k: Number of results to return overall
+            model_id: If given, shards built with another model are reported as errors
+
+        Returns:
+            dict with results and metadata:
+                - success: bool indicating if search was successful
+                - distances: list of distances for each result
+                - results: list of dicts with chunk, doc_id and position, best first
+                - by_document: each document's own top-k as {doc_id: [result, ...]}
+                - errors: per-document error messages for shards that failed
+                - error: error message if success is False
+        """
+        try:
+            if not doc_ids:
+                raise ValueError("No documents selected")
+            query_vector = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+
+            futures = {
+                doc_id: self._executor.submit(self._search_shard, doc_id, query_vector, k, model_id)
+                for doc_id in doc_ids
+            }
+            per_shard, errors = [], {}
+            for doc_id, future in futures.items():
+                try:
+                    per_shard.append(future.result())
+                except Exception as e:
+                    logger.error(f"Error searching shard {doc_id}: {e}")
+                    errors[doc_id] = str(e)
+
+            # Each shard's hits are already sorted by distance; near-duplicates
+            # across documents (shared boilerplate) count once
+            merged = _collapse(heapq.merge(*per_shard), k)
+            if not merged and errors:
+                raise ValueError("; ".join(f"{doc_id}: {error}" for doc_id, error in errors.items()))
+
+            return {
+                "success": True,
+                "distances": [hit[0] for hit in merged],
+                "results": [
+                    {"chunk": chunk, "doc_id": doc_id, "position": position}
+                    for _, doc_id, position, chunk, _ in merged
+                ],
+                "by_document": {
+                    hits[0][1]: [
+                        {"chunk": chunk, "position": position, "distance": distance}
+                        for distance, _, position, chunk, _ in hits
+                    ]
+                    for hits in per_shard if hits
+                },
+                "errors": errors
+            }
+        except Exception as e:
+            logger.error(f"Error searching shards: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "distances": [],
+                "results": [],
+                "by_document": {},
+                "errors": {}
+            }
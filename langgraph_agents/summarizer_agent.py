@@ -1,62 +1,118 @@
-from openai import OpenAI
-from config import OPENAI_API_KEY, LLM_MODEL
+from typing import Dict
+from langgraph_agents.llm_backend import LLMBackend, get_llm_backend
+from utils import metrics
+from utils.request_scheduler import INTERACTIVE, estimate_tokens
+
+# Bump when the prompts change so cached summaries are regenerated
+PROMPT_VERSION = 1
+
+# Summary lengths: instructions and response budget
+LENGTHS = {
+    "long": {
+        "instructions": """Please provide a comprehensive summary of the following document.
+            Include the main topics, key points, and important conclusions.
+            Format the summary with clear sections and bullet points where appropriate.""",
+        "steps": """1. Start with a brief overview
+            2. List main topics using bullet points
+            3. Highlight key findings or conclusions
+            4. Use clear formatting for readability""",
+        "max_tokens": 2048,
+    },
+    "short": {
+        "instructions": """Please provide a short summary of the following document.
+            Capture only the main topic and the most important conclusions.""",
+        "steps": """1. One or two sentences of overview
+            2. At most five bullet points with the key points""",
+        "max_tokens": 512,
+    },
+}
 
 class SummarizerAgent:
-    """Agent for generating document summaries using OpenAI"""
-    
-    def __init__(self):
-        """Initialize OpenAI client"""
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
-    
-    def summarize(self, text: str) -> str:
+    """Agent for generating document summaries using the configured LLM backend"""
+
+    # GPT-4's approximate token limit (~75% of max to leave room for response)
+    max_chunk_length = 24000
+    temperature = 0.7
+
+    def __init__(self, llm_backend: LLMBackend = None):
+        """Initialize the LLM backend (see config.LLM_BACKEND)"""
+        self.llm_backend = llm_backend or get_llm_backend()
+
+    @property
+    def model_id(self) -> str:
+        return self.llm_backend.model_id
+
+    def config(self, length: str = "long") -> Dict:
+        """Settings that determine the summary for a given text, used as the cache key"""
+        return {
+            "length": length,
+            "prompt_version": PROMPT_VERSION,
+            "max_chars": self.max_chunk_length,
+            "temperature": self.temperature,
+            "max_tokens": LENGTHS[length]["max_tokens"],
+        }
+
+    def create(self, text: str, length: str = "long") -> str:
         """
-        Generate a comprehensive summary of the document
-        Returns formatted summary
+        Generate a summary of the document
+
+        Args:
+            text: Document text
+            length: "long" (sections and bullet points) or "short"
+
+        Returns the formatted summary; raises on an empty text or model failure
         """
         if not text or not text.strip():
-            return "No text content provided for summarization."
-            
-        try:
-            # Break text into chunks if it's too long (GPT-4 context limit)
-            max_chunk_length = 24000  # GPT-4's approximate token limit (~75% of max to leave room for response)
-            if len(text) > max_chunk_length:
-                text = text[:max_chunk_length] + "\n[Text truncated due to length...]"
-            
-            # Construct prompt
-            prompt = f"""Please provide a comprehensive summary of the following document. 
-            Include the main topics, key points, and important conclusions.
-            Format the summary with clear sections and bullet points where appropriate.
-            
+            raise ValueError("No text content provided for summarization.")
+        settings = LENGTHS[length]
+
+        # Break text into chunks if it's too long (GPT-4 context limit)
+        if len(text) > self.max_chunk_length:
+            text = text[:self.max_chunk_length] + "\n[Text truncated due to length...]"
+
+        # Construct prompt
+        prompt = f"""{settings["instructions"]}
+
             Document:
             {text}
-            
+
             Instructions:
-            1. Start with a brief overview
-            2. List main topics using bullet points
-            3. Highlight key findings or conclusions
-            4. Use clear formatting for readability
-            
+            {settings["steps"]}
+
             Summary:"""
-            
-            # Generate summary using OpenAI
-            try:
-                response = self.client.chat.completions.create(
-                    model=LLM_MODEL,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that creates comprehensive document summaries."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7,
-                    max_tokens=2048
-                )
-                
-                if not response or not response.choices:
-                    return "Failed to generate summary. The model returned an empty response."
-                    
-                return response.choices[0].message.content
-                
-            except Exception as model_error:
-                return f"Model error: {str(model_error)}"
-            
+
+        # Generate summary with the configured LLM backend
+        with metrics.span("generate", model=self.llm_backend.model_id, length=length) as span:
+            summary = self.llm_backend.complete(
+                [
+                    {"role": "system", "content": "You are a helpful assistant that creates comprehensive document summaries."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.temperature,
+                max_tokens=settings["max_tokens"],
+                priority=INTERACTIVE
+            )
+            span.set(tokens=estimate_tokens(prompt) + estimate_tokens(summary or ""))
+
+        if not summary:
+            raise RuntimeError("The model returned an empty response.")
+        return summary
+
+    def summarize(self, text: str, length: str = "long") -> str:
+        """
+        Generate a comprehensive summary of the document
+        Returns formatted summary, or an error message
+        """
+        try:
+            return self.create(text, length)
         except Exception as e:
-            return f"Error preparing summary: {str(e)}"
+            return self.error_message(e)
+
+    @staticmethod
+    def error_message(error: Exception) -> str:
+        """User-facing message for an exception raised by create()"""
+        if isinstance(error, ValueError):
+            return str(error)
+        if isinstance(error, RuntimeError):
+            return f"Failed to generate summary. {str(error)}"
+        return f"Model error: {str(error)}"
@@ -0,0 +1,218 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import contextvars
+import logging
+import os
+import pickle
+import tempfile
+import faiss
+import numpy as np
+from config import SUMMARY_TREE_DIR, SUMMARY_TREE_FANOUT, SUMMARY_TREE_NODE_TOKENS, VECTOR_STORE_LOCK_TIMEOUT
+from langgraph_agents.embedding_backend import EmbeddingBackend, get_embedding_backend
+from langgraph_agents.llm_backend import LLMBackend, get_llm_backend
+from utils import metrics
+from utils.file_lock import FileLock
+from utils.request_scheduler import BULK, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Text of one group sent to the model, in characters (~4 per token)
+MAX_GROUP_CHARS = 12000
+
+
+class SummaryTreeAgent:
+    """
+    Agent for the hierarchical summary index
+
+    Each document's chunks are grouped ``SUMMARY_TREE_FANOUT`` at a time into
+    section summaries, which are grouped again level by level up to a single
+    document summary. Every node is embedded in the same space as the chunks
+    and searched alongside them, so broad questions can be answered from a
+    few compact summaries instead of many leaf chunks.
+
+    Nodes of all documents live in one file (``tree.pkl``), replaced
+    atomically under a file lock; readers reload when it changes.
+    """
+
+    def __init__(self, root: Path = SUMMARY_TREE_DIR, embedding_backend: EmbeddingBackend = None,
+                 llm_backend: LLMBackend = None, fanout: int = SUMMARY_TREE_FANOUT):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.path = self.root / "tree.pkl"
+        self.embedding_backend = embedding_backend or get_embedding_backend()
+        self.llm_backend = llm_backend or get_llm_backend()
+        self.fanout = max(2, fanout)
+        self.nodes: List[Dict] = []
+        self.index = None
+        self.embedding_model: Optional[str] = None
+        self._loaded_mtime = None
+        self.refresh()
+
+    def _write_lock(self) -> FileLock:
+        return FileLock(self.root / ".tree.lock", timeout=VECTOR_STORE_LOCK_TIMEOUT)
+
+    def refresh(self) -> bool:
+        """Reload the tree if another process or thread has replaced it"""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._loaded_mtime:
+            return False
+        nodes, index, model = [], None, None
+        if mtime is not None:
+            try:
+                with open(self.path, "rb") as f:
+                    data = pickle.load(f)
+                nodes, model = data["nodes"], data["embedding_model"]
+                index = faiss.deserialize_index(data["index"]) if nodes else None
+            except Exception as e:
+                logger.error(f"Error loading summary tree, ignoring it: {e}")
+                nodes, index, model = [], None, None
+        self.nodes, self.index, self.embedding_model = nodes, index, model
+        self._loaded_mtime = mtime
+        return True
+
+    def _summarize(self, texts: List[str], level: int) -> str:
+        """Summarize a group of chunks (level 1) or of lower-level summaries"""
+        text = "\n\n".join(texts)[:MAX_GROUP_CHARS]
+        kind = "passages" if level == 1 else "section summaries"
+        prompt = f"""Summarize the following consecutive {kind} from one document in a single short paragraph.
+        Name the topics, key facts and conclusions they cover, so the summary can answer overview questions.
+
+        {text}
+
+        Summary:"""
+        summary = self.llm_backend.complete(
+            [
+                {"role": "system", "content": "You are a helpful assistant that writes compact, factual summaries."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_TREE_NODE_TOKENS,
+            priority=BULK
+        )
+        if not summary:
+            raise RuntimeError("The model returned an empty summary")
+        return summary.strip()
+
+    def build(self, doc_id: str, chunks: List[str], model_id: str) -> bool:
+        """
+        Build and store the summary tree of a document, replacing any earlier tree for it
+
+        Args:
+            doc_id: Document hash
+            chunks: The document's chunks in order
+            model_id: Embedding model id of the document's chunk vectors
+
+        Returns:
+            bool: True if successful
+        """
+        try:
+            if model_id != self.embedding_backend.model_id:
+                raise ValueError(f"Embedding model mismatch: chunks use {model_id}, backend is {self.embedding_backend.model_id}")
+            with metrics.span("summary_tree", chunks=len(chunks)) as span:
+                nodes = self._build_nodes(doc_id, chunks)
+                vectors = np.asarray(self.embedding_backend.embed_documents([node["text"] for node in nodes]), dtype=np.float32)
+                span.set(nodes=len(nodes), tokens=sum(estimate_tokens(node["text"]) for node in nodes))
+            self.add_nodes(doc_id, nodes, vectors, model_id)
+            logger.info(f"Stored summary tree for {doc_id}: {len(nodes)} nodes")
+            return True
+        except Exception as e:
+            logger.error(f"Error building summary tree for {doc_id}: {e}")
+            return False
+
+    def _build_nodes(self, doc_id: str, chunks: List[str]) -> List[Dict]:
+        nodes: List[Dict] = []
+        # (text, first chunk, last chunk + 1) of the current level
+        level_items: List[Tuple[str, int, int]] = [(chunk, i, i + 1) for i, chunk in enumerate(chunks)]
+        level = 0
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            while len(level_items) > 1 or level == 0:
+                level += 1
+                groups = [level_items[i:i + self.fanout] for i in range(0, len(level_items), self.fanout)]
+                # Copy the context so spans from the workers land in the build's trace
+                summaries = list(executor.map(
+                    lambda group: contextvars.copy_context().run(self._summarize, [item[0] for item in group], level),
+                    groups
+                ))
+                level_items = [(summary, group[0][1], group[-1][2]) for summary, group in zip(summaries, groups)]
+                for summary, start, end in level_items:
+                    nodes.append({"doc_id": doc_id, "level": level, "start": start, "end": end, "text": summary})
+        # The last level holds the single document summary
+        nodes[-1]["root"] = True
+        return nodes
+
+    def has_tree(self, doc_id: str, model_id: str) -> bool:
+        """Whether a tree of the document, built with embedding model ``model_id``, is stored"""
+        self.refresh()
+        return self.embedding_model == model_id and any(node["doc_id"] == doc_id for node in self.nodes)
+
+    def nodes_for(self, doc_id: str) -> Tuple[List[Dict], np.ndarray]:
+        """A document's nodes, lowest level first, and their (n, dim) vectors"""
+        self.refresh()
+        positions = [i for i, node in enumerate(self.nodes) if node["doc_id"] == doc_id]
+        if not positions:
+            return [], np.zeros((0, self.index.d if self.index is not None else 0), dtype=np.float32)
+        vectors = np.vstack([self.index.reconstruct(i) for i in positions])
+        return [dict(self.nodes[i]) for i in positions], vectors
+
+    def add_nodes(self, doc_id: str, nodes: List[Dict], vectors: np.ndarray, model_id: str):
+        """Store a document's nodes and vectors, replacing any it had"""
+        with self._write_lock():
+            self._loaded_mtime = None
+            self.refresh()
+            if self.embedding_model and self.embedding_model != model_id:
+                # The main store was cleared and rebuilt with another model
+                self.nodes, self.index = [], None
+            keep = [i for i, node in enumerate(self.nodes) if node["doc_id"] != doc_id]
+            old_vectors = self.index.reconstruct_n(0, self.index.ntotal) if self.index is not None else np.zeros((0, vectors.shape[1]), np.float32)
+            all_vectors = np.vstack([old_vectors[keep], vectors]) if keep else vectors
+            index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(all_vectors)
+            all_nodes = [self.nodes[i] for i in keep] + nodes
+            self._write({"nodes": all_nodes, "embedding_model": model_id, "index": faiss.serialize_index(index)})
+            self.refresh()
+
+    def _write(self, data: Dict):
+        fd, tmp = tempfile.mkstemp(prefix=".tree.", dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def search(self, query_vectors: np.ndarray, k: int, model_id: Optional[str] = None) -> List[List[Tuple[float, Dict]]]:
+        """
+        Nearest summary nodes for a (n, dim) matrix of queries
+
+        Returns:
+            Per query, up to k (distance, node) pairs, nearest first; empty
+            when there is no tree or it was built with another model
+        """
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        self.refresh()
+        if self.index is None or not self.nodes or (model_id and model_id != self.embedding_model):
+            return [[] for _ in range(len(query_vectors))]
+        D, I = self.index.search(query_vectors, min(k, len(self.nodes)))
+        return [
+            [(float(distance), self.nodes[idx]) for distance, idx in zip(row_d, row_i) if 0 <= idx < len(self.nodes)]
+            for row_d, row_i in zip(D, I)
+        ]
+
+    def clear(self) -> bool:
+        """Delete the summary trees of all documents"""
+        try:
+            with self._write_lock():
+                if self.path.exists():
+                    os.remove(self.path)
+            self.refresh()
+            return True
+        except Exception as e:
+            logger.error(f"Error clearing summary tree: {e}")
+            return False
@@ -3,125 +3,472 @@ import numpy as np
 import os
 import pickle
 import logging
+import shutil
+import tempfile
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Optional
-from config import VECTOR_STORE_DIR, FAISS_INDEX_PATH, VECTOR_METADATA_PATH
+from typing import List, Optional, Tuple
+from config import (
+    VECTOR_STORE_DIR, FAISS_INDEX_PATH, VECTOR_METADATA_PATH, VECTOR_CHUNKS_PATH,
+    VECTOR_GENERATIONS_DIR, VECTOR_STORE_CURRENT_PATH, VECTOR_STORE_LAST_GENERATION_PATH, VECTOR_STORE_LOCK_PATH,
+    VECTOR_STORE_KEEP_GENERATIONS, VECTOR_STORE_LOCK_TIMEOUT, VECTOR_STORE_MMAP,
+    DEDUP_ENABLED, DEDUP_THRESHOLD, MINHASH_PERMUTATIONS, MINHASH_BANDS,
+)
+from langgraph_agents.embedding_backend import LEGACY_EMBEDDING_MODEL_ID
+from utils.chunk_store import NO_LINK, MappedChunks, chunks_exist, document_links, read_links, write_chunks, write_links
+from utils.file_lock import FileLock
+from utils.minhash import LSHIndex, MinHasher
 
 logger = logging.getLogger(__name__)
 
+# Map flat index storage (IO_FLAG_MMAP_IFC) and inverted lists (IO_FLAG_MMAP)
+# instead of copying them into the process
+MMAP_IO_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+# MinHash signatures of the stored chunks, one row per index position
+SIGNATURES_FILE = "minhash.npy"
+
+# Signatures of recently seen chunk texts, so dedupe, store and cluster lookups hash each chunk once
+SIGNATURE_CACHE_SIZE = 4096
+
+
+def load_metadata(metadata_path: Path, chunks_path: Path, mmap: bool = False) -> dict:
+    """
+    Load store metadata, with chunks from the chunk store
+
+    Stores written before the chunk store kept chunks in the pickle itself.
+    With ``mmap`` the chunks stay a read-only MappedChunks view. Chunk links
+    (see utils/chunk_store.py) are loaded as "links" when the store has them.
+    """
+    with open(metadata_path, "rb") as f:
+        metadata = pickle.load(f)
+    if "chunks" not in metadata and chunks_exist(chunks_path):
+        chunks = MappedChunks(chunks_path)
+        metadata["chunks"] = chunks if mmap else list(chunks)
+    links = read_links(chunks_path, mmap=mmap)
+    if links is not None and len(links) == len(metadata.get("chunks", ())):
+        metadata["links"] = links
+    return metadata
+
+
+def read_generation(current_path: Path = VECTOR_STORE_CURRENT_PATH) -> Optional[int]:
+    """Generation the CURRENT pointer names, or None if no generation has been published"""
+    try:
+        return int(Path(current_path).read_text().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def store_paths(generation: Optional[int], generations_dir: Path = VECTOR_GENERATIONS_DIR) -> Tuple[Path, Path, Path]:
+    """(index, metadata, chunks) paths of a generation; None is the pre-generation flat layout"""
+    if generation is None:
+        return FAISS_INDEX_PATH, VECTOR_METADATA_PATH, VECTOR_CHUNKS_PATH
+    generation_dir = Path(generations_dir) / f"{generation:08d}"
+    return generation_dir / "index.faiss", generation_dir / "metadata.pkl", generation_dir / "chunks"
+
+
 class VectorStoreAgent:
-    """Agent for managing the FAISS vector store"""
-    
-    def __init__(self):
-        """Initialize vector store with default paths"""
+    """
+    Agent for managing the FAISS vector store
+
+    Every write publishes a new immutable generation directory and then
+    atomically repoints ``CURRENT`` at it. Readers never lock: they load
+    whatever generation ``CURRENT`` names and see a consistent snapshot
+    until they ``refresh()``. Writers serialize on a file lock and always
+    extend the latest generation, so concurrent uploads from several
+    sessions or processes are all kept.
+
+    With DEDUP_ENABLED each stored chunk also has a MinHash signature
+    (``minhash.npy`` in the generation). Chunks that nearly duplicate a
+    stored chunk are not stored again; ``find_duplicates`` lets callers skip
+    embedding them and reuse the stored vector instead.
+
+    Each generation also links every chunk to the previous and next chunk
+    of its document and records its page (``chunks.links``), so answers can
+    include the text around a retrieved chunk.
+    """
+
+    def __init__(self, mmap: bool = VECTOR_STORE_MMAP):
+        """Initialize vector store with default paths
+
+        Args:
+            mmap: Map the index and chunks read-only instead of loading them,
+                so several processes share one copy in the page cache
+        """
         self.vector_store_path = VECTOR_STORE_DIR
-        self.index_path = FAISS_INDEX_PATH
-        self.metadata_path = VECTOR_METADATA_PATH
-        
+        self.generations_dir = VECTOR_GENERATIONS_DIR
+        self.current_path = VECTOR_STORE_CURRENT_PATH
+        self.last_generation_path = VECTOR_STORE_LAST_GENERATION_PATH
+        self.lock_path = VECTOR_STORE_LOCK_PATH
+        self.mmap = mmap
+
         # Create directory if it doesn't exist
         self.vector_store_path.mkdir(parents=True, exist_ok=True)
-        
+        self.generations_dir.mkdir(parents=True, exist_ok=True)
+
         # Initialize storage
         self.index = None
         self.metadata = {"chunks": [], "texts": []}
-        
+        self.generation = None
+        self.signatures = None
+        self.hasher = MinHasher(num_perm=MINHASH_PERMUTATIONS)
+        self._lsh = None
+        self._lsh_generation = None
+        self._signature_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
         # Load existing data if available
         self._load_existing_store()
 
+    @property
+    def index_path(self) -> Path:
+        return store_paths(self.generation, self.generations_dir)[0]
+
+    def _write_lock(self) -> FileLock:
+        return FileLock(self.lock_path, timeout=VECTOR_STORE_LOCK_TIMEOUT)
+
     def clear(self):
         """Clear the vector store and metadata"""
         try:
-            if self.index_path.exists():
-                os.remove(self.index_path)
-            if self.metadata_path.exists():
-                os.remove(self.metadata_path)
-            self.index = None
+            with self._write_lock():
+                # Unpublish first so readers that refresh see an empty store
+                if self.current_path.exists():
+                    os.remove(self.current_path)
+                shutil.rmtree(self.generations_dir, ignore_errors=True)
+                self.generations_dir.mkdir(parents=True, exist_ok=True)
+                self._remove_flat_layout()
+            self._reinitialize_store()
             self.metadata = {"chunks": [], "texts": []}
             logger.info("Vector store cleared successfully")
             return True
         except Exception as e:
             logger.error(f"Error clearing vector store: {e}")
             return False
-    
+
     def _load_existing_store(self):
-        """Load existing index and metadata if they exist"""
+        """Load the generation CURRENT points at (or a pre-generation store) if one exists"""
         try:
-            if self.index_path.exists() and self.metadata_path.exists():
+            # A writer may collect the generation we just read the pointer for; re-read and retry
+            for _ in range(3):
+                generation = read_generation(self.current_path)
+                index_path, metadata_path, chunks_path = store_paths(generation, self.generations_dir)
+                if not (index_path.exists() and metadata_path.exists()):
+                    if generation is None:
+                        return
+                    continue
                 try:
-                    self.index = faiss.read_index(str(self.index_path))
-                    with open(self.metadata_path, "rb") as f:
-                        self.metadata = pickle.load(f)
-                    
+                    if self.mmap:
+                        self.index = faiss.read_index(str(index_path), MMAP_IO_FLAGS)
+                    else:
+                        self.index = faiss.read_index(str(index_path))
+                    self.metadata = load_metadata(metadata_path, chunks_path, mmap=self.mmap)
+                    self.generation = generation
+                    self.signatures = self._load_signatures(index_path.parent / SIGNATURES_FILE)
+
                     # Validate metadata structure
                     if not isinstance(self.metadata, dict) or "chunks" not in self.metadata or "texts" not in self.metadata:
                         raise ValueError("Invalid metadata structure")
-                    
+
                     chunk_count = len(self.metadata["chunks"])
                     if chunk_count > 0:
-                        logger.info(f"Loaded existing store with {chunk_count} chunks")
+                        logger.info(f"Loaded store generation {generation} with {chunk_count} chunks{' (mmap)' if self.mmap else ''}")
                     else:
                         logger.warning("Loaded store but it contains no chunks")
-                        
+                    return
+
+                except FileNotFoundError:
+                    continue
                 except (EOFError, ValueError) as e:
                     logger.error(f"Corrupted store files, reinitializing: {e}")
                     self._reinitialize_store()
-                    
+                    return
+            logger.warning("Store generations kept changing while loading; starting empty")
+            self._reinitialize_store()
+
         except Exception as e:
             logger.error(f"Error loading existing store: {e}")
             self._reinitialize_store()
-            
+
+    def refresh(self) -> bool:
+        """
+        Reload the store if another writer has published a new generation
+
+        Returns:
+            bool: True if the store was reloaded
+        """
+        generation = read_generation(self.current_path)
+        if generation == self.generation:
+            return False
+        logger.info(f"Vector store generation changed ({self.generation} -> {generation}), reloading")
+        # The text is this session's document; the new generation's is whichever writer published it last
+        full_text = self.metadata.get("full_text")
+        self._reinitialize_store()
+        self._load_existing_store()
+        if full_text:
+            self.metadata["full_text"] = full_text
+        return True
+
     def _reinitialize_store(self):
         """Reinitialize the store with empty state"""
         self.index = None
         self.metadata = {"chunks": [], "texts": [], "full_text": ""}
-    
-    def store(self, embeddings: List[np.ndarray], chunks: List[str], texts: List[str]) -> bool:
+        self.generation = None
+        self.signatures = None
+        self._lsh = None
+        self._lsh_generation = None
+
+    def _load_signatures(self, path: Path) -> Optional[np.ndarray]:
+        """Stored chunk signatures, if present and made with the current MinHash settings"""
+        if not path.exists() or self.metadata.get("minhash") != self.hasher.params:
+            return None
+        signatures = np.load(path, mmap_mode="r" if self.mmap else None)
+        return signatures if len(signatures) == len(self.metadata["chunks"]) else None
+
+    def _chunk_signatures(self, chunks: List[str]) -> np.ndarray:
+        """MinHash signatures of ``chunks``, reusing recently computed ones"""
+        rows = []
+        for chunk in chunks:
+            signature = self._signature_cache.get(chunk)
+            if signature is None:
+                signature = self.hasher.signature(chunk)
+                self._signature_cache[chunk] = signature
+                if len(self._signature_cache) > SIGNATURE_CACHE_SIZE:
+                    self._signature_cache.popitem(last=False)
+            else:
+                self._signature_cache.move_to_end(chunk)
+            rows.append(signature)
+        return np.vstack(rows) if rows else np.zeros((0, self.hasher.num_perm), dtype=np.uint32)
+
+    def _store_signatures(self) -> np.ndarray:
+        """Signatures of every stored chunk; stores written before dedupe are hashed on first use"""
+        if self.signatures is None:
+            self.signatures = self.hasher.signatures(self.metadata["chunks"])
+        return self.signatures
+
+    def _lsh_index(self) -> LSHIndex:
+        """LSH over the stored chunks, rebuilt when the generation changes"""
+        if self._lsh is None or self._lsh_generation != self.generation:
+            lsh = LSHIndex(self.hasher.num_perm, MINHASH_BANDS, DEDUP_THRESHOLD)
+            for position, signature in enumerate(self._store_signatures()):
+                lsh.add(position, np.asarray(signature))
+            self._lsh, self._lsh_generation = lsh, self.generation
+        return self._lsh
+
+    def find_duplicates(self, chunks: List[str]) -> List[Optional[Tuple[str, int]]]:
         """
-        Store vectors and metadata in FAISS
+        Find chunks that nearly duplicate a stored chunk or an earlier chunk in ``chunks``
         
+        Args:
+            chunks: Candidate chunks in document order
+            
+        Returns:
+            One entry per chunk: None for a new chunk, ("store", position) for
+            a duplicate of a stored chunk, or ("chunk", i) for a duplicate of
+            ``chunks[i]``
+        """
+        self.refresh()
+        lsh = self._lsh_index() if self.index is not None else None
+        batch = LSHIndex(self.hasher.num_perm, MINHASH_BANDS, DEDUP_THRESHOLD)
+        duplicate_of = []
+        for i, signature in enumerate(self._chunk_signatures(chunks)):
+            position = lsh.query(signature) if lsh is not None else None
+            if position is not None:
+                duplicate_of.append(("store", position))
+                continue
+            earlier = batch.query(signature)
+            if earlier is not None:
+                duplicate_of.append(("chunk", earlier))
+                continue
+            batch.add(i, signature)
+            duplicate_of.append(None)
+        return duplicate_of
+
+    def vector_at(self, position: int) -> np.ndarray:
+        """Stored vector at ``position``"""
+        return self.index.reconstruct(int(position))
+
+    def cluster_ids(self, chunks: List[str]) -> List[Optional[int]]:
+        """Store position of the chunk each of ``chunks`` was stored as or collapsed into"""
+        if self.index is None:
+            return [None] * len(chunks)
+        lsh = self._lsh_index()
+        return [lsh.query(signature) for signature in self._chunk_signatures(chunks)]
+
+    @property
+    def embedding_model(self) -> Optional[str]:
+        """Model id of the vectors in the store, or None if the store is empty"""
+        if self.index is None or self.index.ntotal == 0:
+            return None
+        # Stores written before model ids were tracked used the OpenAI default
+        return self.metadata.get("embedding_model", LEGACY_EMBEDDING_MODEL_ID)
+
+    def store(self, embeddings: List[np.ndarray], chunks: List[str], texts: List[str], model_id: Optional[str] = None,
+              pages: Optional[List[Optional[int]]] = None) -> bool:
+        """
+        Store vectors and metadata in FAISS
+
         Args:
             embeddings: List of embedding vectors
-            chunks: List of text chunks corresponding to the embeddings
+            chunks: List of text chunks corresponding to the embeddings,
+                one document's chunks in document order; they are linked to
+                each other as previous/next chunks
             texts: List of original texts
-            
+            model_id: Embedding model id of the vectors; vectors from a
+                different model than the one already stored are rejected
+            pages: Page number of each chunk, if known
+
         Returns:
             bool: True if successful, False otherwise
         """
         try:
             # Convert input data to correct format
-            embeddings_array = np.array(embeddings)
-            
+            embeddings_array = np.array(embeddings, dtype=np.float32)
+
             # Input validation
             if len(embeddings_array) != len(chunks) or len(chunks) != len(texts):
                 raise ValueError("Length mismatch between embeddings, chunks, and texts")
-            
-            # Create new index if doesn't exist
-            if self.index is None:
-                self.index = faiss.IndexFlatL2(embeddings_array.shape[1])
-            
-            # Add vectors to index
-            self.index.add(embeddings_array)
-            
-            # Update metadata
-            self.metadata["chunks"].extend(chunks)
-            self.metadata["texts"].extend(texts)
-            
-            # Save index and metadata with fsync for durability
-            faiss.write_index(self.index, str(self.index_path))
-            with open(self.metadata_path, "wb") as f:
-                pickle.dump(self.metadata, f)
-                f.flush()
-                os.fsync(f.fileno())
-                
+            pages = list(pages) if pages is not None else [None] * len(chunks)
+            if len(pages) != len(chunks):
+                raise ValueError("Length mismatch between chunks and pages")
+
+            # Text of the document being stored, set by the caller before store()
+            full_text = self.metadata.get("full_text")
+
+            with self._write_lock():
+                # Extend the latest generation, which another writer may have published since we loaded
+                self.refresh()
+                stored_model = self.embedding_model
+                if model_id and stored_model and model_id != stored_model:
+                    raise ValueError(f"Embedding model mismatch: store has {stored_model}, got {model_id}")
+                if self.index is not None and self.index.d != embeddings_array.shape[1]:
+                    raise ValueError(f"Embedding dimension mismatch: store has {self.index.d}, got {embeddings_array.shape[1]}")
+
+                signatures = None
+                if DEDUP_ENABLED:
+                    # Drop chunks another writer stored meanwhile, or that repeat within this batch
+                    embeddings_array, chunks, texts, pages, signatures = self._drop_duplicates(
+                        embeddings_array, list(chunks), list(texts), pages
+                    )
+                    if not chunks:
+                        if full_text:
+                            self.metadata["full_text"] = full_text
+                        logger.info("All chunks were near-duplicates of stored chunks; nothing to store")
+                        return True
+
+                # A mapped store is read-only; extend a private copy and map the result afterwards
+                index = self.index
+                if self.mmap and index is not None:
+                    index = faiss.read_index(str(self.index_path))
+                if index is None:
+                    index = faiss.IndexFlatL2(embeddings_array.shape[1])
+
+                # Add vectors to index
+                index.add(embeddings_array)
+
+                # Update metadata
+                metadata = dict(self.metadata)
+                if model_id:
+                    metadata["embedding_model"] = model_id
+                if full_text:
+                    metadata["full_text"] = full_text
+                metadata["chunks"] = list(self.metadata["chunks"]) + list(chunks)
+                metadata["texts"] = list(self.metadata["texts"]) + list(texts)
+                # Chain the document's chunks; chunks stored before links were kept have none
+                links = self.metadata.get("links")
+                if links is None:
+                    links = np.full((len(self.metadata["chunks"]), 3), NO_LINK, dtype=np.int64)
+                metadata["links"] = np.vstack([links, document_links(len(self.metadata["chunks"]), pages)])
+                if signatures is not None:
+                    start = len(self.metadata["chunks"])
+                    signatures = np.vstack([self._store_signatures(), signatures])
+                    metadata["minhash"] = self.hasher.params
+                    lsh = self._lsh_index()
+                    for position in range(start, len(signatures)):
+                        lsh.add(position, signatures[position])
+
+                generation = self._publish(index, metadata, signatures)
+                if self.mmap:
+                    self._load_existing_store()
+                else:
+                    self.index, self.metadata, self.generation = index, metadata, generation
+                    self.signatures = signatures
+                if signatures is not None:
+                    self._lsh_generation = self.generation
+
             logger.debug(f"Metadata after store: chunks={len(self.metadata['chunks'])}, texts={len(self.metadata['texts'])}")
-            
-            logger.info(f"Successfully stored {len(embeddings)} vectors")
+
+            logger.info(f"Successfully stored {len(embeddings)} vectors as generation {self.generation}")
             return True
 
         except Exception as e:
             logger.error(f"Error storing vectors: {e}")
             return False
-            
+
+    def _drop_duplicates(self, embeddings: np.ndarray, chunks: List[str], texts: List[str], pages: List[Optional[int]]):
+        """Remove chunks that nearly duplicate a stored chunk or an earlier chunk of the batch"""
+        signatures = self._chunk_signatures(chunks)
+        keep = [i for i, duplicate in enumerate(self.find_duplicates(chunks)) if duplicate is None]
+        if len(keep) < len(chunks):
+            logger.info(f"Skipping {len(chunks) - len(keep)} near-duplicate chunks")
+            self.metadata["duplicate_chunks"] = self.metadata.get("duplicate_chunks", 0) + len(chunks) - len(keep)
+        return embeddings[keep], [chunks[i] for i in keep], [texts[i] for i in keep], [pages[i] for i in keep], signatures[keep]
+
+    def _publish(self, index, metadata: dict, signatures: Optional[np.ndarray] = None) -> int:
+        """Write a new generation and point CURRENT at it; the write lock must be held"""
+        # Never reuse a number, also after clear() removed the generations
+        generation = max(read_generation(self.current_path) or 0, read_generation(self.last_generation_path) or 0) + 1
+        index_path, metadata_path, chunks_path = store_paths(generation, self.generations_dir)
+        generation_dir = index_path.parent
+
+        # Build the generation aside so it only ever appears complete
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{generation:08d}.", dir=self.generations_dir))
+        try:
+            faiss.write_index(index, str(tmp_dir / index_path.name))
+            write_chunks(tmp_dir / chunks_path.name, metadata["chunks"])
+            if metadata.get("links") is not None:
+                write_links(tmp_dir / chunks_path.name, metadata["links"])
+            if signatures is not None:
+                np.save(tmp_dir / SIGNATURES_FILE, np.ascontiguousarray(signatures, dtype=np.uint32))
+            with open(tmp_dir / metadata_path.name, "wb") as f:
+                pickle.dump({key: value for key, value in metadata.items() if key not in ("chunks", "links")}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            # Left over from a writer that crashed before publishing
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            os.replace(tmp_dir, generation_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        for path in (self.last_generation_path, self.current_path):
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, "w") as f:
+                f.write(str(generation))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+        self._collect_generations(generation)
+        return generation
+
+    def _collect_generations(self, current: int):
+        """Delete generations older than the last VECTOR_STORE_KEEP_GENERATIONS; the write lock must be held"""
+        # Readers that mapped or are still loading an older generation keep
+        # their open files (POSIX); new loads retry with the current pointer
+        for path in self.generations_dir.iterdir():
+            if path.name.startswith("."):
+                shutil.rmtree(path, ignore_errors=True)  # Abandoned build
+            elif path.name.isdigit() and int(path.name) <= current - max(1, VECTOR_STORE_KEEP_GENERATIONS):
+                shutil.rmtree(path, ignore_errors=True)
+        self._remove_flat_layout()
+
+    def _remove_flat_layout(self):
+        """Delete a pre-generation store once it has been superseded"""
+        for path in (FAISS_INDEX_PATH, VECTOR_METADATA_PATH,
+                     VECTOR_CHUNKS_PATH.with_suffix(".bin"), VECTOR_CHUNKS_PATH.with_suffix(".idx"),
+                     VECTOR_CHUNKS_PATH.with_suffix(".links")):
+            if path.exists():
+                os.remove(path)
+
     def search(self, query_vector: np.ndarray, k: int = 5) -> dict:
         """
         Search for similar vectors in the store
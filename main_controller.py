@@ -1,51 +1,178 @@
 from pathlib import Path
-from typing import Dict, Any, List
-import faiss
-import pickle
-import numpy as np
+from typing import Callable, Dict, Any, List, Optional
+import hashlib
+import json
 import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from config import (
-    OPENAI_API_KEY,
-    FAISS_INDEX_PATH,
-    VECTOR_METADATA_PATH,
-    LLM_MODEL,
-    EMBEDDING_MODEL
+    BUNDLES_DIR, CHUNK_OVERLAP, CHUNK_SIZE, DEDUP_ENABLED, DISTRIBUTED_SEARCH_ENDPOINTS, OCR_ESCALATE_CONFIDENCE,
+    OCR_FIGURES_ON_TEXT_PAGES, OCR_LANGUAGES, OCR_MIN_GLYPH_QUALITY, OCR_MIN_IMAGE_AREA, OCR_MIN_TEXT_DENSITY,
+    OCR_PRESET, PIPELINE_CHECKPOINT_DIR, PIPELINE_CHECKPOINT_TTL, PIPELINE_CHECKPOINTS, PIPELINE_WORKERS,
+    SUMMARY_CACHE_ENABLED, SUMMARY_TREE_ENABLED
 )
+from langgraph_agents.graph_executor import CheckpointStore, Graph, GraphError
+from utils import metrics, profiling, startup_timing
+from utils.admission import GENERATE, INGEST, AdmissionRejected, get_admission_controller
+from utils.chunker import chunk_pages, locate_chunks
+from utils.file_handler import save_temp_pdf
+from utils.hashing import document_id
+from utils.progress import CancellationToken, Cancelled, ProgressTracker
+from utils.single_flight import SingleFlight
 
-# Import agents
-from langgraph_agents.pdf_parser_agent import PDFParserAgent
-from langgraph_agents.ocr_agent import OCRAgent
-from langgraph_agents.collector_agent import CollectorAgent
-from langgraph_agents.embedding_agent import EmbeddingAgent
-from langgraph_agents.vector_store_agent import VectorStoreAgent
-from langgraph_agents.rag_agent import RAGAgent
-from langgraph_agents.summarizer_agent import SummarizerAgent
-from langgraph_agents.router_agent import RouterAgent
+# Agent modules are imported on first use of their stage. Each one pulls in
+# a heavy dependency (fitz, easyocr/torch, faiss, openai), so importing this
+# module stays cheap for CLI tools and tests.
+AGENT_MODULES = {
+    "pdf_parser": ("langgraph_agents.pdf_parser_agent", "PDFParserAgent"),
+    "ocr_agent": ("langgraph_agents.ocr_agent", "OCRAgent"),
+    "collector": ("langgraph_agents.collector_agent", "CollectorAgent"),
+    "embedding_agent": ("langgraph_agents.embedding_agent", "EmbeddingAgent"),
+    "vector_store": ("langgraph_agents.vector_store_agent", "VectorStoreAgent"),
+    "shard_store": ("langgraph_agents.shard_store_agent", "ShardedVectorStoreAgent"),
+    "distributed_store": ("langgraph_agents.distributed_search", "DistributedVectorStore"),
+    "rag_agent": ("langgraph_agents.rag_agent", "RAGAgent"),
+    "summarizer": ("langgraph_agents.summarizer_agent", "SummarizerAgent"),
+    "router": ("langgraph_agents.router_agent", "RouterAgent"),
+    "summary_cache": ("utils.summary_cache", "SummaryCache"),
+    "summary_tree": ("langgraph_agents.summary_tree_agent", "SummaryTreeAgent"),
+}
 
-# Configure OpenAI
-from openai import OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Identical concurrent requests from different sessions share one computation:
+# ingestion by document hash, answers by (store snapshot, question)
+INGEST_FLIGHTS = SingleFlight("ingest")
+ANSWER_FLIGHTS = SingleFlight("answer")
+
+
+def question_key(question: str) -> str:
+    """Questions that differ only in case and whitespace are the same question"""
+    return " ".join(question.split()).casefold()
+
+
+# Bump when ingestion nodes change what they output, so old checkpoints aren't resumed
+INGEST_GRAPH_VERSION = 1
+
+# Error prefix per ingestion node
+NODE_ERRORS = {
+    "parse": "Failed to parse PDF",
+    "route": "Failed to check OCR requirement",
+    "ocr": "OCR processing failed",
+    "embed_text": "Failed to create embeddings",
+    "collect": "Failed to collect text",
+    "embed": "Failed to create embeddings",
+    "store": "Failed to save vectors or metadata",
+}
+
+
+class StageFailed(Exception):
+    """An ingestion node failed with a message to show as it is"""
+
+
+def page_runs(pages: List[Dict], ocr_plan: Dict) -> List[tuple[bool, List[Dict]]]:
+    """Split pages into maximal runs of (needs OCR, pages); chunks never cross a run boundary"""
+    ocr_pages = set(ocr_plan["ocr_pages"])
+    runs = []
+    for page in pages:
+        needs_ocr = page.get("page_num") in ocr_pages
+        if runs and runs[-1][0] == needs_ocr:
+            runs[-1][1].append(page)
+        else:
+            runs.append((needs_ocr, [page]))
+    return runs
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class PDFProcessor:
-    def __init__(self):
-        # Initialize agents
-        self.pdf_parser = PDFParserAgent()
-        self.ocr_agent = OCRAgent()
-        self.collector = CollectorAgent()
-        self.embedding_agent = EmbeddingAgent()
-        self.vector_store = VectorStoreAgent()
-        self.rag_agent = RAGAgent()
-        self.summarizer = SummarizerAgent()
-        self.router = RouterAgent()
+    def __init__(self, user: Optional[str] = None):
+        # Fairness key for admission control (see utils/admission.py)
+        self.user = user
+        # Agents are created lazily, the first time their stage runs
+        self._agents: Dict[str, Any] = {}
+        self._agents_lock = threading.Lock()
+        # Summary trees are built off the request path, one document at a time
+        self._background = None
+        self.summary_tree_jobs: Dict[str, Future] = {}
         
         # Load or initialize FAISS index
         self._initialize_vector_store()
 
+    def _get_agent(self, name: str):
+        """Import and construct an agent on first use, recording its startup cost"""
+        agent = self._agents.get(name)
+        if agent is not None:
+            return agent
+        with self._agents_lock:
+            agent = self._agents.get(name)
+            if agent is None:
+                module_name, class_name = AGENT_MODULES[name]
+                module = startup_timing.import_module_timed(module_name)
+                with startup_timing.timed(class_name, "init"):
+                    agent = getattr(module, class_name)()
+                self._agents[name] = agent
+        return agent
+
+    def _admit(self, kind: str, on_queued: Optional[Callable[[int], None]] = None,
+               cancel_token: Optional[CancellationToken] = None):
+        """Hold an ingestion or generation slot; raises AdmissionRejected when turned away"""
+        return get_admission_controller().admit(kind, self.user, on_queued, cancel_token)
+
+    def _admitted(self, generate: Callable, on_queued: Optional[Callable[[int], None]] = None):
+        """Run a generation while holding a generation slot"""
+        with self._admit(GENERATE, on_queued):
+            return generate()
+
+    @property
+    def pdf_parser(self):
+        return self._get_agent("pdf_parser")
+
+    @property
+    def ocr_agent(self):
+        return self._get_agent("ocr_agent")
+
+    @property
+    def collector(self):
+        return self._get_agent("collector")
+
+    @property
+    def embedding_agent(self):
+        return self._get_agent("embedding_agent")
+
+    @property
+    def vector_store(self):
+        return self._get_agent("vector_store")
+
+    @property
+    def shard_store(self):
+        return self._get_agent("shard_store")
+
+    @property
+    def distributed_store(self):
+        return self._get_agent("distributed_store")
+
+    @property
+    def rag_agent(self):
+        return self._get_agent("rag_agent")
+
+    @property
+    def summarizer(self):
+        return self._get_agent("summarizer")
+
+    @property
+    def router(self):
+        return self._get_agent("router")
+
+    @property
+    def summary_cache(self):
+        return self._get_agent("summary_cache")
+
+    @property
+    def summary_tree(self):
+        return self._get_agent("summary_tree")
+
     def _initialize_vector_store(self):
         """Initialize the vector store agent"""
         try:
@@ -55,95 +182,119 @@ class PDFProcessor:
             logger.error(f"Error initializing vector store: {str(e)}")
             raise
 
-    def process_pdf(self, file_content) -> tuple[bool, str]:
-        """Process a PDF file through sequential agent pipeline
+    def process_pdf(self, file_content, on_queued: Optional[Callable[[int], None]] = None,
+                    on_progress: Optional[Callable[[Dict], None]] = None,
+                    cancel_token: Optional[CancellationToken] = None, profile: bool = False) -> tuple[bool, str]:
+        """Process a PDF file through the ingestion graph of agents
         
         Args:
             file_content: Either bytes or Streamlit UploadedFile object
+            on_queued: Called with the queue position while waiting for an
+                ingestion slot
+            on_progress: Called with a progress dict (stage, done, total,
+                fraction, eta_seconds, counts) as pages are OCR'd and chunks
+                embedded; see utils/progress.py
+            cancel_token: Cancelling it stops the ingestion at the next page
+                or embedding batch, before anything is stored
+            profile: cProfile this request even if PROFILE_REQUESTS is off
+                (see utils/profiling.py)
         
         Returns:
             tuple[bool, str]: (success, error_message)
         """
-        temp_path = Path("temp.pdf")
+        with metrics.start_trace("ingest") as trace, profiling.profiled("ingest", profile):
+            progress = ProgressTracker(on_progress, cancel_token)
+            try:
+                success, error_msg = self._coalesced_process_pdf(file_content, on_queued, trace, progress)
+            except Cancelled as e:
+                logger.info(f"PDF processing cancelled: {e}")
+                trace.status = "cancelled"
+                return False, "Processing cancelled"
+            if not success:
+                trace.status = "error"
+                trace.attrs["error"] = error_msg
+            return success, error_msg
+
+    def _coalesced_process_pdf(self, file_content, on_queued, trace, progress: ProgressTracker) -> tuple[bool, str]:
+        """Ingest, sharing the work of a concurrent ingestion of the same bytes"""
+        # Validate input
+        if not file_content:
+            return False, "Empty file content provided"
+        try:
+            # Handle both bytes and UploadedFile
+            if hasattr(file_content, 'read'):
+                # It's an UploadedFile, read its bytes
+                content = file_content.read()
+                # Reset the file pointer for potential future reads
+                file_content.seek(0)
+            else:
+                # It's already bytes
+                content = file_content
+        except Exception as e:
+            return False, f"Failed to read file: {str(e)}"
+        
+        trace.attrs["doc_id"] = document_id(content)
+        # Only the first of several concurrent uploads of a document runs the pipeline;
+        # if its session goes away, the others run it themselves
+        (success, error_msg), shared = INGEST_FLIGHTS.do(
+            trace.attrs["doc_id"], self._admitted_process_pdf, content, getattr(file_content, "name", None),
+            on_queued, progress
+        )
+        trace.attrs["coalesced"] = shared
+        if success:
+            progress.finish()
+        return success, error_msg
+
+    def _admitted_process_pdf(self, content: bytes, name: Optional[str], on_queued, progress: ProgressTracker) -> tuple[bool, str]:
+        try:
+            with self._admit(INGEST, on_queued, progress.token):
+                return self._process_pdf(content, name, progress)
+        except AdmissionRejected as e:
+            return False, f"{str(e)}. Please try again shortly."
+
+    def _process_pdf(self, content: bytes, name: Optional[str] = None, progress: Optional[ProgressTracker] = None) -> tuple[bool, str]:
+        """Run the ingestion graph, resuming from the checkpoints of an earlier failed attempt"""
+        progress = progress or ProgressTracker()
+        temp_path = None
         try:
             # Validate input
-            if not file_content:
+            if not content:
                 return False, "Empty file content provided"
 
             # Save temporary file
             try:
-                # Handle both bytes and UploadedFile
-                if hasattr(file_content, 'read'):
-                    # It's an UploadedFile, read its bytes
-                    content = file_content.read()
-                    # Reset the file pointer for potential future reads
-                    file_content.seek(0)
-                else:
-                    # It's already bytes
-                    content = file_content
-                    
-                temp_path.write_bytes(content)
+                # A private temp file per request, so concurrent uploads don't collide
+                temp_path = save_temp_pdf(content)
                 pdf_path = str(temp_path)
             except Exception as e:
                 return False, f"Failed to save temporary file: {str(e)}"
 
-            # Step 1: Parse PDF
-            logger.info("Parsing PDF...")
-            try:
-                pages, error_msg = self.pdf_parser.process(pdf_path)
-                if error_msg:
-                    logger.error(f"PDF parsing error: {error_msg}")
-                    return False, error_msg
-            except Exception as e:
-                return False, f"Failed to parse PDF: {str(e)}"
-
-            # Step 2: Check if OCR is needed
+            # Vectors from another embedding model can't be searched together with the stored ones
             try:
-                needs_ocr = self.router.check_needs_ocr(pdf_path)
-            except Exception as e:
-                return False, f"Failed to check OCR requirement: {str(e)}"
-            
-            # Step 3: Apply OCR if needed
-            ocr_text = ""
-            if needs_ocr:
-                logger.info("Performing OCR...")
-                try:
-                    ocr_text = self.ocr_agent.process(pages)
-                except Exception as e:
-                    return False, f"OCR processing failed: {str(e)}"
-
-            # Step 4: Collect and merge text
-            logger.info("Collecting text...")
-            try:
-                state = {
-                    "pdf_path": pdf_path,
-                    "pages": pages,
-                    "ocr_text": ocr_text
-                }
-                combined_text = self.collector.merge(state)
-                if not combined_text.strip():
-                    return False, "No text content could be extracted from the PDF"
-            except Exception as e:
-                return False, f"Failed to collect text: {str(e)}"
-
-            # Step 5: Create embeddings
-            logger.info("Creating embeddings...")
-            try:
-                embeddings, chunks, texts = self.embedding_agent.create(combined_text)
+                model_id = self.embedding_agent.model_id
+                stored_model = self.vector_store.embedding_model
             except Exception as e:
                 return False, f"Failed to create embeddings: {str(e)}"
+            if stored_model and stored_model != model_id:
+                return False, (
+                    f"Vector store was built with embedding model {stored_model}, "
+                    f"but the current backend is {model_id}. Clear the vector store "
+                    f"or switch EMBEDDING_BACKEND back."
+                )
 
-            # Step 6: Store vectors and original text
-            logger.info("Storing vectors...")
+            doc_id = document_id(content)
+            checkpoints = self._checkpoints(doc_id, model_id)
+            graph = self._ingest_graph(pdf_path, doc_id, name, model_id, progress)
             try:
-                # Store the full text in vector store's metadata
-                self.vector_store.metadata["full_text"] = combined_text
-                
-                store_success = self.vector_store.store(embeddings, chunks, texts)
-                if not store_success:
-                    return False, "Failed to store vectors in the database"
-            except Exception as e:
-                return False, f"Failed to save vectors or metadata: {str(e)}"
+                # Progress of the worker threads is reported from this thread, where the caller's UI runs
+                graph.run(checkpoints, max_workers=PIPELINE_WORKERS, on_wait=progress.flush)
+            except GraphError as e:
+                if isinstance(e.error, StageFailed):
+                    return False, str(e.error)
+                logger.error(f"Ingestion node {e.node} failed: {str(e.error)}")
+                return False, f"{NODE_ERRORS[e.node]}: {str(e.error)}"
+            if checkpoints is not None:
+                checkpoints.clear()
 
             logger.info("PDF processing complete")
             return True, ""
@@ -155,47 +306,514 @@ class PDFProcessor:
         finally:
             # Always cleanup temp file
             try:
-                if temp_path.exists():
+                if temp_path is not None and temp_path.exists():
                     temp_path.unlink()
             except Exception as e:
                 logger.warning(f"Failed to cleanup temporary file: {str(e)}")
 
-    def generate_summary(self) -> str:
-        """Generate a summary of the document"""
+    def _checkpoints(self, doc_id: str, model_id: str) -> Optional[CheckpointStore]:
+        """Checkpoint directory of this document under the current ingestion settings"""
+        if not PIPELINE_CHECKPOINTS:
+            return None
+        CheckpointStore.prune(PIPELINE_CHECKPOINT_DIR, PIPELINE_CHECKPOINT_TTL)
+        # Checkpoints made with other settings would resume into a different result
+        settings = {
+            "version": INGEST_GRAPH_VERSION,
+            "model": model_id,
+            "ocr": [OCR_PRESET, OCR_LANGUAGES, OCR_ESCALATE_CONFIDENCE, OCR_MIN_TEXT_DENSITY,
+                    OCR_MIN_GLYPH_QUALITY, OCR_MIN_IMAGE_AREA, OCR_FIGURES_ON_TEXT_PAGES],
+            "chunks": [CHUNK_SIZE, CHUNK_OVERLAP],
+        }
+        fingerprint = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        return CheckpointStore(PIPELINE_CHECKPOINT_DIR / f"{doc_id}-{fingerprint}")
+
+    def _ingest_graph(self, pdf_path: str, doc_id: str, name: Optional[str], model_id: str,
+                      progress: ProgressTracker) -> Graph:
+        """
+        Ingestion as a graph of agent nodes
+
+            parse ──────────┬──────────────┬─> collect ─┐
+            route ─┬─> ocr ─┼──────────────┘            ├─> embed ─> store
+                   └────────┴─> embed_text ─────────────┘
+
+        Parsing and OCR routing run together, and the runs of pages that
+        need no OCR are chunked and embedded while OCR reads the others.
+        """
+        graph = Graph("ingest")
+
+        def parse():
+            logger.info("Parsing PDF...")
+            progress.start("parse")
+            with metrics.span("parse", bytes=os.path.getsize(pdf_path)) as span:
+                pages, error_msg = self.pdf_parser.process(pdf_path)
+                span.set(pages=len(pages))
+            if error_msg:
+                logger.error(f"PDF parsing error: {error_msg}")
+                raise StageFailed(error_msg)
+            progress.advance(stage="parse")
+            return pages
+
+        def route():
+            # Plan which pages and image regions need OCR
+            progress.start("route")
+            with metrics.span("route") as span:
+                ocr_plan = self.router.plan_ocr(pdf_path)
+                span.set(
+                    pages=len(ocr_plan["pages"]),
+                    ocr_pages=len(ocr_plan["ocr_pages"]),
+                    ocr_regions=ocr_plan["regions"],
+                    skipped_regions=sum(len(page["skipped_regions"]) for page in ocr_plan["pages"])
+                )
+            progress.advance(stage="route", pages=len(ocr_plan["pages"]))
+            return ocr_plan
+
+        def ocr(route):
+            # OCR only the planned regions
+            if not route["ocr_pages"]:
+                return {}
+            logger.info(f"Performing OCR on {len(route['ocr_pages'])} pages...")
+            with metrics.span("ocr", pages=len(route["ocr_pages"]), regions=route["regions"]) as span:
+                ocr_stats = {}
+                ocr_pages = self.ocr_agent.process_plan(pdf_path, route, stats=ocr_stats, progress=progress)
+                span.set(
+                    bytes=sum(len(text.encode("utf-8")) for text in ocr_pages.values()),
+                    megapixels=round(ocr_stats["megapixels"], 3),
+                    ocr_megapixels=round(ocr_stats["ocr_megapixels"], 3),
+                    languages=";".join(ocr_stats["languages"]),
+                    escalations=ocr_stats["escalations"]
+                )
+            return ocr_pages
+
+        def embed_text(parse, route):
+            # Page runs that need no OCR don't have to wait for it
+            logger.info("Creating embeddings...")
+            runs = page_runs(parse, route)
+            return {
+                index: self._embed_run(pages, {}, route, progress)
+                for index, (needs_ocr, pages) in enumerate(runs) if not needs_ocr
+            }
+
+        def collect(parse, route, ocr):
+            logger.info("Collecting text...")
+            progress.start("collect")
+            with metrics.span("collect", pages=len(parse)) as span:
+                state = {"pages": parse, "ocr_pages": ocr, "ocr_plan": route}
+                combined_text = self.collector.merge(state)
+                span.set(bytes=len(combined_text.encode("utf-8")))
+            if not combined_text.strip():
+                raise StageFailed("No text content could be extracted from the PDF")
+            progress.advance(stage="collect")
+            return {"text": combined_text, "page_map": state.get("page_map")}
+
+        def embed(parse, route, ocr, collect, embed_text):
+            # Embed the runs of OCR'd pages, then put all chunks back in page order
+            chunks, vectors = [], []
+            for index, (needs_ocr, pages) in enumerate(page_runs(parse, route)):
+                run_chunks, run_vectors = embed_text[index] if not needs_ocr else self._embed_run(pages, ocr, route, progress)
+                chunks.extend(run_chunks)
+                vectors.extend(run_vectors)
+            if not vectors:
+                raise ValueError("Failed to generate any valid embeddings")
+            import numpy as np  # Loaded with the embedding agent anyway; keeps this module's import cheap
+            return np.array(vectors, dtype=np.float32), chunks
+
+        def store(collect, embed):
+            # Past this point the ingestion is no longer cancelled
+            logger.info("Storing vectors...")
+            embeddings, chunks = embed
+            combined_text = collect["text"]
+            progress.start("store", chunks=len(chunks))
+            offsets = locate_chunks(combined_text, chunks)
+            # Re-uploading an indexed document (every Streamlit rerun) stores the same chunks again
+            unchanged = self.shard_store.has_chunks(doc_id, chunks, model_id)
+            with metrics.span("store", chunks=len(chunks)) as span:
+                # Store the full text in vector store's metadata
+                self.vector_store.metadata["full_text"] = combined_text
+                
+                store_success = self.vector_store.store(
+                    embeddings, chunks, [combined_text] * len(chunks), model_id=model_id,
+                    pages=chunk_pages(offsets, collect["page_map"])
+                )
+                span.set(bytes=int(getattr(embeddings, "nbytes", 0)))
+            if not store_success:
+                raise StageFailed("Failed to store vectors in the database")
+            
+            # Keep a per-document shard for multi-document queries
+            # Near-duplicate chunks share a cluster id so multi-document search can collapse them
+            clusters = self.vector_store.cluster_ids(chunks) if DEDUP_ENABLED else None
+            if not self.shard_store.add_document(
+                doc_id, embeddings, chunks, model_id, name=name, clusters=clusters,
+                text=combined_text, offsets=offsets, page_map=collect["page_map"]
+            ):
+                logger.warning("Failed to store document shard; multi-document queries will not include it")
+            
+            # Summaries of an earlier indexing of this text are regenerated on request
+            if not unchanged:
+                self.summary_cache.invalidate(document_id(combined_text.encode("utf-8")))
+            
+            if SUMMARY_TREE_ENABLED and self._needs_summary_tree(doc_id, model_id, unchanged):
+                self._schedule_summary_tree(doc_id, chunks, model_id)
+            progress.advance(stage="store")
+
+        graph.add_node("parse", parse)
+        graph.add_node("route", route)
+        graph.add_node("ocr", ocr, deps=("route",))
+        graph.add_node("embed_text", embed_text, deps=("parse", "route"))
+        graph.add_node("collect", collect, deps=("parse", "route", "ocr"))
+        graph.add_node("embed", embed, deps=("parse", "route", "ocr", "collect", "embed_text"))
+        # Storing is the commit point; it is never skipped on a retry
+        graph.add_node("store", store, deps=("collect", "embed"), checkpoint=False)
+        return graph
+
+    def _embed_run(self, pages: List[Dict], ocr_pages: Dict[int, str], ocr_plan: Dict,
+                   progress: ProgressTracker) -> tuple[List[str], List]:
+        """Chunk and embed the collected text of a run of pages; returns (chunks, vectors)"""
+        text = self.collector.merge({"pages": pages, "ocr_pages": ocr_pages, "ocr_plan": ocr_plan})
+        chunks = self.embedding_agent.chunk(text) if text.strip() else []
+        if not chunks:
+            return [], []
+        deduplicator = self.vector_store if DEDUP_ENABLED else None
+        return chunks, self.embedding_agent.embed_chunks(chunks, deduplicator=deduplicator, progress=progress)
+
+    def _needs_summary_tree(self, doc_id: str, model_id: str, unchanged: bool) -> bool:
+        """Whether to (re)build a document's summary tree; an unchanged document keeps its tree"""
+        if not unchanged:
+            return True
+        job = self.summary_tree_jobs.get(doc_id)
+        if job is not None and not job.done():
+            return False
+        return not self.summary_tree.has_tree(doc_id, model_id)
+
+    def _schedule_summary_tree(self, doc_id: str, chunks: List[str], model_id: str) -> Future:
+        """Build a document's summary tree in the background; answers use it once it is stored"""
+        with self._agents_lock:
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary-tree")
+        
+        def build():
+            with metrics.start_trace("summary_tree", chunks=len(chunks)):
+                return self.summary_tree.build(doc_id, chunks, model_id)
+        
+        future = self._background.submit(build)
+        self.summary_tree_jobs[doc_id] = future
+        return future
+
+    def wait_for_background(self, timeout: Optional[float] = None):
+        """Wait for scheduled summary tree builds to finish"""
+        for future in list(self.summary_tree_jobs.values()):
+            future.result(timeout)
+
+    def _summary_tree_for_answers(self):
+        """The summary tree to search with the chunks, or None when disabled or unavailable"""
+        if not SUMMARY_TREE_ENABLED:
+            return None
         try:
-            logger.info("Generating document summary...")
+            return self.summary_tree
+        except Exception as e:
+            logger.warning(f"Summary tree unavailable, answering from chunks only: {str(e)}")
+            return None
+
+    def generate_summary(self, length: str = "long", on_queued: Optional[Callable[[int], None]] = None) -> str:
+        """Generate a summary of the document
+        
+        Summaries are cached per (document, summarizer settings, model), so
+        repeat requests don't call the LLM (nor wait for a generation slot).
+        
+        Args:
+            length: "long" or "short"
+            on_queued: Called with the queue position while waiting for a
+                generation slot
+        """
+        try:
+            logger.info(f"Generating {length} document summary...")
             # Get text from vector store's metadata
             full_text = self.vector_store.metadata.get("full_text", "")
             if not full_text:
                 logger.warning("No text found in vector store metadata")
                 return "No document content available for summarization."
                 
-            summary = self.summarizer.summarize(full_text)
+            with metrics.start_trace("summary", length=length) as trace:
+                if not SUMMARY_CACHE_ENABLED:
+                    with self._admit(GENERATE, on_queued):
+                        return self.summarizer.summarize(full_text, length)
+                doc_hash = document_id(full_text.encode("utf-8"))
+                config, model_id = self.summarizer.config(length), self.summarizer.model_id
+                with metrics.span("summary_cache") as span:
+                    summary = self.summary_cache.get(doc_hash, config, model_id)
+                    span.set(cache_hits=int(summary is not None))
+                if summary is None:
+                    try:
+                        # Concurrent requests for the same summary wait for one generation
+                        summary, shared = ANSWER_FLIGHTS.do(
+                            ("summary", doc_hash, length, model_id), self._admitted,
+                            lambda: self.summarizer.create(full_text, length), on_queued
+                        )
+                    except AdmissionRejected:
+                        raise
+                    except Exception as e:
+                        logger.error(f"Error generating summary: {str(e)}")
+                        return self.summarizer.error_message(e)
+                    trace.attrs["coalesced"] = shared
+                    if not shared:
+                        self.summary_cache.put(doc_hash, config, model_id, summary)
             return summary
+        except AdmissionRejected as e:
+            return f"{str(e)}. Please try again shortly."
         except Exception as e:
             logger.error(f"Error generating summary: {str(e)}")
             return "Error generating summary. Please try again."
 
-    def answer_question(self, question: str) -> str:
-        """Answer a question using RAG"""
+    def summary_artifact(self, length: str = "long", fmt: str = "md") -> Optional[Path]:
+        """Downloadable summary file for the current document
+        
+        Args:
+            length: "long" or "short"
+            fmt: "md" or "txt"
+        
+        Returns:
+            Path of the file, generated from the cached summary, or None if
+            the summary hasn't been generated (or caching is off)
+        """
+        try:
+            full_text = self.vector_store.metadata.get("full_text", "")
+            if not full_text or not SUMMARY_CACHE_ENABLED:
+                return None
+            doc_hash = document_id(full_text.encode("utf-8"))
+            return self.summary_cache.artifact(doc_hash, self.summarizer.config(length), self.summarizer.model_id, fmt)
+        except Exception as e:
+            logger.error(f"Error preparing summary download: {str(e)}")
+            return None
+
+    def answer_question(self, question: str, on_queued: Optional[Callable[[int], None]] = None,
+                        profile: bool = False) -> str:
+        """Answer a question using RAG
+        
+        Args:
+            question: The question
+            on_queued: Called with the queue position while waiting for a
+                generation slot
+            profile: cProfile this request even if PROFILE_REQUESTS is off
+        """
         try:
             logger.info(f"Answering question: {question}")
+            if DISTRIBUTED_SEARCH_ENDPOINTS:
+                # Scatter the query to the partition workers instead of the local store
+                with metrics.start_trace("answer", partitions=len(DISTRIBUTED_SEARCH_ENDPOINTS)) as trace:
+                    answer, trace.attrs["coalesced"] = ANSWER_FLIGHTS.do(
+                        ("distributed", question_key(question)), self._admitted,
+                        lambda: self.rag_agent.answer_from_store(question, self.distributed_store), on_queued
+                    )
+                    return answer
+            # Pick up documents another process has indexed since we loaded
+            self.vector_store.refresh()
             if self.vector_store.index is None:
                 return "No document has been processed yet. Please upload a document first."
-            answer = self.rag_agent.answer(question, self.vector_store.index, self.vector_store.metadata)
+            with metrics.start_trace("answer") as trace, profiling.profiled("answer", profile) as profiler:
+                if profiler is not None:
+                    # Name the profile after the document being asked about
+                    trace.attrs["doc_id"] = document_id(self.vector_store.metadata.get("full_text", "").encode("utf-8"))
+                # Sessions on the same store snapshot asking the same question share one answer
+                answer, trace.attrs["coalesced"] = ANSWER_FLIGHTS.do(
+                    (self.vector_store.generation, self.vector_store.index.ntotal, question_key(question)), self._admitted,
+                    lambda: self.rag_agent.answer(
+                        question, self.vector_store.index, self.vector_store.metadata,
+                        summary_tree=self._summary_tree_for_answers()
+                    ), on_queued
+                )
             return answer
+        except AdmissionRejected as e:
+            return f"{str(e)}. Please try again shortly."
         except Exception as e:
             logger.error(f"Error answering question: {str(e)}")
             return "Error answering question. Please try again."
 
+    def answer_questions(self, questions: List[str], on_queued: Optional[Callable[[int], None]] = None) -> List[Dict[str, str]]:
+        """Answer a checklist of questions in one batch
+        
+        The whole batch holds one generation slot; its generations are
+        parallelised within it (RAG_BATCH_CONCURRENCY).
+        
+        Args:
+            questions: Questions to answer
+            on_queued: Called with the queue position while waiting for a
+                generation slot
+        
+        Returns:
+            List of {"question", "answer"} dicts in the same order as ``questions``
+        """
+        try:
+            logger.info(f"Answering {len(questions)} questions")
+            self.vector_store.refresh()
+            if self.vector_store.index is None:
+                answers = ["No document has been processed yet. Please upload a document first."] * len(questions)
+            else:
+                with metrics.start_trace("answer_batch", questions=len(questions)), self._admit(GENERATE, on_queued):
+                    answers = self.rag_agent.answer_batch(
+                        questions, self.vector_store.index, self.vector_store.metadata,
+                        summary_tree=self._summary_tree_for_answers()
+                    )
+        except AdmissionRejected as e:
+            answers = [f"{str(e)}. Please try again shortly."] * len(questions)
+        except Exception as e:
+            logger.error(f"Error answering questions: {str(e)}")
+            answers = ["Error answering question. Please try again."] * len(questions)
+        return [{"question": question, "answer": answer} for question, answer in zip(questions, answers)]
+
+    def list_documents(self) -> List[Dict]:
+        """Documents available for multi-document queries, newest first"""
+        try:
+            return self.shard_store.list_documents()
+        except Exception as e:
+            logger.error(f"Error listing documents: {str(e)}")
+            return []
+
+    def query_documents(self, question: str, doc_ids: List[str], k: int = 5,
+                        on_queued: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+        """Ask one question across several documents
+        
+        Args:
+            question: The question
+            doc_ids: Ids of the documents to search (see list_documents)
+            k: Evidence chunks to keep per document
+            on_queued: Called with the queue position while waiting for a
+                generation slot
+        
+        Returns:
+            Dict with "answer", ranked "evidence" across all documents,
+            "by_document" evidence and per-document "errors"
+        """
+        try:
+            logger.info(f"Querying {len(doc_ids)} documents: {question}")
+            with metrics.start_trace("multi_document", documents=len(doc_ids)) as trace:
+                response, trace.attrs["coalesced"] = ANSWER_FLIGHTS.do(
+                    ("documents", tuple(sorted(doc_ids)), k, question_key(question)), self._admitted,
+                    lambda: self._query_documents(question, doc_ids, k), on_queued
+                )
+            # Each caller gets its own copy of the shared result
+            return {key: value.copy() if hasattr(value, "copy") else value for key, value in response.items()}
+        except AdmissionRejected as e:
+            return {"answer": f"{str(e)}. Please try again shortly.", "evidence": [], "by_document": {}, "errors": {}}
+        except Exception as e:
+            logger.error(f"Error querying documents: {str(e)}")
+            return {"answer": "Error answering question. Please try again.", "evidence": [], "by_document": {}, "errors": {}}
+
+    def _query_documents(self, question: str, doc_ids: List[str], k: int) -> Dict[str, Any]:
+        with metrics.span("retrieve", documents=len(doc_ids)) as span:
+            backend = self.embedding_agent.backend
+            query_vector = backend.embed_query(question)
+            result = self.shard_store.search(query_vector, doc_ids, k=k * len(doc_ids), model_id=backend.model_id)
+            span.set(chunks=len(result["results"]))
+        if not result["success"]:
+            return {"answer": f"Failed to retrieve relevant context: {result['error']}", "evidence": [], "by_document": {}, "errors": {}}
+        
+        hits = [((hit["doc_id"], hit["position"]), hit["chunk"]) for hit in result["results"]]
+        answer = self.rag_agent.answer_from_hits(question, hits, neighbors=self.shard_store.neighbors) if hits else "No relevant information found in the selected documents."
+        
+        evidence = [dict(hit, distance=distance) for hit, distance in zip(result["results"], result["distances"])]
+        by_document = {doc_id: hits[:k] for doc_id, hits in result["by_document"].items()}
+        return {"answer": answer, "evidence": evidence, "by_document": by_document, "errors": result["errors"]}
+
+    def export_document(self, doc_id: str, output_path: Optional[str] = None) -> Optional[Path]:
+        """Write a processed document as a portable bundle
+        
+        Args:
+            doc_id: Id from list_documents
+            output_path: Bundle file; defaults to OUTPUTS_DIR/bundles/<doc_id>.pdfbundle
+        
+        Returns:
+            Path of the bundle, or None on failure
+        """
+        from utils.document_bundle import BUNDLE_SUFFIX, write_bundle
+
+        try:
+            document = self.shard_store.get_document(doc_id)
+            if document is None:
+                raise ValueError(f"Unknown document: {doc_id}")
+            text = document.get("text") or ""
+            bundle = {
+                "doc_id": doc_id,
+                "name": document["manifest"].get("name"),
+                "embedding_model": document["embedding_model"],
+                "vectors": document["vectors"],
+                "chunks": document["chunks"],
+                "offsets": document.get("offsets"),
+                "text": text,
+                "page_map": document.get("page_map"),
+                "summaries": self.summary_cache.entries(document_id(text.encode("utf-8"))) if text else [],
+            }
+            if SUMMARY_TREE_ENABLED:
+                bundle["tree_nodes"], bundle["tree_vectors"] = self.summary_tree.nodes_for(doc_id)
+            path = Path(output_path) if output_path else BUNDLES_DIR / f"{doc_id}{BUNDLE_SUFFIX}"
+            with metrics.start_trace("export", chunks=len(bundle["chunks"])):
+                write_bundle(path, bundle)
+            logger.info(f"Exported {doc_id} to {path}")
+            return path
+        except Exception as e:
+            logger.error(f"Error exporting document {doc_id}: {str(e)}")
+            return None
+
+    def import_document(self, bundle_path: str) -> tuple[bool, str]:
+        """Attach a bundle from export_document to this store without re-embedding
+        
+        Returns:
+            tuple[bool, str]: (success, error_message)
+        """
+        from utils.document_bundle import read_bundle
+
+        try:
+            bundle = read_bundle(bundle_path)
+        except Exception as e:
+            return False, f"Failed to read bundle: {str(e)}"
+        doc_id, model_id, chunks = bundle["doc_id"], bundle["embedding_model"], bundle["chunks"]
+        try:
+            stored_model = self.vector_store.embedding_model
+            if stored_model and stored_model != model_id:
+                return False, f"Bundle was embedded with {model_id}, but the vector store uses {stored_model}"
+            if self.embedding_agent.model_id != model_id:
+                return False, f"Bundle was embedded with {model_id}, but the current backend is {self.embedding_agent.model_id}"
+            
+            with metrics.start_trace("import", chunks=len(chunks)):
+                unchanged = self.shard_store.has_chunks(doc_id, chunks, model_id)
+                with metrics.span("store", chunks=len(chunks)) as span:
+                    text = bundle["text"]
+                    self.vector_store.metadata["full_text"] = text
+                    pages = chunk_pages(bundle["offsets"], bundle["page_map"])
+                    if not self.vector_store.store(bundle["vectors"], chunks, [text] * len(chunks), model_id=model_id, pages=pages):
+                        return False, "Failed to store vectors in the database"
+                    clusters = self.vector_store.cluster_ids(chunks) if DEDUP_ENABLED else None
+                    if not self.shard_store.add_document(
+                        doc_id, bundle["vectors"], chunks, model_id, name=bundle["name"], clusters=clusters,
+                        text=text, offsets=bundle["offsets"], page_map=bundle["page_map"]
+                    ):
+                        logger.warning("Failed to store document shard; multi-document queries will not include it")
+                    span.set(bytes=int(bundle["vectors"].nbytes))
+                
+                doc_hash = document_id(text.encode("utf-8"))
+                self.summary_cache.invalidate(doc_hash)
+                for entry in bundle["summaries"]:
+                    self.summary_cache.put(doc_hash, entry["config"], entry["model"], entry["summary"])
+                if SUMMARY_TREE_ENABLED:
+                    if bundle["tree_nodes"]:
+                        self.summary_tree.add_nodes(doc_id, bundle["tree_nodes"], bundle["tree_vectors"], model_id)
+                    elif self._needs_summary_tree(doc_id, model_id, unchanged):
+                        self._schedule_summary_tree(doc_id, chunks, model_id)
+            logger.info(f"Imported {doc_id} ({len(chunks)} chunks) from {bundle_path}")
+            return True, ""
+        except Exception as e:
+            logger.error(f"Error importing bundle {bundle_path}: {str(e)}")
+            return False, f"Failed to import bundle: {str(e)}"
+
     def clear_vector_store(self):
         """Clear the vector store"""
         try:
             logger.info("Clearing vector store...")
-            if Path(FAISS_INDEX_PATH).exists():
-                Path(FAISS_INDEX_PATH).unlink()
-            if Path(VECTOR_METADATA_PATH).exists():
-                Path(VECTOR_METADATA_PATH).unlink()
+            self.vector_store.clear()
+            self.shard_store.clear()
+            self.summary_cache.clear()
+            if SUMMARY_TREE_ENABLED:
+                self.summary_tree.clear()
+            # Drop the loaded store so the next access starts empty
+            self._agents.pop("vector_store", None)
             self._initialize_vector_store()
             logger.info("Vector store cleared successfully")
         except Exception as e:
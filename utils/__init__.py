@@ -1,12 +1,25 @@
-from .file_handler import is_valid_pdf, save_temp_pdf
-from .image_detector import detect_images_in_pdf
-from .chunker import chunk_text
-from .logger import setup_logger
-
-__all__ = [
-    'is_valid_pdf',
-    'save_temp_pdf',
-    'detect_images_in_pdf',
-    'chunk_text',
-    'setup_logger'
-]
+import importlib
+
+# Exports are resolved lazily so that importing a single helper module
+# (e.g. utils.startup_timing) does not pull in fitz or python-magic.
+_EXPORTS = {
+    'is_valid_pdf': '.file_handler',
+    'save_temp_pdf': '.file_handler',
+    'detect_images_in_pdf': '.image_detector',
+    'chunk_text': '.chunker',
+    'setup_logger': '.logger',
+    'results_to_csv': '.qa_export',
+    'results_to_json': '.qa_export',
+    'document_id': '.hashing',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,270 @@
+"""
+Admission control for ingestion and generation requests
+
+Every Streamlit session runs its requests in its own thread, so without a
+gate a burst of uploads oversubscribes the CPU (OCR, parsing) and the model
+API for everyone. ``AdmissionController`` caps how many ingestions and
+generations run at once and queues the rest:
+
+- ingestions never use the last ``reserved_interactive`` slots, so Q&A and
+  summaries are admitted even while uploads fill the bulk capacity;
+- waiting generations are always admitted before waiting ingestions;
+- within a kind, waiting requests are served round-robin per user, so one
+  user's batch of uploads doesn't starve everyone else;
+- callers are told their queue position while they wait, and requests
+  beyond ``max_queue`` waiting per kind are rejected immediately.
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from utils import metrics
+from utils.progress import CancellationToken
+
+# Request kinds
+INGEST = "ingest"
+GENERATE = "generate"
+
+KINDS = (GENERATE, INGEST)  # Dispatch order: interactive work first
+
+ANONYMOUS = "anonymous"
+
+
+class AdmissionRejected(Exception):
+    """The request was turned away (queue full or waited too long)"""
+
+
+class Ticket:
+    """A request waiting for, or holding, a slot"""
+
+    def __init__(self, kind: str, user: str, sequence: int):
+        self.kind = kind
+        self.user = user
+        self.sequence = sequence
+        self.admitted = False
+        self.enqueued_at = time.monotonic()
+        self.wait_seconds = 0.0
+        self.position = 0
+
+
+class AdmissionController:
+    """Caps concurrent requests and queues the rest fairly per user"""
+
+    def __init__(
+        self,
+        max_active: int,
+        max_ingestions: int,
+        max_generations: int,
+        reserved_interactive: int = 0,
+        max_queue: int = 32,
+        queue_timeout: Optional[float] = None,
+    ):
+        self.max_active = max(1, max_active)
+        self.max_ingestions = max(1, max_ingestions)
+        self.max_generations = max(1, max_generations)
+        # Ingestion always keeps at least one slot
+        self.reserved_interactive = min(max(0, reserved_interactive), self.max_active - 1)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        # Per kind: user -> waiting tickets, users in round-robin order
+        self._queues: Dict[str, "OrderedDict[str, deque]"] = {kind: OrderedDict() for kind in KINDS}
+        self._active = {kind: 0 for kind in KINDS}
+        self._counters = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "wait_seconds": 0.0}
+
+    def _has_capacity(self, kind: str) -> bool:
+        total = sum(self._active.values())
+        if kind == GENERATE:
+            return self._active[GENERATE] < self.max_generations and total < self.max_active
+        return self._active[INGEST] < self.max_ingestions and total < self.max_active - self.reserved_interactive
+
+    def _waiting(self, kind: str) -> int:
+        return sum(len(tickets) for tickets in self._queues[kind].values())
+
+    def _order(self, kind: str) -> List[Ticket]:
+        """Waiting tickets of a kind in the order they will be admitted"""
+        queues = [list(tickets) for tickets in self._queues[kind].values()]
+        order = []
+        for round_ in range(max((len(tickets) for tickets in queues), default=0)):
+            order.extend(tickets[round_] for tickets in queues if round_ < len(tickets))
+        return order
+
+    def _dispatch(self):
+        """Admit waiting tickets while there is capacity (called with the lock held)"""
+        admitted = False
+        for kind in KINDS:
+            queues = self._queues[kind]
+            while queues and self._has_capacity(kind):
+                user, tickets = queues.popitem(last=False)
+                ticket = tickets.popleft()
+                if tickets:
+                    # The user goes to the back of the rotation
+                    queues[user] = tickets
+                self._admit(ticket)
+                admitted = True
+        if admitted:
+            self._cond.notify_all()
+
+    def _admit(self, ticket: Ticket):
+        ticket.admitted = True
+        ticket.wait_seconds = time.monotonic() - ticket.enqueued_at
+        self._active[ticket.kind] += 1
+        self._counters["admitted"] += 1
+        self._counters["wait_seconds"] += ticket.wait_seconds
+
+    def _remove(self, ticket: Ticket):
+        queues = self._queues[ticket.kind]
+        tickets = queues.get(ticket.user)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del queues[ticket.user]
+
+    def acquire(
+        self,
+        kind: str,
+        user: Optional[str] = None,
+        on_queued: Optional[Callable[[int], None]] = None,
+        timeout: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None,
+    ) -> Ticket:
+        """
+        Wait for a slot
+
+        Args:
+            kind: INGEST or GENERATE
+            user: Fairness key; requests of different users are interleaved
+            on_queued: Called with the 1-based queue position whenever it
+                changes while waiting (never called if admitted at once)
+            timeout: Seconds to wait; defaults to the controller's queue_timeout
+            cancel_token: Leaves the queue when cancelled
+
+        Returns:
+            The admitted ticket; pass it to release()
+
+        Raises:
+            AdmissionRejected: the queue is full or the wait timed out
+            Cancelled: the token was cancelled while waiting
+        """
+        if kind not in self._queues:
+            raise ValueError(f"Unknown request kind: {kind}")
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._cond:
+            ticket = Ticket(kind, user or ANONYMOUS, next(self._sequence))
+            if not self._queues[kind] and self._has_capacity(kind):
+                self._admit(ticket)
+                return ticket
+            if self._waiting(kind) >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise AdmissionRejected(f"Server busy: {self._waiting(kind)} {kind} requests already waiting")
+            self._queues[kind].setdefault(ticket.user, deque()).append(ticket)
+            self._counters["queued"] += 1
+            self._dispatch()
+
+        reported = None
+        try:
+            while True:
+                with self._cond:
+                    if not ticket.admitted:
+                        ticket.position = self._order(kind).index(ticket) + 1
+                        remaining = deadline - time.monotonic() if deadline else None
+                        if remaining is not None and remaining <= 0:
+                            self._counters["timed_out"] += 1
+                            raise AdmissionRejected(f"Timed out after {timeout:.0f}s in the {kind} queue")
+                    if ticket.admitted:
+                        return ticket
+                    position = ticket.position
+                if cancel_token is not None:
+                    cancel_token.check()
+                # Report outside the lock: the callback may render UI
+                if on_queued and position != reported:
+                    on_queued(position)
+                    reported = position
+                with self._cond:
+                    if not ticket.admitted:
+                        self._cond.wait(min(remaining, 1.0) if remaining is not None else 1.0)
+        except BaseException:
+            # Timed out, cancelled, or the caller's thread is being stopped: give up the place or slot
+            with self._cond:
+                self._remove(ticket)
+            self.release(ticket)
+            raise
+
+    def release(self, ticket: Ticket):
+        """Free an admitted ticket's slot and admit the next waiting request"""
+        with self._cond:
+            if not ticket.admitted:
+                return
+            ticket.admitted = False
+            self._active[ticket.kind] -= 1
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, kind: str, user: Optional[str] = None, on_queued: Optional[Callable[[int], None]] = None,
+              cancel_token: Optional[CancellationToken] = None):
+        """
+        Hold a slot for the duration of a block, recording the wait as an "admission" span
+
+        Usage:
+            with controller.admit(INGEST, user="alice", on_queued=show_position):
+                ...
+        """
+        with metrics.span("admission", kind=kind) as span:
+            ticket = self.acquire(kind, user, on_queued, cancel_token=cancel_token)
+            span.set(wait_seconds=round(ticket.wait_seconds, 3), queued=int(ticket.position > 0))
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def metrics(self) -> Dict:
+        """Snapshot of active and waiting requests per kind, and counters"""
+        with self._cond:
+            return {
+                "active": dict(self._active),
+                "waiting": {kind: self._waiting(kind) for kind in KINDS},
+                "waiting_users": {kind: len(self._queues[kind]) for kind in KINDS},
+                **self._counters,
+            }
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide controller shared by all sessions"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                from config import (
+                    ADMISSION_MAX_ACTIVE,
+                    ADMISSION_MAX_GENERATIONS,
+                    ADMISSION_MAX_INGESTIONS,
+                    ADMISSION_MAX_QUEUE,
+                    ADMISSION_QUEUE_TIMEOUT,
+                    ADMISSION_RESERVED_INTERACTIVE,
+                )
+                _controller = AdmissionController(
+                    ADMISSION_MAX_ACTIVE,
+                    ADMISSION_MAX_INGESTIONS,
+                    ADMISSION_MAX_GENERATIONS,
+                    reserved_interactive=ADMISSION_RESERVED_INTERACTIVE,
+                    max_queue=ADMISSION_MAX_QUEUE,
+                    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+                )
+    return _controller
+
+
+def controller_metrics() -> Optional[Dict]:
+    """Metrics of the process-wide controller, or None before any request created it"""
+    controller = _controller
+    return controller.metrics() if controller is not None else None
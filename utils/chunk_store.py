@@ -0,0 +1,108 @@
+"""
+Memory-mapped chunk storage
+
+Chunks are written as one UTF-8 blob (``<name>.bin``) plus an int64 offsets
+array (``<name>.idx``, n + 1 entries). ``MappedChunks`` maps both files
+read-only and decodes a chunk only when it is accessed, so processes that
+open the same store share the OS page cache instead of each unpickling a
+private copy of every chunk.
+
+Chunk adjacency is kept next to the chunks in ``<name>.links``: an int64
+(n, 3) array of each chunk's previous chunk, next chunk and page number
+(``NO_LINK`` where there is none). Chunks of one document are chained in
+document order, so retrieval can widen a hit with the text around it.
+"""
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Union
+import numpy as np
+
+# Link value for "no previous/next chunk" and "page unknown"
+NO_LINK = -1
+
+# Columns of a links row
+PREV, NEXT, PAGE = 0, 1, 2
+
+
+def _paths(prefix: Path):
+    prefix = Path(prefix)
+    return prefix.with_suffix(".bin"), prefix.with_suffix(".idx")
+
+
+def _write_atomic(path: Path, payload: bytes):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    # Replace rather than overwrite: readers that mapped the old file keep it
+    os.replace(tmp_path, path)
+
+
+def write_chunks(prefix: Path, chunks: Iterable[str]):
+    """Write chunks to ``<prefix>.bin`` / ``<prefix>.idx``"""
+    encoded = [chunk.encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    data_path, index_path = _paths(prefix)
+    _write_atomic(data_path, b"".join(encoded))
+    _write_atomic(index_path, offsets.tobytes())
+
+
+def document_links(start: int, pages: Sequence[Optional[int]]) -> np.ndarray:
+    """Links of one document's chunks, stored in order from position ``start``"""
+    count = len(pages)
+    links = np.full((count, 3), NO_LINK, dtype=np.int64)
+    positions = np.arange(start, start + count, dtype=np.int64)
+    links[1:, PREV] = positions[:-1]
+    links[:-1, NEXT] = positions[1:]
+    links[:, PAGE] = [NO_LINK if page is None else page for page in pages]
+    return links
+
+
+def write_links(prefix: Path, links: np.ndarray):
+    """Write chunk links to ``<prefix>.links``"""
+    _write_atomic(Path(prefix).with_suffix(".links"), np.ascontiguousarray(links, dtype=np.int64).tobytes())
+
+
+def read_links(prefix: Path, mmap: bool = False) -> Optional[np.ndarray]:
+    """Chunk links, or None for stores written before links were kept"""
+    path = Path(prefix).with_suffix(".links")
+    if not path.exists():
+        return None
+    if not path.stat().st_size:
+        return np.zeros((0, 3), dtype=np.int64)
+    if mmap:
+        return np.memmap(path, dtype=np.int64, mode="r").reshape(-1, 3)
+    return np.fromfile(path, dtype=np.int64).reshape(-1, 3)
+
+
+def chunks_exist(prefix: Path) -> bool:
+    return all(path.exists() for path in _paths(prefix))
+
+
+class MappedChunks:
+    """Read-only, list-like view over a chunk store"""
+
+    def __init__(self, prefix: Path):
+        data_path, index_path = _paths(prefix)
+        self._offsets = np.fromfile(index_path, dtype=np.int64) if index_path.stat().st_size else np.zeros(1, dtype=np.int64)
+        # np.memmap cannot map an empty file
+        self._data = np.memmap(data_path, dtype=np.uint8, mode="r") if data_path.stat().st_size else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return self._data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
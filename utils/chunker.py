@@ -1,4 +1,5 @@
-from typing import List
+from typing import Dict, List, Optional, Tuple
+import bisect
 import re
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
@@ -43,3 +44,68 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[st
         start = end
     
     return chunks
+
+
+def locate_chunks(text: str, chunks: List[str]) -> List[Tuple[int, int]]:
+    """
+    Character offsets of sentence-joined chunks in the text they came from
+    
+    EmbeddingAgent._chunk_text replaces newlines with spaces and rejoins
+    stripped sentences, so each chunk's first and last sentence still appear
+    verbatim in the text. Chunks are located in order; overlapping chunks
+    may start before the previous one ends.
+    
+    Args:
+        text: The chunked text
+        chunks: Its chunks in order
+        
+    Returns:
+        (start, end) per chunk, or (-1, -1) where a chunk can't be located
+    """
+    flat = text.replace('\n', ' ')
+    offsets = []
+    cursor = 0
+    for chunk in chunks:
+        sentences = [sentence.strip() for sentence in chunk.split('.') if sentence.strip()]
+        if not sentences:
+            offsets.append((-1, -1))
+            continue
+        start = flat.find(sentences[0], cursor)
+        if start < 0:
+            start = flat.find(sentences[0])
+        if start < 0:
+            offsets.append((-1, -1))
+            continue
+        last = flat.find(sentences[-1], start)
+        end = last + len(sentences[-1]) if last >= 0 else start + len(chunk)
+        if end < len(flat) and flat[end] == '.':
+            end += 1
+        offsets.append((start, min(end, len(flat))))
+        cursor = start + 1
+    return offsets
+
+
+def chunk_pages(offsets: List[Tuple[int, int]], page_map: Optional[List[Dict]]) -> List[Optional[int]]:
+    """
+    Page each chunk starts on
+    
+    Args:
+        offsets: Per-chunk (start, end) offsets from locate_chunks
+        page_map: {"page_num", "start", "end"} character range of each page,
+            as recorded by CollectorAgent.merge
+        
+    Returns:
+        Page number per chunk, or None where the chunk or page is unknown
+    """
+    if not page_map:
+        return [None] * len(offsets)
+    starts = [page["start"] for page in page_map]
+    pages = []
+    for start, _ in offsets:
+        if start < 0:
+            pages.append(None)
+            continue
+        # The last page starting at or before the chunk
+        i = bisect.bisect_right(starts, start) - 1
+        pages.append(page_map[i]["page_num"] if i >= 0 else page_map[0]["page_num"])
+    return pages
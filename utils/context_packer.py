@@ -0,0 +1,138 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.request_scheduler import estimate_tokens
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences on terminal punctuation"""
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def _normalize(sentence: str) -> str:
+    return re.sub(r'\s+', ' ', sentence).strip().lower()
+
+
+def _adjacent(previous, position) -> bool:
+    """Whether ``position`` directly follows ``previous`` in the same document"""
+    if isinstance(position, tuple):
+        return previous[:-1] == position[:-1] and position[-1] == previous[-1] + 1
+    return position == previous + 1
+
+
+def pack_context(hits: List[Tuple[int, str]], token_budget: int) -> Tuple[str, Dict]:
+    """
+    Pack retrieved chunks into a prompt context under a token budget
+
+    Chunks may overlap (CHUNK_OVERLAP, or stores built with overlapping
+    chunks), so sentences already taken from a more relevant chunk are
+    dropped. Hits are taken in relevance order until the budget is full,
+    then laid out in document order, with adjacent chunks merged into one
+    passage.
+
+    Args:
+        hits: (position, chunk_text) pairs in relevance order, where position
+            is the chunk's index in the store (its order in the document), or
+            a (doc_id, index) tuple when hits span several documents
+        token_budget: Maximum estimated tokens of packed context
+
+    Returns:
+        tuple[str, Dict]: (context, stats) where stats has chunks, tokens,
+        duplicate_sentences and truncated
+    """
+    seen = set()
+    selected: Dict[int, List[str]] = {}
+    used_tokens = 0
+    duplicates = 0
+    truncated = False
+
+    for position, chunk in hits:
+        if truncated:
+            break
+        kept = []
+        for sentence in split_sentences(chunk):
+            key = _normalize(sentence)
+            if key in seen:
+                duplicates += 1
+                continue
+            cost = estimate_tokens(sentence)
+            if used_tokens + cost > token_budget:
+                truncated = True
+                break
+            seen.add(key)
+            kept.append(sentence)
+            used_tokens += cost
+        if kept:
+            selected.setdefault(position, []).extend(kept)
+
+    # Lay out in document order; consecutive chunks form one passage
+    passages = []
+    previous = None
+    for position in sorted(selected):
+        text = " ".join(selected[position])
+        if previous is not None and _adjacent(previous, position):
+            passages[-1] += " " + text
+        else:
+            passages.append(text)
+        previous = position
+
+    stats = {
+        "chunks": len(selected),
+        "passages": len(passages),
+        "tokens": used_tokens,
+        "duplicate_sentences": duplicates,
+        "truncated": truncated,
+    }
+    return "\n\n".join(passages), stats
+
+
+def expand_neighbors(hits: List[Tuple], token_budget: int,
+                     neighbors: Callable[[object], Tuple[Optional[Tuple], Optional[Tuple]]],
+                     radius: int) -> List[Tuple]:
+    """
+    Widen each hit with the chunks before and after it while the budget allows
+
+    Neighbours are added one step out at a time, visiting the hits in
+    relevance order at each step, so the best hits are widened first and no
+    hit takes the whole budget. They go after the original hits, which
+    pack_context therefore still fills first.
+
+    Args:
+        hits: (position, chunk_text) pairs in relevance order
+        token_budget: Maximum estimated tokens of hits and neighbours together
+        neighbors: Maps a position to its (previous, next) chunks as
+            (position, chunk_text) pairs, None at a document boundary
+        radius: Most chunks added on each side of a hit
+
+    Returns:
+        The hits followed by the neighbours added
+    """
+    expanded = list(hits)
+    selected = {position for position, _ in hits}
+    used_tokens = sum(estimate_tokens(chunk) for _, chunk in hits)
+    # Per hit: the outermost position reached before and after it (None once that side is done)
+    edges = {position: [position, position] for position, _ in hits}
+    for _ in range(max(0, radius)):
+        for position, _ in hits:
+            for side in (0, 1):
+                edge = edges[position][side]
+                if edge is None:
+                    continue
+                neighbor = neighbors(edge)[side]
+                # Walk through chunks that are already in the context
+                while neighbor is not None and neighbor[0] in selected:
+                    neighbor = neighbors(neighbor[0])[side]
+                if neighbor is None:
+                    edges[position][side] = None
+                    continue
+                cost = estimate_tokens(neighbor[1])
+                if used_tokens + cost > token_budget:
+                    edges[position][side] = None
+                    continue
+                expanded.append(neighbor)
+                selected.add(neighbor[0])
+                used_tokens += cost
+                edges[position][side] = neighbor[0]
+    return expanded
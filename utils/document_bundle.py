@@ -0,0 +1,196 @@
+"""
+Portable bundles of processed documents
+
+A bundle is a zip file holding everything ingestion produced for one
+document, so it can be attached to another store without re-running OCR
+or re-embedding:
+
+    manifest.json       format, version, doc id, embedding model, counts, checksums
+    vectors.npy         (n, dim) float32 chunk vectors
+    chunks.json         [{"text", "start", "end"}] chunks with offsets into text.txt
+    text.txt            full document text
+    pages.json          [{"page_num", "start", "end"}] page ranges in text.txt
+    summaries.json      [{"config", "model", "summary"}] cached summaries
+    tree.json           summary tree nodes (optional)
+    tree_vectors.npy    their vectors (optional)
+
+Readers reject bundles from a newer major version.
+
+    python -m utils.document_bundle export <doc_id> --output doc.pdfbundle
+    python -m utils.document_bundle import doc.pdfbundle
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+
+BUNDLE_FORMAT = "pdf-rag-bundle"
+BUNDLE_VERSION = 1
+BUNDLE_SUFFIX = ".pdfbundle"
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array, dtype=np.float32), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _json_bytes(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_bundle(path: Path, bundle: Dict) -> Path:
+    """
+    Write a bundle atomically
+
+    Args:
+        path: Output file
+        bundle: Dict with "doc_id", "name", "embedding_model", "vectors",
+            "chunks", "offsets", "text", "page_map", "summaries" and
+            optionally "tree_nodes" and "tree_vectors"
+
+    Returns:
+        The written path
+    """
+    path = Path(path)
+    vectors = np.asarray(bundle["vectors"], dtype=np.float32)
+    chunks, offsets = bundle["chunks"], bundle.get("offsets") or [(-1, -1)] * len(bundle["chunks"])
+    if len(vectors) != len(chunks) or len(offsets) != len(chunks):
+        raise ValueError("Length mismatch between vectors, chunks and offsets")
+
+    members = {
+        "vectors.npy": _npy_bytes(vectors),
+        "chunks.json": _json_bytes([{"text": chunk, "start": start, "end": end} for chunk, (start, end) in zip(chunks, offsets)]),
+        "text.txt": (bundle.get("text") or "").encode("utf-8"),
+        "pages.json": _json_bytes(bundle.get("page_map") or []),
+        "summaries.json": _json_bytes(bundle.get("summaries") or []),
+    }
+    tree_nodes = bundle.get("tree_nodes") or []
+    if tree_nodes:
+        members["tree.json"] = _json_bytes([{key: value for key, value in node.items() if key != "doc_id"} for node in tree_nodes])
+        members["tree_vectors.npy"] = _npy_bytes(bundle["tree_vectors"])
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "doc_id": bundle["doc_id"],
+        "name": bundle.get("name") or bundle["doc_id"],
+        "embedding_model": bundle["embedding_model"],
+        "dimension": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "chunks": len(chunks),
+        "pages": len(bundle.get("page_map") or []),
+        "created": time.time(),
+        "sha256": {name: hashlib.sha256(data).hexdigest() for name, data in members.items()},
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f, zipfile.ZipFile(f, "w") as archive:
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+            for name, data in members.items():
+                # Vectors barely compress; text and JSON do
+                compression = zipfile.ZIP_STORED if name.endswith(".npy") else zipfile.ZIP_DEFLATED
+                archive.writestr(name, data, compress_type=compression)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+def read_bundle(path: Path) -> Dict:
+    """
+    Read and verify a bundle
+
+    Returns:
+        Dict with the keys accepted by write_bundle plus "manifest"
+
+    Raises:
+        ValueError: if the file is not a bundle, is from a newer version or
+            fails its checksums
+    """
+    with zipfile.ZipFile(path) as archive:
+        try:
+            manifest = json.loads(archive.read("manifest.json"))
+        except KeyError:
+            raise ValueError(f"{path} is not a document bundle (no manifest)")
+        if manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"{path} is not a document bundle")
+        if manifest.get("version", 0) > BUNDLE_VERSION:
+            raise ValueError(f"Bundle version {manifest['version']} is newer than supported version {BUNDLE_VERSION}")
+
+        members = {}
+        for name, digest in manifest["sha256"].items():
+            data = archive.read(name)
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"Bundle member {name} is corrupted")
+            members[name] = data
+
+    chunks = json.loads(members["chunks.json"])
+    bundle = {
+        "manifest": manifest,
+        "doc_id": manifest["doc_id"],
+        "name": manifest.get("name"),
+        "embedding_model": manifest["embedding_model"],
+        "vectors": np.load(io.BytesIO(members["vectors.npy"]), allow_pickle=False),
+        "chunks": [chunk["text"] for chunk in chunks],
+        "offsets": [(chunk["start"], chunk["end"]) for chunk in chunks],
+        "text": members["text.txt"].decode("utf-8"),
+        "page_map": json.loads(members["pages.json"]),
+        "summaries": json.loads(members["summaries.json"]),
+        "tree_nodes": [],
+        "tree_vectors": None,
+    }
+    if "tree.json" in members:
+        bundle["tree_nodes"] = [dict(node, doc_id=manifest["doc_id"]) for node in json.loads(members["tree.json"])]
+        bundle["tree_vectors"] = np.load(io.BytesIO(members["tree_vectors.npy"]), allow_pickle=False)
+    if len(bundle["vectors"]) != len(bundle["chunks"]):
+        raise ValueError("Bundle vectors and chunks don't match")
+    return bundle
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export and import processed-document bundles")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a document's bundle")
+    export_parser.add_argument("doc_id")
+    export_parser.add_argument("--output", help=f"Bundle path (default OUTPUTS_DIR/bundles/<doc_id>{BUNDLE_SUFFIX})")
+    import_parser = commands.add_parser("import", help="Attach bundles to the local store")
+    import_parser.add_argument("bundles", nargs="+")
+    commands.add_parser("list", help="List documents that can be exported")
+    args = parser.parse_args(argv)
+
+    from main_controller import PDFProcessor
+
+    processor = PDFProcessor()
+    if args.command == "list":
+        for document in processor.list_documents():
+            print(f"{document['doc_id']}  {document['chunks']:6d} chunks  {document['name']}")
+        return 0
+    if args.command == "export":
+        path = processor.export_document(args.doc_id, args.output)
+        if path is None:
+            print(f"Failed to export {args.doc_id}")
+            return 1
+        print(path)
+        return 0
+
+    failed = 0
+    for bundle_path in args.bundles:
+        success, message = processor.import_document(bundle_path)
+        print(f"{bundle_path}: {'imported' if success else message}")
+        failed += not success
+    processor.wait_for_background()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,7 @@
+import os
+import tempfile
 from pathlib import Path
-from typing import Union, BinaryIO
-import magic
+from typing import Optional, Union, BinaryIO
 
 def is_valid_pdf(file_content: Union[bytes, BinaryIO]) -> bool:
     """
@@ -13,23 +14,29 @@ def is_valid_pdf(file_content: Union[bytes, BinaryIO]) -> bool:
         bool: True if valid PDF, False otherwise
     """
     try:
+        import magic  # libmagic is only needed for validation
+
         # Get file mime type
         mime = magic.from_buffer(file_content, mime=True)
         return mime == 'application/pdf'
     except Exception:
         return False
 
-def save_temp_pdf(file_content: bytes, temp_dir: Path = Path('.')) -> Path:
+def save_temp_pdf(file_content: bytes, temp_dir: Optional[Path] = None) -> Path:
     """
     Save uploaded file content as temporary PDF
     
+    Each call gets its own uniquely named file, so concurrent uploads never
+    overwrite each other. The caller is responsible for deleting it.
+    
     Args:
         file_content: PDF file content in bytes
-        temp_dir: Directory to save temp file
+        temp_dir: Directory to save temp file (system temp directory by default)
         
     Returns:
         Path: Path to saved temporary file
     """
-    temp_path = temp_dir / 'temp.pdf'
-    temp_path.write_bytes(file_content)
-    return temp_path
+    fd, temp_name = tempfile.mkstemp(prefix='upload-', suffix='.pdf', dir=temp_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(file_content)
+    return Path(temp_name)
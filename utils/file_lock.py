@@ -0,0 +1,89 @@
+"""
+Cross-process file locks
+
+``FileLock`` takes an advisory lock on a lock file with ``fcntl.flock`` on
+POSIX and ``msvcrt.locking`` on Windows. Each acquisition opens its own file
+descriptor, so the lock also excludes other threads of the same process.
+Windows has no shared mode, so shared locks are exclusive there.
+"""
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a lock cannot be acquired within the timeout"""
+
+
+class FileLock:
+    """
+    Advisory lock on ``path``
+
+    Usage:
+        with FileLock(store_dir / ".write.lock"):
+            ...  # single writer
+        with FileLock(store_dir / ".write.lock", shared=True):
+            ...  # any number of readers
+    """
+
+    def __init__(self, path: Path, shared: bool = False, timeout: Optional[float] = None, poll_interval: float = 0.05):
+        self.path = Path(path)
+        self.shared = shared
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+
+    def _try_lock(self, fd: int) -> bool:
+        try:
+            if fcntl is not None:
+                mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+                fcntl.flock(fd, mode | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self):
+        if self._fd is not None:
+            raise RuntimeError(f"Lock {self.path} is already held by this object")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self._try_lock(fd):
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(fd)
+                raise LockTimeout(f"Timed out after {self.timeout}s waiting for {self.path}")
+            time.sleep(self.poll_interval)
+        self._fd = fd
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,14 @@
+import hashlib
+
+
+def document_id(content: bytes) -> str:
+    """
+    Stable id for a document, derived from its bytes
+
+    Args:
+        content: Raw file content
+
+    Returns:
+        First 16 hex characters of the SHA-256 digest
+    """
+    return hashlib.sha256(content).hexdigest()[:16]
@@ -0,0 +1,322 @@
+"""
+Per-stage instrumentation for the processing pipeline
+
+Stages are wrapped in ``span(name)`` blocks. Each span records wall time and
+any of the counted attributes (pages, chunks, tokens, bytes, cache_hits,
+duplicates) into process-wide Prometheus-style metrics and, when a request
+trace is active, into that trace. Finished traces are kept in memory for the admin
+panel and written as JSON to ``OUTPUTS_DIR/traces``.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Span attributes that are summed into counters
+COUNTED_ATTRIBUTES = ("pages", "chunks", "tokens", "bytes", "cache_hits", "duplicates", "megapixels")
+
+# Histogram buckets for stage durations, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+class Span:
+    """A timed stage; attributes can be set while it runs"""
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.status = "ok"
+        self.offset = 0.0
+        self.seconds = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, name: str, amount: float = 1):
+        self.attrs[name] = self.attrs.get(name, 0) + amount
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "offset": round(self.offset, 6),
+            "seconds": round(self.seconds, 6),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class Trace:
+    """All spans recorded while handling one request"""
+
+    def __init__(self, kind: str, request_id: Optional[str] = None, **attrs):
+        self.kind = kind
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.attrs = dict(attrs)
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans: List[Span] = []
+        self.status = "ok"
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_span(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "seconds": round(self.seconds, 6),
+            "status": self.status,
+            "attrs": self.attrs,
+            "spans": spans,
+        }
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self, max_traces: int = 100):
+        self._lock = threading.Lock()
+        self._counters: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, List] = {}
+        self.traces = deque(maxlen=max_traces)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # [bucket counts..., sum, count]
+                histogram = [0] * len(DURATION_BUCKETS) + [0.0, 0]
+                self._histograms[key] = histogram
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def record_span(self, span: Span):
+        self.observe("pdf_pipeline_stage_seconds", span.seconds, stage=span.name)
+        self.inc("pdf_pipeline_stage_calls_total", stage=span.name, status=span.status)
+        for attribute in COUNTED_ATTRIBUTES:
+            value = span.attrs.get(attribute)
+            if isinstance(value, (int, float)) and value:
+                self.inc(f"pdf_pipeline_{attribute}_total", value, stage=span.name)
+
+    def record_trace(self, trace: Trace):
+        self.observe("pdf_pipeline_request_seconds", trace.seconds, kind=trace.kind)
+        self.inc("pdf_pipeline_requests_total", kind=trace.kind, status=trace.status)
+        trace_dict = trace.to_dict()
+        with self._lock:
+            self.traces.append(trace_dict)
+
+    def recent_traces(self) -> List[Dict]:
+        """Most recent traces, newest first"""
+        with self._lock:
+            return list(reversed(self.traces))
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{fmt_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for bound, count in zip(DURATION_BUCKETS, histogram):
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {histogram[-1]}")
+            lines.append(f"{name}_sum{fmt_labels(labels)} {histogram[-2]:.6f}")
+            lines.append(f"{name}_count{fmt_labels(labels)} {histogram[-1]}")
+
+        lines.extend(_scheduler_metrics())
+        lines.extend(_admission_metrics())
+        return "\n".join(lines) + "\n"
+
+
+def _scheduler_metrics() -> List[str]:
+    """Gauges from the shared request scheduler, if one has been created"""
+    from utils.request_scheduler import scheduler_metrics
+
+    snapshot = scheduler_metrics()
+    if snapshot is None:
+        return []
+    lines = ["# TYPE openai_scheduler_queue_depth gauge"]
+    for priority, depth in snapshot["queue_depth"].items():
+        lines.append(f'openai_scheduler_queue_depth{{priority="{priority}"}} {depth}')
+    lines.append("# TYPE openai_scheduler_in_flight gauge")
+    lines.append(f"openai_scheduler_in_flight {snapshot['in_flight']}")
+    for key in ("completed", "failed", "retries", "rate_limited"):
+        lines.append(f"# TYPE openai_scheduler_{key}_total counter")
+        lines.append(f"openai_scheduler_{key}_total {snapshot[key]}")
+    return lines
+
+
+def _admission_metrics() -> List[str]:
+    """Gauges from the admission controller, if one has been created"""
+    from utils.admission import controller_metrics
+
+    snapshot = controller_metrics()
+    if snapshot is None:
+        return []
+    lines = []
+    for key in ("active", "waiting"):
+        lines.append(f"# TYPE admission_{key} gauge")
+        for kind, value in snapshot[key].items():
+            lines.append(f'admission_{key}{{kind="{kind}"}} {value}')
+    for key in ("admitted", "queued", "rejected", "timed_out"):
+        lines.append(f"# TYPE admission_{key}_total counter")
+        lines.append(f"admission_{key}_total {snapshot[key]}")
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time a pipeline stage
+
+    Usage:
+        with span("embed", chunks=len(chunks)) as s:
+            ...
+            s.set(tokens=n)
+    """
+    current = Span(name, **attrs)
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    if trace is not None:
+        current.offset = start - trace._start
+    try:
+        yield current
+    except BaseException:
+        current.status = "error"
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        registry.record_span(current)
+        if trace is not None:
+            trace.add_span(current)
+
+
+@contextmanager
+def start_trace(kind: str, request_id: Optional[str] = None, **attrs):
+    """
+    Collect every span run inside the block into one request trace
+
+    The finished trace is kept for the admin panel and, if TRACES_ENABLED,
+    written to ``OUTPUTS_DIR/traces/<kind>-<request_id>.json``; only the
+    newest TRACES_MAX_FILES files are kept.
+    """
+    trace = Trace(kind, request_id, **attrs)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        trace.status = "error"
+        raise
+    finally:
+        trace.seconds = time.perf_counter() - trace._start
+        _current_trace.reset(token)
+        registry.record_trace(trace)
+        _save_trace(trace)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def _save_trace(trace: Trace):
+    from config import OUTPUTS_DIR, TRACES_ENABLED, TRACES_MAX_FILES
+
+    if not TRACES_ENABLED:
+        return
+    try:
+        trace_dir = Path(OUTPUTS_DIR) / "traces"
+        trace_dir.mkdir(parents=True, exist_ok=True)
+        path = trace_dir / f"{trace.kind}-{trace.request_id}.json"
+        path.write_text(json.dumps(trace.to_dict(), indent=2))
+        prune_traces(trace_dir, TRACES_MAX_FILES)
+    except Exception as e:
+        logger.warning(f"Failed to write trace {trace.request_id}: {e}")
+
+
+def prune_traces(trace_dir: Path, max_files: int) -> int:
+    """Delete the oldest trace files beyond the newest ``max_files``"""
+    files = []
+    for path in Path(trace_dir).glob("*.json"):
+        try:
+            files.append((path.stat().st_mtime, path))
+        except OSError:
+            continue  # Pruned by a concurrent request
+    removed = 0
+    for _, path in sorted(files)[:max(0, len(files) - max(1, max_files))]:
+        try:
+            path.unlink()
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Serve ``/metrics`` in Prometheus text format on a background thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            payload = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on http://{host}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,105 @@
+"""
+MinHash signatures and LSH banding for near-duplicate text detection
+
+A chunk's signature is the minimum of ``num_perm`` universal hashes over
+its word shingles; the fraction of equal signature slots estimates the
+Jaccard similarity of two chunks' shingle sets. ``LSHIndex`` buckets
+signatures by band so near-duplicates are found without comparing against
+every stored chunk.
+"""
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD = re.compile(r"\w+")
+
+
+class MinHasher:
+    """Computes MinHash signatures over lower-cased word shingles"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _PRIME
+        self._b = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _PRIME
+
+    @property
+    def params(self) -> Dict:
+        """Settings that must match for two signatures to be comparable"""
+        return {"num_perm": self.num_perm, "shingle_size": self.shingle_size, "seed": self.seed}
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        words = _WORD.findall(text.lower())
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)} if size else set()
+        return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+    def signature(self, text: str) -> np.ndarray:
+        """(num_perm,) uint32 signature of ``text``"""
+        hashes = self._shingle_hashes(text)
+        if hashes.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        # Universal hashing (a*x + b mod p) for every shingle and permutation at once;
+        # the uint64 product may wrap, which keeps it deterministic
+        permuted = ((hashes[:, None] * self._a + self._b) % _PRIME) & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def signatures(self, texts: Iterable[str]) -> np.ndarray:
+        """(n, num_perm) uint32 signatures"""
+        rows = [self.signature(text) for text in texts]
+        return np.vstack(rows) if rows else np.zeros((0, self.num_perm), dtype=np.uint32)
+
+
+def jaccard(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(signature_a == signature_b))
+
+
+class LSHIndex:
+    """
+    Banded locality-sensitive hash over MinHash signatures
+
+    Signatures are split into ``bands`` bands; two signatures become
+    candidates when any band matches exactly. Candidates are verified
+    against ``threshold`` with the full signature.
+    """
+
+    def __init__(self, num_perm: int, bands: int, threshold: float):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key: int, signature: np.ndarray):
+        self._signatures[key] = signature
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(band_key, []).append(key)
+
+    def candidates(self, signature: np.ndarray) -> Set[int]:
+        found = set()
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            found.update(band.get(band_key, ()))
+        return found
+
+    def query(self, signature: np.ndarray) -> Optional[int]:
+        """Key of the most similar indexed signature at or above the threshold, if any"""
+        best_key, best_score = None, self.threshold
+        for key in sorted(self.candidates(signature)):
+            score = jaccard(signature, self._signatures[key])
+            if score >= best_score and (best_key is None or score > best_score):
+                best_key, best_score = key, score
+        return best_key
@@ -0,0 +1,294 @@
+"""
+On-demand profiling of single requests
+
+``profiled(kind)`` wraps an ingestion or question in cProfile when
+profiling is switched on (``PROFILE_REQUESTS``, ``set_enabled`` from the
+admin panel, or ``force=True`` for one call). When it is off it returns a
+``nullcontext`` and nothing is measured. For each profiled request it writes
+to ``PROFILES_DIR``:
+
+    <kind>-<doc_id>-<request_id>.prof     raw stats (snakeviz, pstats)
+    <kind>-<doc_id>-<request_id>.txt      top functions by cumulative and own time
+    <kind>-<doc_id>-<request_id>.folded   folded stacks (speedscope, flamegraph.pl)
+    <kind>-<doc_id>-<request_id>.svg      flame graph
+
+cProfile only sees the thread it runs in; work a request hands to pipeline
+worker threads is profiled with ``profile_thread()`` and merged into the
+request's profile. Only one request is profiled at a time; concurrent
+requests run unprofiled. Time spent inside
+fitz, EasyOCR or numpy is attributed to the Python call that entered them.
+The flame graph is rebuilt from cProfile's caller/callee totals, so a
+function called from several places splits its children in proportion.
+"""
+import contextvars
+import cProfile
+import hashlib
+import io
+import logging
+import os
+import pstats
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Frames below this share of the total time are left out of the flame graph
+MIN_FLAME_FRACTION = 0.001
+MAX_FLAME_DEPTH = 80
+FLAME_WIDTH = 1200
+FLAME_ROW_HEIGHT = 16
+
+_enabled: Optional[bool] = None
+# Only one cProfile profiler can run per process on newer Pythons
+_profile_lock = threading.Lock()
+# Profilers of worker threads doing the profiled request's work
+_worker_profiles: contextvars.ContextVar[Optional[List[cProfile.Profile]]] = contextvars.ContextVar(
+    "worker_profiles", default=None
+)
+
+
+def is_enabled() -> bool:
+    """Whether every request is profiled (PROFILE_REQUESTS or the admin toggle)"""
+    global _enabled
+    if _enabled is None:
+        from config import PROFILE_REQUESTS
+        _enabled = PROFILE_REQUESTS
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    """Switch profiling of every request on or off for this process"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def profiled(kind: str, force: bool = False):
+    """
+    Profile the block if profiling is on or ``force`` is set
+
+    Usage:
+        with metrics.start_trace("ingest"), profiling.profiled("ingest") as profiler:
+            ...
+
+    Yields the cProfile.Profile, or None when the request isn't profiled.
+    """
+    if not (force or is_enabled()):
+        return nullcontext()
+    return _profile(kind)
+
+
+@contextmanager
+def _profile(kind: str):
+    if not _profile_lock.acquire(blocking=False):
+        logger.info(f"Another request is being profiled; running this {kind} request unprofiled")
+        yield None
+        return
+    workers: List[cProfile.Profile] = []
+    workers_token = _worker_profiles.set(workers)
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            _worker_profiles.reset(workers_token)
+            try:
+                write_profile(profiler, kind, workers=workers)
+            except Exception as e:
+                logger.warning(f"Failed to write {kind} profile: {e}")
+    finally:
+        _profile_lock.release()
+
+
+@contextmanager
+def profile_thread():
+    """
+    Profile a worker thread's share of the request being profiled
+
+    Run it in a copy of the request's context (``contextvars.copy_context().run``);
+    outside a profiled request it does nothing. The profile is merged into
+    the request's when it is written.
+    """
+    workers = _worker_profiles.get()
+    if workers is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one profiler per process, and it already sees every thread
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        workers.append(profiler)
+
+
+def _as_stats(profile: Union[cProfile.Profile, pstats.Stats]) -> pstats.Stats:
+    return profile if isinstance(profile, pstats.Stats) else pstats.Stats(profile)
+
+
+def write_profile(profiler: cProfile.Profile, kind: str, directory: Optional[Path] = None,
+                  workers: Optional[List[cProfile.Profile]] = None) -> Dict[str, Path]:
+    """
+    Write stats, folded stacks and a flame graph for a finished profile
+
+    Profiles of ``workers`` (see profile_thread) are merged in. The file names carry the current trace's request id and its "doc_id"
+    attribute; the flame graph path is recorded on the trace as "profile".
+
+    Returns:
+        Dict of format ("prof", "txt", "folded", "svg") to path
+    """
+    if directory is None:
+        from config import PROFILES_DIR
+        directory = PROFILES_DIR
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    trace = metrics.current_trace()
+    request_id = trace.request_id if trace else f"{os.getpid()}-{threading.get_ident()}"
+    doc_id = (trace.attrs.get("doc_id") if trace else None) or "none"
+    stem = directory / f"{kind}-{doc_id}-{request_id}"
+
+    stats = pstats.Stats(profiler)
+    for worker in workers or ():
+        stats.add(worker)
+    paths = {fmt: stem.with_suffix(f".{fmt}") for fmt in ("prof", "txt", "folded", "svg")}
+    stats.dump_stats(paths["prof"])
+    paths["txt"].write_text(stats_report(stats), encoding="utf-8")
+    stacks = folded_stacks(stats)
+    paths["folded"].write_text("".join(f"{stack} {value}\n" for stack, value in stacks), encoding="utf-8")
+    paths["svg"].write_text(flame_graph_svg(stacks, title=f"{kind} {doc_id} {request_id}"), encoding="utf-8")
+    if trace is not None:
+        trace.attrs["profile"] = str(paths["svg"])
+    logger.info(f"Wrote {kind} profile to {paths['svg']}")
+    return paths
+
+
+def stats_report(profile: Union[cProfile.Profile, pstats.Stats], limit: int = 40) -> str:
+    """Top functions by cumulative time, then by own time"""
+    buffer = io.StringIO()
+    stats = pstats.Stats(stream=buffer)
+    stats.add(_as_stats(profile))
+    stats.strip_dirs()
+    buffer.write("By cumulative time\n\n")
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    buffer.write("\nBy own time\n\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(limit)
+    return buffer.getvalue()
+
+
+def _label(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":
+        # Built-ins and C extension functions, e.g. "<method 'readtext' ...>"
+        return name.replace(";", ",")
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ",")
+
+
+def folded_stacks(profile: Union[cProfile.Profile, pstats.Stats]) -> List[Tuple[str, int]]:
+    """
+    Folded stacks ("root;child;leaf microseconds") rebuilt from the call graph
+
+    Each function's time on a path is split between its callees in
+    proportion to their totals from that function.
+    """
+    raw = _as_stats(profile).stats
+    children: Dict[Tuple, List[Tuple[Tuple, float]]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in raw.items() if not entry[4]]
+    total = sum(raw[func][3] for func in roots) or 1e-9
+    min_seconds = total * MIN_FLAME_FRACTION
+
+    stacks: Dict[str, float] = {}
+
+    def walk(func, seconds: float, path: List[str], on_path: set):
+        path = path + [_label(func)]
+        cumulative = raw[func][3] or 1e-9
+        scale = min(1.0, seconds / cumulative)
+        spent = 0.0
+        if len(path) < MAX_FLAME_DEPTH:
+            for child, edge_seconds in children.get(func, ()):
+                child_seconds = edge_seconds * scale
+                # Recursion shows up as a cycle in the call graph; stop at the first repeat
+                if child in on_path or child_seconds < min_seconds:
+                    continue
+                walk(child, child_seconds, path, on_path | {child})
+                spent += child_seconds
+        own = seconds - spent
+        if own >= min_seconds:
+            key = ";".join(path)
+            stacks[key] = stacks.get(key, 0.0) + own
+
+    for root in roots:
+        if raw[root][3] >= min_seconds:
+            walk(root, raw[root][3], [], {root})
+    return sorted((stack, int(seconds * 1e6)) for stack, seconds in stacks.items() if seconds * 1e6 >= 1)
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+def flame_graph_svg(stacks: List[Tuple[str, int]], title: str = "") -> str:
+    """Render folded stacks as a self-contained SVG flame graph (hover a frame for its time)"""
+    # Merge the stacks into a tree of {name: [microseconds, children]}
+    root = [0, {}]
+    for stack, value in stacks:
+        node = root
+        node[0] += value
+        for frame in stack.split(";"):
+            node = node[1].setdefault(frame, [0, {}])
+            node[0] += value
+    total = root[0] or 1
+    depth = max((stack.count(";") + 1 for stack, _ in stacks), default=0)
+    height = (depth + 2) * FLAME_ROW_HEIGHT + 24
+    rects = []
+
+    def layout(children: Dict, x: float, level: int):
+        for name, (value, grandchildren) in sorted(children.items()):
+            width = value / total * FLAME_WIDTH
+            if width < 0.5:
+                x += width
+                continue
+            y = height - (level + 2) * FLAME_ROW_HEIGHT
+            hue = int(hashlib.md5(name.encode("utf-8")).hexdigest()[:2], 16) % 40
+            label = _escape(name)
+            tooltip = f"{label} — {value / 1e6:.3f}s ({100 * value / total:.1f}%)"
+            text = _escape(name[: max(0, int(width / 7) - 1)])
+            rects.append(
+                f'<g><title>{tooltip}</title>'
+                f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{FLAME_ROW_HEIGHT - 1}" fill="hsl({hue},85%,60%)"/>'
+                + (f'<text x="{x + 3:.1f}" y="{y + FLAME_ROW_HEIGHT - 4}">{text}</text>' if len(text) > 2 else "")
+                + "</g>"
+            )
+            layout(grandchildren, x, level + 1)
+            x += width
+
+    layout(root[1], 0.0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{FLAME_WIDTH}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fafafa"/>'
+        f'<text x="4" y="16" font-size="13">{_escape(title)} — {total / 1e6:.3f}s</text>'
+        + "".join(rects)
+        + "</svg>\n"
+    )
+
+
+def recent_profiles(limit: int = 10, directory: Optional[Path] = None) -> List[Path]:
+    """Flame graphs of the most recent profiled requests, newest first"""
+    if directory is None:
+        from config import PROFILES_DIR
+        directory = PROFILES_DIR
+    paths = sorted(Path(directory).glob("*.svg"), key=lambda path: path.stat().st_mtime, reverse=True)
+    return paths[:limit]
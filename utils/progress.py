@@ -0,0 +1,186 @@
+"""
+Stage-level progress reporting and cooperative cancellation for ingestion
+
+``ProgressTracker`` is handed to each ingestion stage. Stages call
+``start(stage, total)`` and ``advance(stage=...)`` as pages are OCR'd and
+chunks embedded (stages may run in parallel, e.g. OCR alongside the
+embedding of text pages); every update is reported to a callback as a dict,
+describing the most recently updated stage:
+
+    {"stage": "embed", "done": 40, "total": 120, "fraction": 0.61,
+     "elapsed_seconds": 12.3, "eta_seconds": 7.9,
+     "counts": {"pages": 20, "ocr_pages_done": 6, "chunks_embedded": 40, ...}}
+
+``fraction`` covers the whole ingestion, weighting each stage by its usual
+share of the run time. Each update also checks the tracker's
+``CancellationToken``, so cancelling stops the work at the next page or
+embedding batch.
+
+The callback always runs in the thread that created the tracker (UI code
+such as Streamlit can only render there). Updates from stages running on
+worker threads are queued and delivered by ``flush()``, which the waiting
+thread calls while the workers run.
+"""
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Stages in order and their share of a typical ingestion
+STAGE_WEIGHTS = {
+    "parse": 0.10,
+    "route": 0.05,
+    "ocr": 0.40,
+    "collect": 0.05,
+    "embed": 0.35,
+    "store": 0.05,
+}
+
+# Below this much progress the ETA is too noisy to report
+MIN_FRACTION_FOR_ETA = 0.02
+
+
+class Cancelled(BaseException):
+    """
+    Raised inside cancelled work
+
+    Like asyncio.CancelledError it is not an Exception, so the stages'
+    ``except Exception`` error handling doesn't turn it into a failure.
+    """
+
+
+class CancellationToken:
+    """Set by the requester to stop a running ingestion"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "Cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        """Raise Cancelled if the token has been cancelled"""
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+
+class ProgressTracker:
+    """Progress of one ingestion across its stages"""
+
+    def __init__(self, callback: Optional[Callable[[Dict], None]] = None, token: Optional[CancellationToken] = None):
+        self.callback = callback
+        self.token = token
+        self.stage: Optional[str] = None
+        # stage -> [done, total]
+        self.stages: Dict[str, list] = {}
+        self.counts: Dict[str, int] = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        # Updates from worker threads, delivered in the owner's thread by flush()
+        self._owner = threading.get_ident()
+        self._pending: "queue.SimpleQueue[Dict]" = queue.SimpleQueue()
+
+    def check(self):
+        """Raise Cancelled if the ingestion has been cancelled"""
+        if self.token is not None:
+            self.token.check()
+
+    @property
+    def done(self) -> int:
+        return self.stages.get(self.stage, [0, 0])[0]
+
+    @property
+    def total(self) -> int:
+        return self.stages.get(self.stage, [0, 0])[1]
+
+    def start(self, stage: str, total: int = 1, **counts):
+        """
+        Enter a stage with ``total`` units of work (pages, chunks)
+
+        Starting a stage again adds more work to it; counts are added to the running totals.
+        """
+        with self._lock:
+            self.stages.setdefault(stage, [0, 0])[1] += max(0, total)
+            self.stage = stage
+            for name, value in counts.items():
+                self.counts[name] = self.counts.get(name, 0) + value
+        self._report()
+
+    def advance(self, amount: int = 1, stage: Optional[str] = None, **counts):
+        """Record finished units of a stage (default: the last one started); counts are added to the running totals"""
+        with self._lock:
+            stage = stage or self.stage
+            done_total = self.stages.setdefault(stage, [0, 0])
+            done_total[0] = min(done_total[1], done_total[0] + amount)
+            self.stage = stage
+            for name, value in counts.items():
+                self.counts[name] = self.counts.get(name, 0) + value
+        self._report()
+
+    def finish(self):
+        """Mark the ingestion complete; the work is stored, so this no longer cancels"""
+        with self._lock:
+            self.stage = "done"
+            self.stages["done"] = [1, 1]
+        self._report(check=False)
+
+    def fraction(self) -> float:
+        """Share of the whole ingestion completed"""
+        if "done" in self.stages:
+            return 1.0
+        order = list(STAGE_WEIGHTS)
+        started = [order.index(stage) for stage in self.stages if stage in STAGE_WEIGHTS]
+        latest = max(started, default=-1)
+        fraction = 0.0
+        for position, stage in enumerate(order):
+            if stage in self.stages:
+                done, total = self.stages[stage]
+                fraction += STAGE_WEIGHTS[stage] * (done / total if total else 1.0)
+            elif position < latest:
+                # Skipped (no OCR needed) or not reported separately
+                fraction += STAGE_WEIGHTS[stage]
+        return min(1.0, fraction)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            fraction = self.fraction()
+            elapsed = time.perf_counter() - self._start
+            eta = elapsed * (1 - fraction) / fraction if fraction >= MIN_FRACTION_FOR_ETA else None
+            return {
+                "stage": self.stage,
+                "done": self.done,
+                "total": self.total,
+                "fraction": round(fraction, 4),
+                "elapsed_seconds": round(elapsed, 2),
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "counts": dict(self.counts),
+            }
+
+    def flush(self):
+        """Deliver the latest update queued by worker threads; call from the thread that created the tracker"""
+        latest = None
+        while True:
+            try:
+                latest = self._pending.get_nowait()
+            except queue.Empty:
+                break
+        if latest is not None and self.callback is not None:
+            self.callback(latest)
+
+    def _report(self, check: bool = True):
+        # Report first: a callback that finds the requester gone cancels the token
+        if self.callback is not None:
+            if threading.get_ident() == self._owner:
+                self.flush()
+                self.callback(self.snapshot())
+            else:
+                self._pending.put(self.snapshot())
+        if check:
+            self.check()
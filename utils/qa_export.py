@@ -0,0 +1,31 @@
+import csv
+import io
+import json
+from typing import Dict, List
+
+
+def results_to_csv(results: List[Dict]) -> str:
+    """
+    Serialize batch Q&A results as CSV
+
+    Args:
+        results: List of dicts with "question" and "answer" keys, in order
+
+    Returns:
+        CSV text with a header row and one row per question
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=["index", "question", "answer"], extrasaction="ignore")
+    writer.writeheader()
+    for i, result in enumerate(results, start=1):
+        writer.writerow({"index": i, **result})
+    return buffer.getvalue()
+
+
+def results_to_json(results: List[Dict]) -> str:
+    """Serialize batch Q&A results as a JSON array"""
+    return json.dumps(
+        [{"index": i, **result} for i, result in enumerate(results, start=1)],
+        indent=2,
+        ensure_ascii=False
+    )
@@ -0,0 +1,264 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Priorities: lower value is served first
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate: 4 characters per token"""
+    return max(1, len(text or "") // 4)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``capacity`` units per minute"""
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` units are available (0 if available now)"""
+        self._refill(now)
+        # Requests larger than the bucket are admitted once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an API error is transient (rate limit, timeout, server error)"""
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Extract the server-requested delay from ``retry-after-ms``/``Retry-After`` headers"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(0.0, float(value) / 1000.0)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class RequestScheduler:
+    """
+    Shared scheduler for outbound model API calls
+
+    Calls are admitted in priority order (interactive before bulk, FIFO within
+    a priority) once both the requests-per-minute and tokens-per-minute
+    buckets allow them. Transient failures are retried with jittered
+    exponential backoff, and a ``Retry-After`` from the server pauses all
+    callers, not just the one that received it.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._in_flight = 0
+        self._counters = {
+            "completed": 0,
+            "failed": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "throttle_wait_seconds": 0.0,
+        }
+
+    def _acquire(self, priority: int, tokens: int, sequence: int):
+        """
+        Block until this caller is first in line and the buckets allow it
+
+        ``sequence`` orders callers within a priority; a retry passes its
+        first attempt's so it keeps its place ahead of later arrivals.
+        """
+        entry = (priority, sequence)
+        start = time.monotonic()
+        acquired = False
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            self._queued[priority] = self._queued.get(priority, 0) + 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiting[0] == entry:
+                        wait = max(
+                            self._paused_until - now,
+                            self.request_bucket.wait_time(1, now),
+                            self.token_bucket.wait_time(tokens, now),
+                        )
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                heapq.heappop(self._waiting)
+                acquired = True
+                self.request_bucket.consume(1)
+                self.token_bucket.consume(tokens)
+                self._in_flight += 1
+                self._counters["throttle_wait_seconds"] += time.monotonic() - start
+            finally:
+                if not acquired:
+                    # Interrupted while waiting (KeyboardInterrupt, cancellation); leave the line
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                self._queued[priority] -= 1
+                self._cond.notify_all()
+
+    def _release(self, outcome: Optional[str]):
+        with self._cond:
+            self._in_flight -= 1
+            if outcome:
+                self._counters[outcome] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn: Callable, *args, priority: int = BULK, tokens: int = 1, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` under the rate limits, retrying transient errors
+
+        Args:
+            fn: The API call to make
+            priority: INTERACTIVE or BULK
+            tokens: Estimated tokens consumed by the call (prompt + completion)
+
+        Returns:
+            Whatever ``fn`` returns
+
+        Raises:
+            The last error once retries are exhausted, or any non-retryable error
+        """
+        sequence = next(self._sequence)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority, tokens, sequence)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self._release("failed")
+                    raise
+                delay = retry_after_seconds(e)
+                rate_limited = _status_code(e) == 429 or type(e).__name__ == "RateLimitError"
+                if delay is None:
+                    delay = self._backoff(attempt)
+                self._release("retries")
+                if rate_limited:
+                    with self._cond:
+                        self._counters["rate_limited"] += 1
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                        self._cond.notify_all()
+                logger.warning(
+                    f"Transient API error ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                continue
+            self._release("completed")
+            return result
+
+    def metrics(self) -> Dict:
+        """Snapshot of queue depth, in-flight calls and retry counters"""
+        with self._cond:
+            now = time.monotonic()
+            self.request_bucket._refill(now)
+            self.token_bucket._refill(now)
+            return {
+                "queue_depth": {PRIORITY_NAMES.get(p, str(p)): n for p, n in self._queued.items()},
+                "in_flight": self._in_flight,
+                "paused_seconds": max(0.0, self._paused_until - now),
+                "available_requests": self.request_bucket.tokens,
+                "available_tokens": self.token_bucket.tokens,
+                **self._counters,
+            }
+
+
+_scheduler: Optional[RequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Return the process-wide scheduler shared by all model API calls"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                from config import (
+                    OPENAI_REQUESTS_PER_MINUTE,
+                    OPENAI_TOKENS_PER_MINUTE,
+                    OPENAI_MAX_RETRIES,
+                )
+                _scheduler = RequestScheduler(
+                    OPENAI_REQUESTS_PER_MINUTE,
+                    OPENAI_TOKENS_PER_MINUTE,
+                    max_retries=OPENAI_MAX_RETRIES,
+                )
+    return _scheduler
+
+
+def scheduler_metrics() -> Optional[Dict]:
+    """Metrics of the process-wide scheduler, or None before any API call created it"""
+    scheduler = _scheduler
+    return scheduler.metrics() if scheduler is not None else None
@@ -0,0 +1,112 @@
+"""
+Cheap script and language detection for choosing OCR readers
+
+EasyOCR loads one recognition model per script, and a reader can only mix
+languages of one script (plus English). ``choose_languages`` looks at the
+characters of a page's text layer (or the document's, for scanned pages)
+and picks the smallest language set from the configured ones that covers
+it: Unicode ranges decide the script, and stopword hits decide between
+Latin-script languages.
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+# (first, last) code points of each script we can route on
+SCRIPT_RANGES = [
+    ("Latin", 0x0041, 0x024F),
+    ("Greek", 0x0370, 0x03FF),
+    ("Cyrillic", 0x0400, 0x04FF),
+    ("Hebrew", 0x0590, 0x05FF),
+    ("Arabic", 0x0600, 0x06FF),
+    ("Devanagari", 0x0900, 0x097F),
+    ("Bengali", 0x0980, 0x09FF),
+    ("Tamil", 0x0B80, 0x0BFF),
+    ("Thai", 0x0E00, 0x0E7F),
+    ("Hangul", 0x1100, 0x11FF),
+    ("Kana", 0x3040, 0x30FF),
+    ("Han", 0x4E00, 0x9FFF),
+    ("Hangul", 0xAC00, 0xD7AF),
+]
+
+# EasyOCR language code -> script
+LANGUAGE_SCRIPTS: Dict[str, str] = {
+    "en": "Latin", "fr": "Latin", "de": "Latin", "es": "Latin", "it": "Latin", "pt": "Latin",
+    "nl": "Latin", "pl": "Latin", "cs": "Latin", "sv": "Latin", "da": "Latin", "no": "Latin",
+    "fi": "Latin", "tr": "Latin", "id": "Latin", "vi": "Latin", "ro": "Latin", "hu": "Latin",
+    "ru": "Cyrillic", "uk": "Cyrillic", "bg": "Cyrillic", "be": "Cyrillic", "rs_cyrillic": "Cyrillic",
+    "ar": "Arabic", "fa": "Arabic", "ur": "Arabic",
+    "hi": "Devanagari", "mr": "Devanagari", "ne": "Devanagari",
+    "bn": "Bengali", "ta": "Tamil", "th": "Thai",
+    "ko": "Hangul", "ja": "Kana", "ch_sim": "Han", "ch_tra": "Han",
+}
+
+# A few very frequent words per Latin-script language
+STOPWORDS: Dict[str, set] = {
+    "en": {"the", "and", "of", "to", "in", "is", "that", "for", "with", "on"},
+    "fr": {"le", "la", "les", "et", "des", "est", "une", "dans", "pour", "que"},
+    "de": {"der", "die", "und", "das", "ist", "nicht", "mit", "ein", "eine", "den"},
+    "es": {"el", "la", "los", "las", "y", "que", "en", "del", "una", "por"},
+    "it": {"il", "la", "che", "di", "e", "per", "una", "non", "sono", "del"},
+    "pt": {"o", "a", "os", "que", "e", "do", "da", "em", "um", "uma"},
+    "nl": {"de", "het", "een", "en", "van", "is", "dat", "niet", "met", "op"},
+}
+
+# Characters of a script needed before it counts as present
+MIN_SCRIPT_CHARS = 20
+_WORD = re.compile(r"[^\W\d_]+")
+
+
+def script_counts(text: str) -> Counter:
+    """Number of letters of each script in ``text``"""
+    counts = Counter()
+    for ch in text:
+        code = ord(ch)
+        if code < 0x41:
+            continue
+        for script, first, last in SCRIPT_RANGES:
+            if first <= code <= last:
+                counts[script] += 1
+                break
+    return counts
+
+
+def _latin_language(text: str, candidates: Iterable[str]) -> Optional[str]:
+    """Configured Latin-script language whose stopwords occur most, if any"""
+    words = Counter(word.lower() for word in _WORD.findall(text))
+    scores = {lang: sum(words[word] for word in STOPWORDS.get(lang, ())) for lang in candidates}
+    best = max(scores, key=scores.get, default=None)
+    return best if best and scores[best] else None
+
+
+def choose_languages(text: str, available: List[str], default: Optional[List[str]] = None) -> Optional[List[str]]:
+    """
+    Smallest EasyOCR language list for ``text`` from the ``available`` ones
+
+    The dominant script decides the reader; English is added because it
+    combines with every script and covers digits and Latin fragments.
+
+    Returns:
+        Sorted language codes, or ``default`` when the text shows no usable signal
+    """
+    counts = script_counts(text)
+    if "Kana" in counts and "Han" in counts:
+        # Japanese mixes kanji with kana
+        counts["Kana"] += counts.pop("Han")
+    present = [(count, script) for script, count in counts.items() if count >= MIN_SCRIPT_CHARS]
+    for _, script in sorted(present, reverse=True):
+        candidates = [lang for lang in available if LANGUAGE_SCRIPTS.get(lang) == script]
+        if script == "Han" and not candidates:
+            candidates = [lang for lang in available if lang == "ja"]
+        if not candidates:
+            continue
+        if script == "Latin":
+            chosen = _latin_language(text, candidates) or ("en" if "en" in candidates else candidates[0])
+        else:
+            # Scripts with several configured languages (e.g. ch_sim/ch_tra) keep the first
+            chosen = candidates[0]
+        languages = {chosen}
+        if "en" in available:
+            languages.add("en")
+        return sorted(languages)
+    return default
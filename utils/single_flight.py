@@ -0,0 +1,77 @@
+"""
+Single-flight coalescing of identical concurrent work
+
+When several sessions ask for the same thing at the same time (the same
+shared PDF uploaded by a whole team, the same question about it), only the
+first caller runs the work; the others wait for it and share its result.
+Nothing is cached: once the call finishes, the next caller with that key
+runs it again.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its result with concurrent callers"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._counters = {"calls": 0, "shared": 0}
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Run ``fn(*args, **kwargs)`` unless a call with the same key is in flight
+
+        Returns:
+            (result, shared): shared is True when the result came from
+            another caller's call. Exceptions are shared the same way,
+            except ones that interrupt the caller's call rather than fail
+            it (a BaseException that is not an Exception, e.g. its session
+            stopping): those stay with that caller, and the waiting callers
+            run the call again.
+        """
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._calls[key] = future
+                    self._counters["calls"] += 1
+                else:
+                    self._counters["shared"] += 1
+            if leader:
+                break
+            try:
+                return future.result(), True
+            except BaseException as e:
+                if isinstance(e, Exception) or not (future.done() and future.exception() is e):
+                    raise
+                # The caller we were waiting on was interrupted; run the call ourselves
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result, False
+
+    def _finish(self, key: Hashable):
+        # Callers arriving from now on start a fresh call
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def metrics(self) -> Dict:
+        """Calls run, calls answered from another caller's call, and calls in flight"""
+        with self._lock:
+            return {"in_flight": len(self._calls), **self._counters}
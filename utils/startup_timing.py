@@ -0,0 +1,121 @@
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+_records: List[Dict] = []
+_lock = threading.Lock()
+
+
+def record(name: str, kind: str, seconds: float, **extra) -> None:
+    """
+    Record a startup cost entry
+
+    Args:
+        name: Module or component name
+        kind: Either "import" or "init"
+        seconds: Wall time spent
+        extra: Additional fields to keep with the entry
+    """
+    entry = {"name": name, "kind": kind, "seconds": seconds}
+    entry.update(extra)
+    with _lock:
+        _records.append(entry)
+
+
+@contextmanager
+def timed(name: str, kind: str = "init"):
+    """Context manager that records the wall time of its body"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, kind, time.perf_counter() - start)
+
+
+def import_module_timed(module_name: str):
+    """
+    Import a module and record how long it took
+
+    The entry also lists the top-level packages that were loaded for the
+    first time by this import, which is where the cost usually comes from
+    (faiss, easyocr/torch, fitz, openai).
+    """
+    already_loaded = module_name in sys.modules
+    before = {name.split(".")[0] for name in sys.modules}
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - start
+    if not already_loaded:
+        after = {name.split(".")[0] for name in sys.modules}
+        stdlib = getattr(sys, "stdlib_module_names", ())
+        new_packages = sorted(
+            name for name in after - before
+            if name not in stdlib and not name.startswith("_")
+        )
+        record(module_name, "import", elapsed, new_packages=new_packages)
+    return module
+
+
+def get_report() -> List[Dict]:
+    """Return a copy of all recorded entries, slowest first"""
+    with _lock:
+        entries = [dict(entry) for entry in _records]
+    return sorted(entries, key=lambda entry: entry["seconds"], reverse=True)
+
+
+def reset() -> None:
+    """Forget all recorded entries"""
+    with _lock:
+        _records.clear()
+
+
+def format_report(entries: List[Dict] = None) -> str:
+    """Format recorded entries as a plain-text table"""
+    entries = get_report() if entries is None else entries
+    lines = [f"{'kind':<8}{'seconds':>10}  name"]
+    for entry in entries:
+        line = f"{entry['kind']:<8}{entry['seconds']:>10.3f}  {entry['name']}"
+        if entry.get("new_packages"):
+            line += f"  (loaded: {', '.join(entry['new_packages'])})"
+        lines.append(line)
+    total = sum(entry["seconds"] for entry in entries)
+    lines.append(f"{'total':<8}{total:>10.3f}")
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    """Report import and init cost of the controller and, optionally, each stage"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Startup timing report")
+    parser.add_argument(
+        "--stages",
+        nargs="*",
+        default=[],
+        help="Agent stages to load after import (e.g. pdf_parser ocr_agent), or 'all'",
+    )
+    args = parser.parse_args(argv)
+
+    main_controller = import_module_timed("main_controller")
+    with timed("PDFProcessor", "init"):
+        processor = main_controller.PDFProcessor()
+
+    stages = list(main_controller.AGENT_MODULES) if "all" in args.stages else args.stages
+    for stage in stages:
+        try:
+            getattr(processor, stage)
+        except Exception as e:
+            print(f"Failed to load stage {stage}: {e}", file=sys.stderr)
+
+    print(format_report())
+    return 0
+
+
+if __name__ == "__main__":
+    # Run through the package module so the controller and this report share
+    # one registry (under ``-m`` this file is also loaded as ``__main__``).
+    from utils.startup_timing import main as _main
+    sys.exit(_main())
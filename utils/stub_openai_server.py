@@ -0,0 +1,271 @@
+"""
+OpenAI-compatible stand-in server for offline benchmarking and load tests
+
+Serves ``/v1/embeddings`` and ``/v1/chat/completions`` (including streaming)
+with deterministic output, simulated latency and optional rate limiting.
+Point the app at it with ``OPENAI_BASE_URL=http://127.0.0.1:8008/v1``.
+
+    python -m utils.stub_openai_server --port 8008 --latency-ms 200 --rpm 600
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from utils.request_scheduler import TokenBucket, estimate_tokens
+
+
+def fake_embedding(text: str, dimension: int) -> List[float]:
+    """
+    Deterministic embedding by feature-hashing the words of ``text``
+
+    Texts that share words get similar vectors, so retrieval against the
+    stand-in still behaves like retrieval, only without a model.
+    """
+    vector = [0.0] * dimension
+    for word in text.lower().split():
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimension
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[bucket] += sign
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def fake_completion(messages: List[Dict], max_tokens: int) -> str:
+    """Deterministic completion echoing words from the last user message"""
+    prompt = next(
+        (message.get("content", "") for message in reversed(messages) if message.get("role") == "user"),
+        "",
+    )
+    words = prompt.split()
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    # Roughly one token per word
+    length = max(1, min(max_tokens, 64))
+    if words:
+        start = int(digest, 16) % len(words)
+        body = [words[(start + i) % len(words)] for i in range(length)]
+    else:
+        body = ["empty"] * length
+    return f"[stub {digest}] " + " ".join(body)
+
+
+class StubSettings:
+    """Latency, throughput and rate-limit characteristics of the stand-in"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        tokens_per_second: float = 0.0,
+        embedding_dimension: int = 3072,
+        requests_per_minute: float = 0.0,
+    ):
+        self.latency = latency_ms / 1000.0
+        self.tokens_per_second = tokens_per_second
+        self.embedding_dimension = embedding_dimension
+        self.bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+
+    def admit(self) -> Optional[float]:
+        """Return None if the request may proceed, else seconds to retry after"""
+        with self.lock:
+            self.requests += 1
+            if self.bucket is None:
+                return None
+            wait = self.bucket.wait_time(1, time.monotonic())
+            if wait > 0:
+                self.rate_limited += 1
+                return wait
+            self.bucket.consume(1)
+            return None
+
+    def generation_delay(self, tokens: int) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return tokens / self.tokens_per_second
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the subset of the OpenAI API the app uses"""
+
+    settings: StubSettings = StubSettings()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict, headers: Dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        retry_after = self.settings.admit()
+        if retry_after is not None:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": f"{retry_after:.3f}", "retry-after-ms": str(int(retry_after * 1000))},
+            )
+            return
+        try:
+            request = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+            return
+
+        if self.settings.latency:
+            time.sleep(self.settings.latency)
+
+        path = self.path.rstrip("/")
+        if path.endswith("/embeddings"):
+            self._embeddings(request)
+        elif path.endswith("/chat/completions"):
+            self._chat_completions(request)
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def _embeddings(self, request: Dict):
+        inputs = request.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimension = int(request.get("dimensions") or self.settings.embedding_dimension)
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimension)}
+            for i, text in enumerate(inputs)
+        ]
+        tokens = sum(estimate_tokens(text) for text in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "stub"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _chat_completions(self, request: Dict):
+        messages = request.get("messages", [])
+        max_tokens = int(request.get("max_tokens") or 256)
+        text = fake_completion(messages, max_tokens)
+        words = text.split(" ")
+        created = int(time.time())
+        completion_id = "chatcmpl-" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:24]
+        model = request.get("model", "stub")
+        prompt_tokens = sum(estimate_tokens(message.get("content", "")) for message in messages)
+
+        if not request.get("stream"):
+            time.sleep(self.settings.generation_delay(len(words)))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(words),
+                    "total_tokens": prompt_tokens + len(words),
+                },
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        per_token = self.settings.generation_delay(1)
+        for i, word in enumerate(words):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": word if i == 0 else " " + word},
+                    "finish_reason": None,
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if per_token:
+                time.sleep(per_token)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, settings: StubSettings = None) -> ThreadingHTTPServer:
+    """
+    Start the stand-in server on a background thread
+
+    Returns the server; its base URL is ``http://{host}:{server.server_port}/v1``.
+    Call ``server.shutdown()`` to stop it.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"settings": settings or StubSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="stub-openai-server", daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv: List[str] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed latency added to every request")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Simulated generation speed (0 = instant)")
+    parser.add_argument("--embedding-dim", type=int, default=3072)
+    parser.add_argument("--rpm", type=float, default=0.0, help="Requests per minute before answering 429 (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    settings = StubSettings(args.latency_ms, args.tokens_per_second, args.embedding_dim, args.rpm)
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"Stub OpenAI server listening on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
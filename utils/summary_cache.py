@@ -0,0 +1,122 @@
+"""
+Persisted document summaries
+
+Summaries are stored under ``SUMMARY_CACHE_DIR/<doc_hash>/`` as JSON, keyed
+by the document hash, the summarizer settings that shape the output
+(length, prompt version, limits) and the model id. The downloadable
+artifacts are written next to them, so repeat requests and downloads never
+reach the LLM. Re-indexing a document drops its directory.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from config import SUMMARY_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Download formats: file suffix and MIME type
+FORMATS = {
+    "md": ("md", "text/markdown"),
+    "txt": ("txt", "text/plain"),
+}
+
+
+def cache_key(doc_hash: str, config: Dict, model_id: str) -> str:
+    """Stable key for a (document, summarizer config, model) combination"""
+    payload = json.dumps({"doc": doc_hash, "config": config, "model": model_id}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def to_plain_text(markdown: str) -> str:
+    """Strip the markdown markup summaries are formatted with"""
+    text = re.sub(r"^\s{0,3}#{1,6}\s*", "", markdown, flags=re.MULTILINE)
+    text = re.sub(r"(\*\*|__)(.*?)\1", r"\2", text)
+    return re.sub(r"^(\s*)[*+]\s+", r"\1- ", text, flags=re.MULTILINE)
+
+
+def _write_atomic(path: Path, data: str):
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class SummaryCache:
+    """Summaries and their download artifacts on disk, per document"""
+
+    def __init__(self, root: Path = SUMMARY_CACHE_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, doc_hash: str, key: str) -> Path:
+        return self.root / doc_hash / f"{key}.json"
+
+    def get(self, doc_hash: str, config: Dict, model_id: str) -> Optional[str]:
+        """Cached summary, or None"""
+        path = self._entry_path(doc_hash, cache_key(doc_hash, config, model_id))
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)["summary"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable summary cache entry {path}: {e}")
+            return None
+
+    def put(self, doc_hash: str, config: Dict, model_id: str, summary: str):
+        """Store a summary"""
+        key = cache_key(doc_hash, config, model_id)
+        path = self._entry_path(doc_hash, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"doc_hash": doc_hash, "config": config, "model": model_id, "created": time.time(), "summary": summary}
+        _write_atomic(path, json.dumps(entry))
+
+    def artifact(self, doc_hash: str, config: Dict, model_id: str, fmt: str = "md") -> Optional[Path]:
+        """
+        Downloadable file for a cached summary, written on first request
+
+        Returns:
+            Path of the artifact, or None if the summary is not cached
+        """
+        suffix, _ = FORMATS[fmt]
+        key = cache_key(doc_hash, config, model_id)
+        path = self.root / doc_hash / f"{key}.{suffix}"
+        if path.exists():
+            return path
+        summary = self.get(doc_hash, config, model_id)
+        if summary is None:
+            return None
+        _write_atomic(path, summary if fmt == "md" else to_plain_text(summary))
+        return path
+
+    def entries(self, doc_hash: str) -> List[Dict]:
+        """All cached summaries of a document as {"config", "model", "summary"} dicts"""
+        entries = []
+        for path in sorted((self.root / doc_hash).glob("*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+                entries.append({"config": entry["config"], "model": entry["model"], "summary": entry["summary"]})
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable summary cache entry {path}: {e}")
+        return entries
+
+    def invalidate(self, doc_hash: str):
+        """Drop every summary and artifact of a document"""
+        shutil.rmtree(self.root / doc_hash, ignore_errors=True)
+
+    def clear(self):
+        """Drop all cached summaries"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True, exist_ok=True)